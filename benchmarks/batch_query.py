@@ -0,0 +1,141 @@
+"""
+Batch query throughput: N independent workflow runs vs. one BatchRunner batch.
+
+Both sides use the same offline stand-ins (benchmarks/fakes.py): in-memory
+Qdrant, a fake Neo4j with a fixed round-trip latency and the mock Ray Serve
+deployment with its batching cost model. "independent" runs the LangGraph
+workflow once per query, `--concurrency` at a time, the way N separate
+POST /query calls would; "batch" hands the same queries to the batch runner
+behind POST /query/batch.
+
+    PYTHONPATH=. python benchmarks/batch_query.py --queries 512
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import warnings
+from unittest.mock import patch
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_DEBUG_FILE", "false")
+warnings.filterwarnings("ignore", message="Local mode performs exact")
+
+import httpx  # noqa: E402
+from qdrant_client import AsyncQdrantClient  # noqa: E402
+
+from benchmarks.fakes import (  # noqa: E402
+    FakeNeo4jDriver,
+    build_collection,
+    llm_transport,
+    passage,
+)
+from src.agents.batch import BatchItem, BatchRunner  # noqa: E402
+from src.agents.plan_classifier import plan_cache  # noqa: E402
+from src.agents.workflow import app as workflow  # noqa: E402
+from src.cache.answer_cache import answer_cache  # noqa: E402
+from src.embeddings.embedders import HashingEmbedder  # noqa: E402
+from src.embeddings.service import EmbeddingService  # noqa: E402
+from src.llm.client import _pool  # noqa: E402
+from src.llm.prefix_cache import PrefixCache  # noqa: E402
+from src.llm.serve import MockEngine  # noqa: E402
+from src.retrieval.graph import GraphRetriever  # noqa: E402
+from src.retrieval.subgraph import SubgraphCache  # noqa: E402
+from src.retrieval.vector import VectorRetriever  # noqa: E402
+
+
+def _queries(total: int, seed: int):
+    rng = random.Random(seed)
+    queries = []
+    for i in range(total):
+        query = f"{passage(rng, 8)[:-1]} {i}?"
+        plan_cache.put(query, rng.choice(["vector", "graph", "hybrid"]))
+        queries.append(query)
+    return queries
+
+
+async def _independent(queries, concurrency: int):
+    pending = iter(queries)
+
+    async def worker():
+        for query in pending:
+            await workflow.ainvoke(
+                {"query": query, "vector_results": [], "graph_results": []}
+            )
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def _batch(queries, runner: BatchRunner):
+    results = [r async for r in runner.run([BatchItem(q) for q in queries])]
+    assert all(r["status"] == "ok" for r in results), results[:3]
+
+
+async def run(args) -> dict:
+    embedder = HashingEmbedder(dim=128)
+    qdrant = AsyncQdrantClient(location=":memory:")
+    await build_collection(qdrant, "bench", embedder, 2000, 64)
+    engine = MockEngine(
+        batch_overhead_s=args.llm_overhead_ms / 1000,
+        per_prompt_s=args.llm_per_prompt_ms / 1000,
+        prefix_cache=PrefixCache(),
+    )
+    llm = httpx.AsyncClient(
+        transport=llm_transport(engine, max_batch_size=args.llm_batch_size)
+    )
+    driver = FakeNeo4jDriver(latency_s=args.neo4j_latency_ms / 1000)
+    runner = BatchRunner(chunk_size=args.chunk_size)
+
+    results = {}
+    with patch(
+        "src.embeddings.service._service", EmbeddingService(embedder)
+    ), patch.object(_pool, "async_client", return_value=llm), patch.object(
+        answer_cache, "max_size", 0
+    ), patch(
+        "src.agents.vector_search.vector_retriever",
+        VectorRetriever(client=qdrant, collection_name="bench"),
+    ):
+        for mode in ("independent", "batch"):
+            # Fresh graph cache so neither side profits from the other's run
+            graph = GraphRetriever(driver=driver, cache=SubgraphCache())
+            with patch("src.agents.graph_search.graph_retriever", graph):
+                queries = _queries(args.queries, seed=len(results))
+                driver.queries = 0
+                start = time.perf_counter()
+                if mode == "batch":
+                    await _batch(queries, runner)
+                else:
+                    await _independent(queries, args.concurrency)
+                elapsed = time.perf_counter() - start
+            results[mode] = {
+                "qps": args.queries / elapsed,
+                "elapsed_s": elapsed,
+                "neo4j_queries": driver.queries,
+            }
+
+    await llm.aclose()
+    await qdrant.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--queries", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--neo4j-latency-ms", type=float, default=5.0)
+    parser.add_argument("--llm-overhead-ms", type=float, default=20.0)
+    parser.add_argument("--llm-per-prompt-ms", type=float, default=0.5)
+    parser.add_argument("--llm-batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    for mode, stats in results.items():
+        print(
+            f"{mode:>11}: {stats['qps']:8.1f} queries/s | {stats['elapsed_s']:6.2f}s | "
+            f"Neo4j round trips {stats['neo4j_queries']}"
+        )
+    speedup = results["batch"]["qps"] / results["independent"]["qps"]
+    print(f"batch speedup: {speedup:.1f}x")
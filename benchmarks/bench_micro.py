@@ -0,0 +1,78 @@
+"""
+pytest-benchmark microbenchmarks for CPU-bound steps on the query and ingest paths.
+
+Not collected by the test suite (the file name does not match test_*.py); run
+them explicitly:
+
+    PYTHONPATH=. pytest benchmarks/bench_micro.py
+    PYTHONPATH=. pytest benchmarks/bench_micro.py --benchmark-autosave
+    PYTHONPATH=. pytest benchmarks/bench_micro.py --benchmark-compare \\
+        --benchmark-compare-fail=median:20%
+
+The last form fails when a benchmark's median is 20% slower than the most
+recent saved run (stored under .benchmarks/).
+"""
+
+import asyncio
+import random
+
+import pytest
+
+from benchmarks.fakes import passage
+from src.agents.plan_classifier import classifier, plan_cache
+from src.agents.planner import planner_node
+from src.agents.synthesizer import build_synthesis_prompt
+from src.ingestion.chunking import TokenChunker
+from src.llm.prompts import SYNTHESIS_SYSTEM_PROMPT, render
+
+pytest.importorskip("pytest_benchmark")
+
+QUERY = "Which vendors did Alice approve for the Q3 security audit project?"
+
+
+@pytest.fixture(scope="module")
+def document():
+    rng = random.Random(0)
+    return " ".join(passage(rng, rng.randint(8, 30)) for _ in range(2000))
+
+
+@pytest.mark.parametrize("max_tokens", [128, 512])
+def test_chunker(benchmark, document, max_tokens):
+    chunker = TokenChunker(max_tokens=max_tokens, overlap_tokens=max_tokens // 8)
+    chunks = benchmark(chunker.chunk, document)
+    assert chunks
+
+
+def test_plan_classifier(benchmark):
+    decision = benchmark(classifier.classify, QUERY)
+    assert decision.plan in ("vector", "graph", "hybrid")
+
+
+def test_planner_node_cache_miss(benchmark, monkeypatch):
+    # High-confidence decisions only, so no LLM round trip is involved
+    monkeypatch.setenv("PLANNER_CONFIDENCE_THRESHOLD", "0")
+    loop = asyncio.new_event_loop()
+
+    def plan():
+        plan_cache.clear()
+        return loop.run_until_complete(planner_node({"query": QUERY}))
+
+    try:
+        assert benchmark(plan)["plan"]
+    finally:
+        loop.close()
+        plan_cache.clear()
+
+
+@pytest.mark.parametrize("evidence", [5, 40])
+def test_synthesis_prompt(benchmark, evidence):
+    rng = random.Random(0)
+    state = {
+        "query": QUERY,
+        "context": [f"[vector] {passage(rng, 60)}" for _ in range(evidence)],
+    }
+
+    def build():
+        return render(build_synthesis_prompt(state), SYNTHESIS_SYSTEM_PROMPT)
+
+    assert benchmark(build).startswith(SYNTHESIS_SYSTEM_PROMPT)
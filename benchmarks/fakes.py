@@ -0,0 +1,234 @@
+"""
+Offline stand-ins for the services behind /query, shared by the benchmarks.
+
+  FakeNeo4jDriver   answers the GraphRetriever templates from a synthetic graph
+                    after a configurable round-trip latency
+  llm_transport     routes LLMClient calls, single and batch, into the mock Ray
+                    Serve deployment (MockEngine cost model, prefix cache and
+                    dynamic batching)
+  build_collection  fills an in-memory Qdrant collection with synthetic passages
+
+Everything is deterministic for a given seed, so runs are comparable.
+"""
+
+import json
+import random
+import time
+import zlib
+from collections import deque
+from typing import Dict, List
+
+import httpx
+from qdrant_client import AsyncQdrantClient, models
+
+from src.llm.prefix_cache import PrefixCache
+from src.llm.serve import MockEngine, VLLMDeployment
+from src.retrieval.graph import TEMPLATES
+from src.retrieval.vector import ensure_collection
+
+VOCABULARY = (
+    "alice bob carol dave erin frank grace heidi ivan judy mallory oscar peggy "
+    "audit budget compliance contract vendor invoice policy roadmap project "
+    "security incident release migration datacenter payroll hiring quarterly "
+    "report review approval risk customer supplier merger license renewal"
+).split()
+
+_TEMPLATE_NAMES = {cypher: name for name, cypher in TEMPLATES.items()}
+
+
+class _Result:
+    def __init__(self, rows: List[Dict]):
+        self._rows = rows
+
+    def data(self) -> List[Dict]:
+        return self._rows
+
+
+class _Session:
+    def __init__(self, driver: "FakeNeo4jDriver"):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, cypher: str, params: Dict = None, **kwargs) -> _Result:
+        return self.driver.query(cypher, {**(params or {}), **kwargs})
+
+    def execute_read(self, work):
+        return work(self)
+
+    execute_write = execute_read
+
+
+class FakeNeo4jDriver:
+    """
+    Sync driver double over a random graph of `entities` nodes with `degree`
+    relations each. Every query sleeps `latency_s` first, like a network round
+    trip; the retriever runs it in a worker thread, as with the real driver.
+    """
+
+    RELATIONS = ("WORKS_ON", "OWNS", "REPORTS_TO", "MENTIONS", "DEPENDS_ON")
+
+    def __init__(
+        self, latency_s: float = 0.005, entities: int = 500, degree: int = 3, seed=0
+    ):
+        self.latency_s = latency_s
+        self.entities = entities
+        rng = random.Random(seed)
+        self.adjacency: Dict[str, List[tuple]] = {
+            self.key(i): [] for i in range(entities)
+        }
+        for i in range(entities):
+            for _ in range(degree):
+                j = rng.randrange(entities)
+                rel = rng.choice(self.RELATIONS)
+                self.adjacency[self.key(i)].append((rel, self.key(j), True))
+                self.adjacency[self.key(j)].append((rel, self.key(i), False))
+        self.queries = 0
+
+    @staticmethod
+    def key(i: int) -> str:
+        return f"e{i}"
+
+    @staticmethod
+    def name(key: str) -> str:
+        return f"Entity {key[1:]}"
+
+    def verify_connectivity(self):
+        pass
+
+    def session(self, database: str = None) -> _Session:
+        return _Session(self)
+
+    def close(self):
+        pass
+
+    def _seeds(self, search: str, limit: int) -> List[str]:
+        words = [w for w in search.lower().split() if w.isalpha()]
+        keys = [self.key(zlib.crc32(w.encode()) % self.entities) for w in words]
+        return list(dict.fromkeys(keys))[:limit]
+
+    def _edges(self, seed: str, hops: int, limit: int) -> List[Dict]:
+        rows, seen, frontier = [], {seed}, deque([(seed, 0)])
+        while frontier and len(rows) < limit:
+            node, depth = frontier.popleft()
+            if depth == hops:
+                continue
+            for rel, other, outgoing in self.adjacency[node]:
+                src, dst = (node, other) if outgoing else (other, node)
+                rows.append(
+                    {
+                        "src_key": src,
+                        "src": self.name(src),
+                        "rel": rel,
+                        "dst_key": dst,
+                        "dst": self.name(dst),
+                    }
+                )
+                if other not in seen:
+                    seen.add(other)
+                    frontier.append((other, depth + 1))
+        return rows[:limit]
+
+    def _neighborhood(self, search: str, hops: int, params: Dict, limit: int):
+        rows = []
+        for rank, seed in enumerate(self._seeds(search, params["seeds"])):
+            for edge in self._edges(seed, hops, limit):
+                rows.append({"seed": seed, "score": 1.0 / (rank + 1), **edge})
+        return rows[:limit]
+
+    def query(self, cypher: str, params: Dict) -> _Result:
+        self.queries += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        template = _TEMPLATE_NAMES.get(cypher, "")
+        limit = params.get("limit", 10)
+        if template.startswith("neighborhood_batch_"):
+            hops = int(template.rsplit("_", 1)[1])
+            rows = []
+            for item in params["searches"]:
+                for row in self._neighborhood(item["search"], hops, params, limit):
+                    rows.append({"i": item["i"], **row})
+            return _Result(rows)
+        if template.startswith("neighborhood_"):
+            hops = int(template.rsplit("_", 1)[1])
+            return _Result(self._neighborhood(params["search"], hops, params, limit))
+        if template.startswith("subgraph_"):
+            hops = int(template.rsplit("_", 1)[1])
+            rows = self._edges(params["key"], hops, limit)
+            return _Result([{"paths": len(rows), **row} for row in rows])
+        if template == "entity_search":
+            keys = self._seeds(params["search"], limit)
+            return _Result(
+                [
+                    {"key": k, "name": self.name(k), "label": "Entity", "score": 1.0}
+                    for k in keys
+                ]
+            )
+        # relations_of, shortest_path_* and schema statements
+        return _Result([])
+
+
+def llm_transport(
+    engine: MockEngine = None,
+    max_batch_size: int = None,
+    max_wait_s: float = None,
+) -> httpx.MockTransport:
+    """
+    httpx transport serving /generate from an in-process VLLMDeployment, so
+    LLMClient calls go through the real batching and prefix-cache code paths.
+    """
+    deployment = VLLMDeployment.func_or_class(
+        engine=engine or MockEngine(prefix_cache=PrefixCache()),
+        max_batch_size=max_batch_size,
+        max_wait_s=max_wait_s,
+    )
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        if request.url.path.endswith("/generate_batch"):
+            texts = await deployment.generate_many(
+                body["prompts"], body.get("system_prompt")
+            )
+            return httpx.Response(200, json={"texts": texts})
+        text = await deployment.generate(body["prompt"], body.get("system_prompt"))
+        return httpx.Response(200, json={"text": text})
+
+    transport = httpx.MockTransport(handler)
+    transport.deployment = deployment
+    return transport
+
+
+def passage(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)) + "."
+
+
+async def build_collection(
+    client: AsyncQdrantClient,
+    name: str,
+    embedder,
+    points: int,
+    words: int,
+    seed: int = 0,
+):
+    """
+    Creates `name` with `points` synthetic passages of `words` words each.
+    """
+    rng = random.Random(seed)
+    await ensure_collection(client, name, embedder.dim, indexes={})
+    texts = [passage(rng, words) for _ in range(points)]
+    vectors = embedder.encode(texts)
+    await client.upsert(
+        collection_name=name,
+        points=[
+            models.PointStruct(
+                id=i,
+                vector=vectors[i].tolist(),
+                payload={"doc_id": f"doc-{i // 8}", "chunk_index": i % 8, "text": text},
+            )
+            for i, text in enumerate(texts)
+        ],
+    )
@@ -0,0 +1,144 @@
+"""
+Import-time budget check for the modules on the cold-start path.
+
+Each module is imported in a fresh interpreter under `python -X importtime`,
+from an empty working directory. The check fails if any of these happen:
+
+- the import's cumulative time (best of --repeat) exceeds its budget;
+- the import pulls in a module it must leave to first use (LangGraph and the
+  Qdrant and Neo4j clients are loaded by the API lifespan);
+- the import creates files, such as the logs/ directory.
+
+The script exits with status 1 on any failure.
+
+    PYTHONPATH=. python benchmarks/import_time.py
+    PYTHONPATH=. python benchmarks/import_time.py --top 15
+    PYTHONPATH=. python benchmarks/import_time.py --budget src.api.main=800
+
+Budgets are wall-clock milliseconds with headroom for slower CI machines;
+tighten them with --budget when measuring on a known box.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time budgets, in milliseconds
+BUDGETS_MS = {
+    "src.api.main": 1200,
+    "src.utils.logger": 150,
+    "src.llm.client": 400,
+    "src.agents.batch": 900,
+    "src.ingestion.pipeline": 700,
+}
+
+# Loaded on first use (or by the lifespan), never as a side effect of importing
+LAZY = ("langgraph", "qdrant_client", "neo4j")
+FORBIDDEN = {
+    "src.api.main": LAZY,
+    "src.utils.logger": LAZY + ("numpy",),
+    "src.llm.client": LAZY,
+    "src.agents.batch": LAZY,
+    "src.ingestion.pipeline": LAZY,
+}
+
+_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def measure(module: str) -> dict:
+    """
+    Imports `module` in a fresh interpreter; returns its cumulative time, the
+    cumulative time of every module it loaded and the files it created.
+    """
+    with tempfile.TemporaryDirectory() as cwd:
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=cwd,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        created = sorted(os.listdir(cwd))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+
+    # Lines come in completion order, so a module's imports precede it
+    loaded, pending = {}, {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        cumulative_us, indent, name = match.groups()
+        pending[name] = int(cumulative_us) / 1000
+        if not indent:
+            if name == module:
+                loaded = pending
+            pending = {}
+    return {"ms": loaded.pop(module), "loaded": loaded, "created": created}
+
+
+def check(module: str, budget_ms: float, repeat: int) -> dict:
+    runs = [measure(module) for _ in range(repeat)]
+    best = min(runs, key=lambda run: run["ms"])
+    failures = []
+    if best["ms"] > budget_ms:
+        failures.append(f"{best['ms']:.0f}ms exceeds the {budget_ms:.0f}ms budget")
+    heavy = [name for name in FORBIDDEN.get(module, ()) if name in best["loaded"]]
+    if heavy:
+        failures.append(f"imports {', '.join(heavy)}")
+    if best["created"]:
+        failures.append(f"creates {', '.join(best['created'])}")
+    return {**best, "failures": failures}
+
+
+def _budget(value: str):
+    module, _, ms = value.partition("=")
+    return module, float(ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "modules", nargs="*", help=f"modules to check (default: {list(BUDGETS_MS)})"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--top", type=int, default=0, help="also list the N slowest imports"
+    )
+    parser.add_argument(
+        "--budget",
+        type=_budget,
+        action="append",
+        default=[],
+        metavar="MODULE=MS",
+        help="override a budget (repeatable)",
+    )
+    args = parser.parse_args()
+
+    budgets = {**BUDGETS_MS, **dict(args.budget)}
+    failed = False
+    for module in args.modules or list(BUDGETS_MS):
+        result = check(module, budgets.get(module, float("inf")), args.repeat)
+        status = "FAIL" if result["failures"] else "ok"
+        print(
+            f"{module:<26} {result['ms']:7.1f} ms "
+            f"(budget {budgets.get(module, float('inf')):.0f}) {status}"
+        )
+        for failure in result["failures"]:
+            print(f"    {failure}")
+        if args.top:
+            slowest = sorted(
+                result["loaded"].items(),
+                key=lambda item: item[1],
+                reverse=True,
+            )
+            for name, ms in slowest[: args.top]:
+                print(f"    {ms:7.1f} ms  {name}")
+        failed = failed or bool(result["failures"])
+    sys.exit(1 if failed else 0)
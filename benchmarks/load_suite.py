@@ -0,0 +1,293 @@
+"""
+Offline load test of POST /query through the real FastAPI app.
+
+The app runs in-process (httpx ASGI transport) against local stand-ins from
+benchmarks/fakes.py: an in-memory Qdrant collection, a fake Neo4j with
+configurable latency and the mock Ray Serve deployment. The sweep covers
+concurrency x plan mix x passage size; each run reports throughput, p50/p95/p99
+per stage (from the /metrics histograms) and memory.
+
+    PYTHONPATH=. python benchmarks/load_suite.py
+    PYTHONPATH=. python benchmarks/load_suite.py --concurrency 1,16,64 --mix mixed
+    PYTHONPATH=. python benchmarks/load_suite.py --compare benchmarks/baseline.json
+    PYTHONPATH=. python benchmarks/load_suite.py --save-baseline benchmarks/baseline.json
+
+--compare exits with status 1 when a run's throughput drops, or its end-to-end
+p95 grows, by more than --tolerance against the baseline. Baselines are only
+meaningful on the machine (and with the options) they were recorded with.
+
+Plan mixes are imposed through the plan cache, so the planner stage measures a
+cache hit; the answer cache is disabled so every request runs the workflow.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+import warnings
+from contextlib import ExitStack
+from unittest.mock import patch
+
+os.environ.setdefault("ENV", "development")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_DEBUG_FILE", "false")
+# Qdrant's local mode ignores HNSW search params and says so on every query
+warnings.filterwarnings("ignore", message="Local mode performs exact")
+
+import httpx  # noqa: E402
+from qdrant_client import AsyncQdrantClient  # noqa: E402
+
+from benchmarks.fakes import (  # noqa: E402
+    FakeNeo4jDriver,
+    build_collection,
+    llm_transport,
+    passage,
+)
+from src.agents.plan_classifier import plan_cache  # noqa: E402
+from src.api import main  # noqa: E402
+from src.cache.answer_cache import answer_cache  # noqa: E402
+from src.embeddings.embedders import HashingEmbedder  # noqa: E402
+from src.embeddings.service import EmbeddingService  # noqa: E402
+from src.llm.client import _pool  # noqa: E402
+from src.llm.prefix_cache import PrefixCache  # noqa: E402
+from src.llm.serve import MockEngine  # noqa: E402
+from src.retrieval.graph import GraphRetriever  # noqa: E402
+from src.retrieval.subgraph import SubgraphCache  # noqa: E402
+from src.retrieval.vector import VectorRetriever  # noqa: E402
+from src.utils.tracing import metrics  # noqa: E402
+
+PLAN_MIXES = {
+    "vector": {"vector": 1.0},
+    "graph": {"graph": 1.0},
+    "hybrid": {"hybrid": 1.0},
+    "mixed": {"vector": 0.3, "graph": 0.3, "hybrid": 0.4},
+}
+
+# Stages reported per run; http_request is the end-to-end latency
+STAGES = (
+    "http_request",
+    "planner",
+    "vector_search",
+    "graph_search",
+    "fusion",
+    "synthesizer",
+    "llm_http",
+)
+
+
+def _queries(total: int, mix: str, query_words: int, seed: int):
+    """
+    Unique queries with a plan drawn from `mix`, pre-seeded in the plan cache.
+    """
+    rng = random.Random(seed)
+    plans, weights = zip(*PLAN_MIXES[mix].items())
+    queries = []
+    for i in range(total):
+        query = f"{passage(rng, query_words)[:-1]} {i}?"
+        plan_cache.put(query, rng.choices(plans, weights)[0])
+        queries.append(query)
+    return queries
+
+
+async def _drive(client: httpx.AsyncClient, queries, concurrency: int) -> dict:
+    pending = iter(queries)
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for query in pending:
+            response = await client.post("/query", json={"query": query})
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"elapsed_s": time.perf_counter() - start, "errors": errors}
+
+
+def _rss_mb() -> float:
+    # Peak resident set size of the process so far (KiB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+async def run_suite(args) -> dict:
+    embedder = HashingEmbedder(dim=args.dim)
+    qdrant = AsyncQdrantClient(location=":memory:")
+    for words in args.payload_words:
+        await build_collection(
+            qdrant, f"bench_w{words}", embedder, args.points, words, args.seed
+        )
+
+    engine = MockEngine(
+        batch_overhead_s=args.llm_overhead_ms / 1000,
+        per_prompt_s=args.llm_per_prompt_ms / 1000,
+        prefill_s_per_token=args.llm_prefill_us_per_token / 1e6,
+        prefix_cache=PrefixCache(),
+    )
+    llm = httpx.AsyncClient(transport=llm_transport(engine))
+    driver = FakeNeo4jDriver(latency_s=args.neo4j_latency_ms / 1000, seed=args.seed)
+    app = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=main.app), base_url="http://bench"
+    )
+
+    runs = {}
+    with ExitStack() as stack:
+        stack.enter_context(
+            patch("src.embeddings.service._service", EmbeddingService(embedder))
+        )
+        stack.enter_context(patch.object(_pool, "async_client", return_value=llm))
+        stack.enter_context(patch.object(answer_cache, "max_size", 0))
+
+        for concurrency, mix, words in itertools.product(
+            args.concurrency, args.mix, args.payload_words
+        ):
+            name = f"c{concurrency}-{mix}-w{words}"
+            vector = VectorRetriever(client=qdrant, collection_name=f"bench_w{words}")
+            graph = GraphRetriever(driver=driver, cache=SubgraphCache())
+            with patch("src.agents.vector_search.vector_retriever", vector), patch(
+                "src.agents.graph_search.graph_retriever", graph
+            ):
+                plan_cache.clear()
+                warmup = _queries(min(concurrency, 8), mix, args.query_words, -1)
+                await _drive(app, warmup, concurrency)
+                queries = _queries(args.requests, mix, args.query_words, args.seed)
+
+                metrics.reset()
+                if args.trace_memory:
+                    tracemalloc.start()
+                result = await _drive(app, queries, concurrency)
+                if args.trace_memory:
+                    result["py_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+                    tracemalloc.stop()
+
+            snapshot = metrics.snapshot()
+            result.update(
+                rps=args.requests / result["elapsed_s"],
+                rss_peak_mb=_rss_mb(),
+                stages={s: snapshot[s] for s in STAGES if s in snapshot},
+            )
+            runs[name] = result
+            _print_run(name, result)
+
+    await app.aclose()
+    await llm.aclose()
+    await qdrant.close()
+    return runs
+
+
+def _print_run(name: str, result: dict):
+    e2e = result["stages"].get("http_request", {})
+    print(
+        f"{name:<22} {result['rps']:8.1f} req/s | "
+        f"p50 {e2e.get('p50_ms', 0):7.1f} p95 {e2e.get('p95_ms', 0):7.1f} "
+        f"p99 {e2e.get('p99_ms', 0):7.1f} ms | errors {result['errors']} | "
+        f"rss {result['rss_peak_mb']:.0f}MB"
+        + (f" py peak {result['py_peak_mb']:.1f}MB" if "py_peak_mb" in result else "")
+    )
+    for stage, stats in result["stages"].items():
+        if stage != "http_request":
+            print(
+                f"    {stage:<14} p50 {stats['p50_ms']:7.2f} p95 {stats['p95_ms']:7.2f}"
+                f" p99 {stats['p99_ms']:7.2f} ms  (n={stats['count']})"
+            )
+
+
+def compare(runs: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Runs that regressed against `baseline` by more than `tolerance`.
+    """
+    regressions = []
+    for name, result in runs.items():
+        base = baseline["runs"].get(name)
+        if base is None:
+            continue
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['rps']:.1f} < baseline {base['rps']:.1f} req/s"
+            )
+        p95 = result["stages"].get("http_request", {}).get("p95_ms", 0)
+        base_p95 = base["stages"].get("http_request", {}).get("p95_ms", 0)
+        if base_p95 and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 {p95:.1f} > baseline {base_p95:.1f} ms")
+    return regressions
+
+
+def _csv(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=_csv(int), default=[1, 8, 32])
+    parser.add_argument("--mix", type=_csv(str), default=["vector", "graph", "mixed"])
+    parser.add_argument("--payload-words", type=_csv(int), default=[32, 256])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--query-words", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--neo4j-latency-ms", type=float, default=5.0)
+    parser.add_argument("--llm-overhead-ms", type=float, default=10.0)
+    parser.add_argument("--llm-per-prompt-ms", type=float, default=1.0)
+    parser.add_argument("--llm-prefill-us-per-token", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="also report the Python heap peak per run (tracemalloc slows requests)",
+    )
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    unknown = set(args.mix) - set(PLAN_MIXES)
+    if unknown:
+        parser.error(
+            f"unknown plan mix {sorted(unknown)}; pick from {list(PLAN_MIXES)}"
+        )
+
+    runs = asyncio.run(run_suite(args))
+    report = {
+        "options": {
+            k: v
+            for k, v in vars(args).items()
+            if k not in ("save_baseline", "compare", "tolerance")
+        },
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "runs": runs,
+    }
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        # The sweep lists may differ (only runs present in both are compared)
+        changed = [
+            key
+            for key, value in report["options"].items()
+            if key not in ("concurrency", "mix", "payload_words")
+            and baseline["options"].get(key) != value
+        ]
+        if changed:
+            print(f"WARNING options differ from the baseline: {', '.join(changed)}")
+        regressions = compare(runs, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
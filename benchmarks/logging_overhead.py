@@ -0,0 +1,148 @@
+"""
+Microbenchmark of logging overhead per request on the calling thread.
+
+Replays the log calls one /query makes (about a dozen INFO lines across the
+middleware, planner, searchers and synthesizer, plus DEBUG detail) against:
+
+  sync   the original setup: console + three rotating files written inline,
+         messages built with f-strings
+  queue  the current setup: one bounded QueueHandler, lazy %-formatting; the
+         handlers run on the listener thread
+
+Output goes to a temporary directory (console output to /dev/null), so the
+numbers are the cost the event loop pays, not the terminal's.
+
+    PYTHONPATH=. python benchmarks/logging_overhead.py --requests 5000
+"""
+
+import argparse
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+from src.utils.logger import (
+    BoundedQueueHandler,
+    CorrelationIdFilter,
+    DebugSamplingFilter,
+    _ReportingListener,
+)
+
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] - %(message)s"
+
+
+def _handlers(log_dir: str, devnull):
+    formatter = logging.Formatter(FORMAT)
+    handlers = []
+    for level, target in (
+        (logging.INFO, None),
+        (logging.INFO, "app.log"),
+        (logging.ERROR, "error.log"),
+        (logging.DEBUG, "debug.log"),
+    ):
+        if target is None:
+            handler = logging.StreamHandler(devnull)
+        else:
+            handler = RotatingFileHandler(
+                os.path.join(log_dir, target), maxBytes=10 * 1024 * 1024, backupCount=1
+            )
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+        handlers.append(handler)
+    return handlers
+
+
+def _logger(name: str, *handlers) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = list(handlers)
+    logger.filters = [CorrelationIdFilter()]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def eager_request(logger: logging.Logger, i: int):
+    query = f"How is Alice related to Project {i}?"
+    logger.info(f"Processing request req-{i} - Path: /query")
+    logger.info(f"Received query: {query}")
+    logger.debug(f"Plan cache miss for {query!r}")
+    logger.info(
+        f"Planner: Decided on hybrid strategy (classifier) for query: '{query}'"
+    )
+    logger.info(f"Vector Search: Searching for '{query}'")
+    logger.info(f"Graph Search: Searching for '{query}'")
+    for hit in range(3):
+        logger.debug(f"Vector hit {hit}: score={0.9 - hit / 10:.3f}")
+    logger.info(f"Fusion: kept {5} of {7} passages, {412} tokens")
+    logger.info("Synthesizer: Generated Final Answer")
+    logger.info("Query processed successfully. Plan: hybrid")
+    logger.info(f"Completed request req-{i} - Duration: {0.0421:.4f}s - Status: 200")
+
+
+def lazy_request(logger: logging.Logger, i: int):
+    query = f"How is Alice related to Project {i}?"
+    logger.info("Processing request %s - Path: %s", f"req-{i}", "/query")
+    logger.info("Received query: %s", query)
+    logger.debug("Plan cache miss for %r", query)
+    logger.info(
+        "Planner: Decided on %s strategy (%s) for query: '%s'",
+        "hybrid",
+        "classifier",
+        query,
+    )
+    logger.info("Vector Search: Searching for '%s'", query)
+    logger.info("Graph Search: Searching for '%s'", query)
+    for hit in range(3):
+        logger.debug("Vector hit %d: score=%.3f", hit, 0.9 - hit / 10)
+    logger.info("Fusion: kept %d of %d passages, %d tokens", 5, 7, 412)
+    logger.info("Synthesizer: Generated Final Answer")
+    logger.info("Query processed successfully. Plan: %s", "hybrid")
+    logger.info(
+        "Completed request %s - Duration: %.4fs - Status: %s", f"req-{i}", 0.0421, 200
+    )
+
+
+def _time(fn, logger, requests: int) -> float:
+    start = time.perf_counter()
+    for i in range(requests):
+        fn(logger, i)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def run(requests: int, debug_sample_rate: float):
+    results = {}
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, "w") as devnull:
+        sync = _logger("bench.sync", *_handlers(log_dir, devnull))
+        results["sync, f-strings"] = _time(eager_request, sync, requests)
+
+        handler = BoundedQueueHandler(queue.Queue(maxsize=10000))
+        handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+        listener = _ReportingListener(handler, *_handlers(log_dir, devnull))
+        listener.start()
+        queued = _logger("bench.queue", handler)
+        results["queue, lazy"] = _time(lazy_request, queued, requests)
+        listener.stop()
+        results["queue dropped"] = handler.take_dropped()
+
+        # With DEBUG disabled, lazy calls return before formatting anything
+        for name, fn in (("f-strings", eager_request), ("lazy", lazy_request)):
+            quiet = _logger(f"bench.quiet.{name}", logging.NullHandler())
+            quiet.setLevel(logging.WARNING)
+            results[f"disabled, {name}"] = _time(fn, quiet, requests)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--debug-sample-rate", type=float, default=1.0)
+    args = parser.parse_args()
+
+    results = run(args.requests, args.debug_sample_rate)
+    dropped = results.pop("queue dropped")
+    print("setup            | us per request (caller thread)")
+    for name, us in results.items():
+        print(f"{name:<16} | {us:8.1f}")
+    print(f"records dropped by the bounded queue: {dropped}")
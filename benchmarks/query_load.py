@@ -0,0 +1,137 @@
+"""
+Load benchmark for POST /query: blocking vs. non-blocking workflow execution.
+
+Runs entirely offline: the app is served by uvicorn on a background thread and
+driven over real HTTP from the main thread. The Ray Serve LLM is replaced by a fake upstream with a fixed latency, so the
+numbers isolate how the API schedules work rather than model speed.
+
+    PYTHONPATH=. python benchmarks/query_load.py --concurrency 32 --requests 256
+
+"before" reproduces the original handler, which ran the workflow (and its two
+blocking LLM calls) synchronously on the event loop. "after" is the current app.
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import httpx
+import uvicorn
+
+os.environ.setdefault("ENV", "development")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from src.api import main  # noqa: E402
+from src.llm.client import _pool  # noqa: E402
+
+
+def _fake_llm_transport(latency_s: float) -> httpx.MockTransport:
+    async def handler(request):
+        await asyncio.sleep(latency_s)
+        return httpx.Response(200, json={"text": "hybrid"})
+
+    return httpx.MockTransport(handler)
+
+
+def _blocking_handler(latency_s: float):
+    """
+    The original /query behaviour: planner + synthesizer LLM calls made with a
+    blocking HTTP client from inside the async handler.
+    """
+
+    async def query_system(request: main.QueryRequest):
+        time.sleep(latency_s)  # planner
+        time.sleep(latency_s)  # synthesizer
+        return main.QueryResponse(answer="blocking", execution_plan="hybrid")
+
+    return query_system
+
+
+def _serve(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+async def _drive(base_url: str, concurrency: int, total: int) -> dict:
+    latencies = []
+    health_latencies = []
+    pending = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency + 1)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as c:
+
+        async def worker():
+            for i in pending:
+                start = time.perf_counter()
+                response = await c.post("/query", json={"query": f"q{i % 8}-{i}"})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        async def prober():
+            # /health must stay responsive while queries are in flight
+            while len(latencies) < total:
+                start = time.perf_counter()
+                await c.get("/health")
+                health_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        start = time.perf_counter()
+        await asyncio.gather(prober(), *(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    health_latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "health_p99_ms": health_latencies[int(len(health_latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def run(concurrency: int, total: int, latency_s: float, port: int) -> dict:
+    results = {}
+
+    blocking_app = main.FastAPI()
+    blocking_app.post("/query")(_blocking_handler(latency_s))
+    blocking_app.get("/health")(main.health_check)
+    server = _serve(blocking_app, port)
+    results["before"] = asyncio.run(
+        _drive(f"http://127.0.0.1:{port}", concurrency, total)
+    )
+    server.should_exit = True
+
+    pooled = httpx.AsyncClient(transport=_fake_llm_transport(latency_s))
+    with patch.object(_pool, "async_client", return_value=pooled):
+        server = _serve(main.app, port + 1)
+        results["after"] = asyncio.run(
+            _drive(f"http://127.0.0.1:{port + 1}", concurrency, total)
+        )
+        server.should_exit = True
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--port", type=int, default=18080)
+    args = parser.parse_args()
+
+    results = run(
+        args.concurrency, args.requests, args.llm_latency_ms / 1000, args.port
+    )
+    for mode, stats in results.items():
+        print(
+            f"{mode:>6}: {stats['rps']:8.1f} req/s | p50 {stats['p50_ms']:7.1f}ms | "
+            f"p99 {stats['p99_ms']:7.1f}ms | /health p99 {stats['health_p99_ms']:7.1f}ms"
+        )
@@ -0,0 +1,68 @@
+"""
+CPU-only benchmark of dynamic batching in the Ray Serve LLM deployment.
+
+Drives the deployment class directly (no Ray cluster, no GPU) with the mock
+engine's cost model: each forward pass costs a fixed overhead plus a small
+per-prompt cost, which is roughly how a GPU decoder behaves at small batch sizes.
+
+    PYTHONPATH=. python benchmarks/serve_batching.py --requests 512 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import time
+
+from src.llm.serve import MockEngine, VLLMDeployment
+
+
+async def _drive(deployment, total: int, concurrency: int) -> float:
+    pending = iter(range(total))
+
+    async def client():
+        for i in pending:
+            await deployment.generate(f"Query {i}: summarize the Q3 audit")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+def run(total: int, concurrency: int, overhead_ms: float, per_prompt_ms: float):
+    rows = []
+    for max_batch_size in (1, 4, 8, 16, 32):
+        engine = MockEngine(
+            batch_overhead_s=overhead_ms / 1000, per_prompt_s=per_prompt_ms / 1000
+        )
+        deployment = VLLMDeployment.func_or_class(
+            engine=engine, max_batch_size=max_batch_size, max_wait_s=0.005
+        )
+        elapsed = asyncio.run(_drive(deployment, total, concurrency))
+        stats = deployment.stats()["batching"]
+        rows.append(
+            {
+                "max_batch_size": max_batch_size,
+                "throughput": total / elapsed,
+                "mean_batch_size": stats["mean_batch_size"],
+                "utilization": stats["utilization"],
+            }
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--overhead-ms", type=float, default=20.0)
+    parser.add_argument("--per-prompt-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rows = run(args.requests, args.concurrency, args.overhead_ms, args.per_prompt_ms)
+    baseline = rows[0]["throughput"]
+    print("max_batch | prompts/s | speedup | mean batch | utilization")
+    for row in rows:
+        print(
+            f"{row['max_batch_size']:>9} | {row['throughput']:9.1f} | "
+            f"{row['throughput'] / baseline:6.1f}x | {row['mean_batch_size']:10.1f} | "
+            f"{row['utilization']:10.0%}"
+        )
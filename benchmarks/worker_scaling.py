@@ -0,0 +1,261 @@
+"""
+Multi-worker serving: throughput and answer-cache hit rate from 1 to N workers.
+
+Each run starts uvicorn with `--workers N` processes, as `python src/api/main.py`
+does with API_WORKERS=N. Every worker serves the real app on top of its own
+offline stand-ins from benchmarks/fakes.py. Client processes then replay one
+query stream against it over HTTP. The stream draws from `--unique` distinct
+queries with a Zipf-like skew, so popular questions repeat.
+
+Each worker count runs once per cache backend:
+
+  local   every worker caches plans and answers on its own, so a repeat is
+          only a hit if the same worker answered it before
+  sqlite  workers share one SQLite (WAL) cache, so a repeat is a hit
+          wherever it lands
+
+    PYTHONPATH=. python benchmarks/worker_scaling.py
+    PYTHONPATH=. python benchmarks/worker_scaling.py --workers 1,2,4,8 --requests 4000
+
+Throughput only scales up to the number of cores; the client processes share
+them with the workers.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ("local", "sqlite")
+
+
+def bench_app():
+    """
+    uvicorn app factory, called in each worker process: the API with fakes
+    for Qdrant, Neo4j and the LLM installed before its lifespan starts.
+    """
+    from src.api import main
+
+    app = main.create_app()
+    lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def with_fakes(app):
+        await _install_fakes()
+        async with lifespan(app):
+            yield
+
+    app.router.lifespan_context = with_fakes
+
+    @app.get("/bench/pid")
+    async def pid():
+        return {"pid": os.getpid()}
+
+    return app
+
+
+async def _install_fakes():
+    from qdrant_client import AsyncQdrantClient
+
+    from benchmarks.fakes import FakeNeo4jDriver, build_collection, llm_transport
+    from src.embeddings.embedders import HashingEmbedder
+    from src.embeddings.service import EmbeddingService
+    from src.llm.client import _pool
+    from src.llm.prefix_cache import PrefixCache
+    from src.llm.serve import MockEngine
+    from src.retrieval.graph import GraphRetriever
+    from src.retrieval.subgraph import SubgraphCache
+    from src.retrieval.vector import VectorRetriever
+
+    embedder = HashingEmbedder(dim=128)
+    qdrant = AsyncQdrantClient(location=":memory:")
+    await build_collection(qdrant, "bench", embedder, 1000, 32)
+    engine = MockEngine(
+        batch_overhead_s=float(os.environ["BENCH_LLM_OVERHEAD_MS"]) / 1000,
+        per_prompt_s=0.001,
+        prefix_cache=PrefixCache(),
+    )
+    llm = httpx.AsyncClient(transport=llm_transport(engine))
+    driver = FakeNeo4jDriver(latency_s=float(os.environ["BENCH_NEO4J_MS"]) / 1000)
+    for target in (
+        patch("src.embeddings.service._service", EmbeddingService(embedder)),
+        patch.object(_pool, "async_client", return_value=llm),
+        patch(
+            "src.agents.vector_search.vector_retriever",
+            VectorRetriever(client=qdrant, collection_name="bench"),
+        ),
+        patch(
+            "src.agents.graph_search.graph_retriever",
+            GraphRetriever(driver=driver, cache=SubgraphCache()),
+        ),
+    ):
+        target.start()  # for the life of the worker
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start(workers: int, backend: str, cache_path: str, port: int, args):
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        ENV="development",
+        API_WARMUP="false",
+        LOG_LEVEL="WARNING",
+        LOG_DEBUG_FILE="false",
+        CACHE_BACKEND=backend,
+        CACHE_SQLITE_PATH=cache_path,
+        BENCH_LLM_OVERHEAD_MS=str(args.llm_overhead_ms),
+        BENCH_NEO4J_MS=str(args.neo4j_latency_ms),
+        # Qdrant's local mode ignores HNSW search params and says so on every query
+        PYTHONWARNINGS="ignore:Local mode performs exact",
+    )
+    code = (
+        "import uvicorn; uvicorn.run('benchmarks.worker_scaling:bench_app', factory=True, "
+        f"host='127.0.0.1', port={port}, workers={workers}, log_level='warning')"
+    )
+    server = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=env)
+
+    # Ready once every worker has answered (new connections spread across them)
+    pids, deadline = set(), time.monotonic() + 120
+    while len(pids) < workers:
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            raise RuntimeError(f"{workers} workers did not start")
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+                pids.add(client.get("/bench/pid").json()["pid"])
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    return server
+
+
+def _stream(total: int, unique: int, skew: float, seed: int):
+    from benchmarks.fakes import passage
+
+    rng = random.Random(seed)
+    questions = [f"{passage(rng, 8)[:-1]} {i}?" for i in range(unique)]
+    weights = [1 / (rank + 1) ** skew for rank in range(unique)]
+    return rng.choices(questions, weights, k=total)
+
+
+def _drive(port: int, queries, concurrency: int) -> dict:
+    async def run():
+        pending = iter(queries)
+        latencies, tiers, errors = [], {}, 0
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60
+        ) as client:
+
+            async def worker():
+                nonlocal errors
+                for query in pending:
+                    start = time.perf_counter()
+                    response = await client.post("/query", json={"query": query})
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                    tier = response.json()["cache_tier"] or "miss"
+                    tiers[tier] = tiers.get(tier, 0) + 1
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return {"latencies": latencies, "tiers": tiers, "errors": errors}
+
+    return asyncio.run(run())
+
+
+def run(workers: int, backend: str, args) -> dict:
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        server = _start(
+            workers, backend, os.path.join(tmp, "cache.sqlite3"), port, args
+        )
+        try:
+            queries = _stream(args.requests, args.unique, args.skew, args.seed)
+            shares = [queries[i :: args.clients] for i in range(args.clients)]
+            per_client = max(1, args.concurrency // args.clients)
+            with ProcessPoolExecutor(args.clients) as pool:
+                start = time.perf_counter()
+                parts = list(
+                    pool.map(
+                        _drive,
+                        [port] * args.clients,
+                        shares,
+                        [per_client] * len(shares),
+                    )
+                )
+                elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+
+    latencies = sorted(x for part in parts for x in part["latencies"])
+    tiers = {}
+    for part in parts:
+        for tier, n in part["tiers"].items():
+            tiers[tier] = tiers.get(tier, 0) + n
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "hit_rate": 1 - tiers.get("miss", 0) / max(1, sum(tiers.values())),
+        "tiers": tiers,
+        "errors": sum(part["errors"] for part in parts),
+    }
+
+
+def _default_workers():
+    counts, n = [1, 2], 4
+    while n <= (os.cpu_count() or 1):
+        counts.append(n)
+        n *= 2
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--workers",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=_default_workers(),
+        help="comma-separated worker counts (default: 1, 2 and powers of 2 up to the cores)",
+    )
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--unique", type=int, default=400)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--neo4j-latency-ms", type=float, default=5.0)
+    parser.add_argument("--llm-overhead-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    single = {}
+    for backend in args.backends.split(","):
+        for workers in args.workers:
+            result = run(workers, backend, args)
+            single.setdefault(backend, result["rps"])
+            print(
+                f"{backend:>6} x{workers:<3} {result['rps']:8.1f} req/s "
+                f"({result['rps'] / single[backend]:4.1f}x) | "
+                f"p50 {result['p50_ms']:7.1f} ms p95 {result['p95_ms']:7.1f} ms | "
+                f"answer cache hit rate {result['hit_rate']:6.1%} {result['tiers']}"
+                + (f" | {result['errors']} errors" if result["errors"] else "")
+            )
@@ -0,0 +1,384 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from src.agents import graph_search, vector_search
+from src.agents.plan_classifier import classifier, normalize_query, plan_cache
+from src.agents.planner import available_plan
+from src.agents.synthesizer import build_synthesis_prompt
+from src.cache.answer_cache import answer_cache
+from src.embeddings.service import get_embedding_service
+from src.llm.client import MOCK_RESPONSE, LLMClient
+from src.llm.prompts import SYNTHESIS_SYSTEM_PROMPT
+from src.retrieval.fusion import fuser
+from src.retrieval.graph import GraphRetriever
+from src.retrieval.vector import VectorRetriever, validate_filters
+from src.utils.logger import logger, setup_logger
+from src.utils.resilience import breakers
+from src.utils.tracing import span
+
+ORDERS = ("input", "completion")
+
+
+@dataclass
+class BatchItem:
+    query: str
+    filters: Optional[Dict[str, Any]] = None
+
+    def key(self) -> Tuple[str, str]:
+        return normalize_query(self.query), json.dumps(
+            self.filters or {}, sort_keys=True
+        )
+
+
+def parse_items(text: str) -> List[BatchItem]:
+    """
+    Reads a JSON array or JSONL (one entry per line). Entries are query strings
+    or {"query": ..., "filters": {...}} objects; raises ValueError otherwise.
+    """
+    text = text.strip()
+    if text.startswith("["):
+        entries = json.loads(text)
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    items = []
+    for n, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {"query": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("query"), str):
+            raise ValueError(f"Entry {n} is not a query string or object: {entry!r}")
+        filters = entry.get("filters")
+        if filters is not None and not isinstance(filters, dict):
+            raise ValueError(f"Entry {n} has non-object filters: {filters!r}")
+        try:
+            validate_filters(filters)
+        except ValueError as e:
+            raise ValueError(f"Entry {n}: {e}")
+        items.append(BatchItem(entry["query"], filters))
+    return items
+
+
+class BatchRunner:
+    """
+    Answers many queries with each workflow stage amortized across the batch.
+
+    Identical queries (same normalized text and filters) are answered once and
+    answer-cache hits are returned right away. The rest are processed in chunks
+    of `chunk_size`, `max_concurrent_chunks` at a time. Per chunk, plans come
+    from the plan cache, the classifier and one batched LLM call for the
+    uncertain ones; vector searches go to Qdrant as one batch search; graph
+    lookups share one multi-parameter Cypher query; synthesis prompts go to the
+    LLM as one batch request.
+
+    A chunk that fails marks its items as errors and does not affect the rest.
+    As in the workflow, retrieval skips backends whose circuit breaker is open.
+    Answers retrieved that way, or from failed or unreachable backends, and
+    the mock answer given while the LLM is unreachable are not cached.
+    """
+
+    def __init__(self, chunk_size: int = None, max_concurrent_chunks: int = None):
+        self.chunk_size = chunk_size or int(os.getenv("BATCH_CHUNK_SIZE", "64"))
+        self.max_concurrent_chunks = max_concurrent_chunks or int(
+            os.getenv("BATCH_MAX_CONCURRENT_CHUNKS", "2")
+        )
+
+    async def run(
+        self, items: List[BatchItem], order: str = "input"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields one result per item, in input order or as soon as each is ready
+        (`order="completion"`).
+        """
+        if order not in ORDERS:
+            raise ValueError(f"order must be one of {ORDERS}, not {order!r}")
+
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for i, item in enumerate(items):
+            groups.setdefault(item.key(), []).append(i)
+
+        done: asyncio.Queue = asyncio.Queue()
+        pending = []
+        for indices in groups.values():
+            item = items[indices[0]]
+            cached, tier = await answer_cache.aget(item.query, item.filters)
+            if cached is None:
+                pending.append((indices, item))
+            else:
+                done.put_nowait(
+                    (
+                        indices,
+                        {
+                            "status": "ok",
+                            "answer": cached.answer,
+                            "execution_plan": cached.execution_plan,
+                            "cached": True,
+                            "cache_tier": tier,
+                        },
+                    )
+                )
+        logger.info(
+            "Batch: %d queries, %d unique, %d to run",
+            len(items),
+            len(groups),
+            len(pending),
+        )
+
+        semaphore = asyncio.Semaphore(self.max_concurrent_chunks)
+
+        async def process(chunk):
+            async with semaphore:
+                try:
+                    results = await self._run_chunk([item for _, item in chunk])
+                except Exception as e:
+                    logger.error("Batch chunk failed: %s", e, exc_info=True)
+                    results = [{"status": "error", "error": str(e)}] * len(chunk)
+            for (indices, _), result in zip(chunk, results):
+                done.put_nowait((indices, result))
+
+        tasks = [
+            asyncio.ensure_future(process(pending[i : i + self.chunk_size]))
+            for i in range(0, len(pending), self.chunk_size)
+        ]
+        try:
+            emitted, buffered = 0, {}
+            while emitted < len(items):
+                indices, result = await done.get()
+                for i in indices:
+                    line = {"index": i, "query": items[i].query, **result}
+                    if order == "completion":
+                        emitted += 1
+                        yield line
+                    else:
+                        buffered[i] = line
+                # Input order: release the results that are now contiguous
+                while emitted in buffered:
+                    yield buffered.pop(emitted)
+                    emitted += 1
+        finally:
+            # The consumer may stop early (e.g. the client disconnected)
+            for task in tasks:
+                task.cancel()
+
+    async def _run_chunk(self, items: List[BatchItem]) -> List[Dict[str, Any]]:
+        queries = [item.query for item in items]
+        with span("batch_planner"):
+            planned = await self._plan(queries)
+            plans = [available_plan(plan) for plan in planned]
+
+        vector_idx = [i for i, plan in enumerate(plans) if plan in ("vector", "hybrid")]
+        graph_idx = [i for i, plan in enumerate(plans) if plan in ("graph", "hybrid")]
+        (vector_results, vector_failed), (graph_results, graph_failed) = (
+            await asyncio.gather(
+                self._vector(items, vector_idx), self._graph(queries, graph_idx)
+            )
+        )
+        failed = vector_failed | graph_failed
+
+        with span("batch_fusion"):
+            prompts = []
+            vectors = {}  # passages recur across the chunk's queries
+            for i, query in enumerate(queries):
+                evidence = fuser.fuse(
+                    query,
+                    {
+                        "vector": vector_results.get(i, []),
+                        "graph": graph_results.get(i, []),
+                    },
+                    vectors,
+                )
+                state = {"query": query, "context": [e.render() for e in evidence]}
+                prompts.append(build_synthesis_prompt(state))
+
+        with span("batch_synthesizer"):
+            answers = await LLMClient().agenerate_batch(
+                prompts, system_prompt=SYNTHESIS_SYSTEM_PROMPT
+            )
+
+        results = []
+        for i, (item, plan, answer, wanted) in enumerate(
+            zip(items, plans, answers, planned)
+        ):
+            if plan == wanted and i not in failed and answer != MOCK_RESPONSE:
+                await answer_cache.aput(item.query, item.filters, answer, plan)
+            results.append(
+                {
+                    "status": "ok",
+                    "answer": answer,
+                    "execution_plan": plan,
+                    "cached": False,
+                    "cache_tier": None,
+                }
+            )
+        return results
+
+    @staticmethod
+    async def _plan(queries: List[str]) -> List[str]:
+        # Same decision rule as planner_node, with one LLM call for the whole chunk
+        threshold = float(os.getenv("PLANNER_CONFIDENCE_THRESHOLD", "0.8"))
+        plans = [await plan_cache.aget(query) for query in queries]
+        unsure = []
+        for i, query in enumerate(queries):
+            if plans[i] is None:
+                decision = classifier.classify(query)
+                if decision.confidence >= threshold:
+                    plans[i] = decision.plan
+                    await plan_cache.aput(query, decision.plan)
+                else:
+                    unsure.append(i)
+        if unsure:
+            llm_plans = await LLMClient().aplan_queries([queries[i] for i in unsure])
+            for i, plan in zip(unsure, llm_plans):
+                plans[i] = plan
+                await plan_cache.aput(queries[i], plan)
+        return plans
+
+    @staticmethod
+    async def _vector(
+        items: List[BatchItem], indices: List[int]
+    ) -> Tuple[Dict[int, List[str]], Set[int]]:
+        # Results per index, and the degraded indices (no results: unreachable or failed)
+        if not indices:
+            return {}, set()
+        retriever = vector_search.vector_retriever
+        with span("batch_vector_search"):
+            try:
+                if not await retriever.healthy():
+                    return {i: [] for i in indices}, set(indices)
+                vectors = await get_embedding_service().aembed(
+                    [items[i].query for i in indices], query=True
+                )
+                # One batch search per distinct filter (usually just one)
+                by_filters: Dict[str, List[int]] = {}
+                for position, i in enumerate(indices):
+                    by_filters.setdefault(items[i].key()[1], []).append(position)
+                groups = list(by_filters.values())
+                responses = await breakers.get("qdrant").call(
+                    lambda: asyncio.gather(
+                        *(
+                            retriever.search_many(
+                                [vectors[p] for p in positions],
+                                items[indices[positions[0]]].filters,
+                            )
+                            for positions in groups
+                        )
+                    )
+                )
+                results = {}
+                for positions, points in zip(groups, responses):
+                    for p, hits in zip(positions, points):
+                        results[indices[p]] = VectorRetriever.format(hits)
+                return results, set()
+            except Exception as e:
+                logger.error("Batch vector search failed: %s", e)
+                return {i: [] for i in indices}, set(indices)
+
+    @staticmethod
+    async def _graph(
+        queries: List[str], indices: List[int]
+    ) -> Tuple[Dict[int, List[str]], Set[int]]:
+        if not indices:
+            return {}, set()
+        retriever = graph_search.graph_retriever
+        with span("batch_graph_search"):
+            try:
+                if not await asyncio.to_thread(retriever.healthy):
+                    return {i: [] for i in indices}, set(indices)
+                rows = await breakers.get("neo4j").call(
+                    lambda: retriever.neighborhood_many([queries[i] for i in indices])
+                )
+                return {
+                    i: GraphRetriever.format(r) for i, r in zip(indices, rows)
+                }, set()
+            except Exception as e:
+                logger.error("Batch graph search failed: %s", e)
+                return {i: [] for i in indices}, set(indices)
+
+
+batch_runner = BatchRunner()
+
+
+async def _run_local(items: List[BatchItem], order: str, out):
+    from src.llm.client import aclose_pool
+    from src.retrieval.vector import close_client
+
+    try:
+        async for result in batch_runner.run(items, order):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        await aclose_pool()
+        await close_client()
+
+
+def _run_remote(text: str, url: str, order: str, api_key: str, out):
+    import httpx
+
+    with httpx.Client(timeout=None) as client:
+        with client.stream(
+            "POST",
+            f"{url.rstrip('/')}/query/batch",
+            params={"order": order},
+            content=text.encode(),
+            headers={"Content-Type": "application/x-ndjson", "X-API-Key": api_key},
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    out.write(line + "\n")
+                    out.flush()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Answer a file of queries, writing one JSON result per line."
+    )
+    parser.add_argument(
+        "input", help="JSONL or JSON array of queries or {query, filters}; - for stdin"
+    )
+    parser.add_argument("--output", "-o", help="result file (default: stdout)")
+    parser.add_argument(
+        "--order",
+        choices=ORDERS,
+        default="input",
+        help="emit results in input order or as they complete",
+    )
+    parser.add_argument(
+        "--url",
+        help="stream from a running API (POST /query/batch) instead of in-process",
+    )
+    parser.add_argument(
+        "--api-key", default=os.getenv("GRAPH_RAG_API_KEY", "secret-enterprise-key")
+    )
+    args = parser.parse_args(argv)
+
+    if args.input == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.input) as f:
+            text = f.read()
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    if out is sys.stdout:
+        # Keep console log lines out of the results
+        setup_logger(logger.name)
+        listener = getattr(logger, "listener", None)
+        for handler in listener.handlers if listener else logger.handlers:
+            if getattr(handler, "stream", None) is sys.stdout:
+                handler.setStream(sys.stderr)
+    try:
+        if args.url:
+            _run_remote(text, args.url, args.order, args.api_key, out)
+        else:
+            asyncio.run(_run_local(parse_items(text), args.order, out))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
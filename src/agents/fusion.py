@@ -0,0 +1,31 @@
+from src.agents.state import AgentState
+from src.retrieval.fusion import fuser
+from src.utils.logger import logger
+from src.utils.tracing import span
+
+
+async def fusion_node(state: AgentState) -> AgentState:
+    """
+    Ranks, deduplicates and packs the retrieved passages into the context budget.
+    """
+    with span("fusion") as timing:
+        evidence = fuser.fuse(
+            state["query"],
+            {
+                "vector": state.get("vector_results") or [],
+                "graph": state.get("graph_results") or [],
+            },
+        )
+    retrieved = len(state.get("vector_results") or []) + len(
+        state.get("graph_results") or []
+    )
+    logger.info(
+        "Fusion: kept %d of %d passages, %d tokens",
+        len(evidence),
+        retrieved,
+        sum(e.tokens for e in evidence),
+    )
+    return {
+        "context": [e.render() for e in evidence],
+        "timings": {"fusion": timing["ms"]},
+    }
@@ -1,32 +1,30 @@
+import asyncio
+
 from src.agents.state import AgentState
-from neo4j import GraphDatabase
-import os
+from src.retrieval.graph import GraphRetriever, graph_retriever
 from src.utils.logger import logger
 
 
-def graph_search_node(state: AgentState) -> AgentState:
+async def graph_search_node(state: AgentState) -> AgentState:
     """
-    Performs graph traversal/search using Neo4j.
+    Performs graph traversal/search using Neo4j. With Neo4j unreachable the
+    branch contributes no evidence and is flagged in `degraded`, so the answer
+    is not cached. Traversal errors are raised, for the workflow's circuit
+    breaker to count.
     """
     query = state["query"]
-    uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-    auth = (os.getenv("NEO4J_USER", "neo4j"), os.getenv("NEO4J_PASSWORD", "password"))
-
-    logger.info(f"Graph Search: Searching for '{query}'")
 
-    results = []
-    try:
-        # driver = GraphDatabase.driver(uri, auth=auth)
-        # with driver.session() as session:
-        #     # In reality, we'd use an LLM to generate Cypher here
-        #     cypher = "MATCH (n)-[r]->(m) WHERE n.name CONTAINS $query RETURN n, r, m LIMIT 5"
-        #     records = session.run(cypher, query=query)
-        #     results = [str(record) for record in records]
+    logger.info("Graph Search: Searching for '%s'", query)
 
-        # Mock results
-        results = [f"Graph Node(A) -[REL]-> Graph Node(B) related to {query}"]
-    except Exception as e:
-        logger.error(f"Graph search failed: {e}")
-        results = ["Error retrieving graph results"]
+    results, degraded = [], []
+    # Full-text seeds expanded a bounded number of hops; see src/retrieval/graph.py
+    if await asyncio.to_thread(graph_retriever.healthy):
+        results = GraphRetriever.format(await graph_retriever.neighborhood(query))
+    else:
+        logger.warning("Graph Search: Neo4j unreachable; no graph evidence")
+        degraded = ["graph_search"]
 
-    return {"graph_results": results}
+    update = {"graph_results": results}
+    if degraded:
+        update["degraded"] = degraded
+    return update
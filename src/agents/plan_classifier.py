@@ -0,0 +1,263 @@
+import asyncio
+import math
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.cache.shared import SharedCache, UsesSharedCache
+
+PLANS = ("vector", "graph", "hybrid")
+
+# Cue phrases that strongly suggest relational (graph) or document (vector) intent
+GRAPH_CUES = re.compile(
+    r"\b(related|relationship|relation|connected|connection|linked|link between|"
+    r"between|depends? on|dependenc\w*|reports? to|manages?|managed by|owns?|"
+    r"owned by|owner of|who (?:is|are|was|were|worked|approved|owns|manages)|"
+    r"works? with|worked with|path from|chain from|supplies|supplied by|"
+    r"approved|approved by|signed(?: off)? by|wrote|written by|authored(?: by)?|"
+    r"assigned to|responsible for|belongs? to|members? of|works? (?:for|on))\b"
+)
+VECTOR_CUES = re.compile(
+    r"\b(documents?|docs?|documentation|policy|policies|report|reports|summar\w*|"
+    r"explain|describe|overview|guidelines?|procedures?|notes|diagrams?|"
+    r"what does|what is|find|search|show me|steps)\b"
+)
+# Nouns naming documents; with them in a query a graph-only plan is a guess
+DOCUMENT_NOUNS = re.compile(
+    r"\b(documents?|docs?|documentation|policy|policies|reports?|guidelines?|"
+    r"procedures?|notes|diagrams?)\b"
+)
+_TOKEN = re.compile(r"[a-z0-9']+")
+_ENTITY = re.compile(r"(?<!^)(?<![.?!] )\b[A-Z][a-zA-Z0-9]*(?: [A-Z0-9][a-zA-Z0-9]*)*")
+# Names of people, projects or organizations (not acronyms like API or GDPR)
+_NAME = re.compile(r"(?<!^)(?<![.?!] )\b[A-Z][a-z]+\b")
+
+# Confidence given to a plan that contradicts the query's other cues, below
+# any sensible PLANNER_CONFIDENCE_THRESHOLD so the LLM decides those
+CONFLICT_CONFIDENCE = 0.5
+
+# Small labelled seed set; the model only has to separate three intents.
+SEED_QUERIES: Dict[str, List[str]] = {
+    "vector": [
+        "Find documents about remote work policy",
+        "Summarize the quarterly financial report",
+        "What does the travel policy say about per diem",
+        "Show me the engineering architecture diagrams",
+        "HR policies for remote work",
+        "Quarterly financial report 2024",
+        "Engineering architectural diagrams",
+        "Explain the onboarding process",
+        "What is our data retention policy",
+        "Search for documentation on the payments API",
+        "Give me an overview of the security guidelines",
+        "Documents mentioning GDPR compliance",
+        "What are the steps to request parental leave",
+        "Find the latest release notes",
+        "Describe the incident response procedure",
+    ],
+    "graph": [
+        "How is Alice related to Project X delay?",
+        "Who manages Project X?",
+        "Which teams depend on the billing service?",
+        "Who reports to Bob Smith?",
+        "What is the relationship between Vendor X and Acme?",
+        "Which employees are connected to the Acme account?",
+        "Who owns the payments service?",
+        "List all projects managed by Charlie",
+        "How are the data platform and analytics teams linked?",
+        "Which vendors supply components to Project Apollo?",
+        "Who approved the contract with Vendor Y?",
+        "Trace the dependency chain from service A to service B",
+        "What entities are connected to the fraud investigation?",
+        "Who worked with Alice on Project X?",
+    ],
+    "hybrid": [
+        "What are the risks associated with the vendors mentioned in the Q3 audit?",
+        "Compliance audit for vendor X",
+        "Summarize the issues raised by teams that depend on the billing service",
+        "What did the managers of Project X say about the delay?",
+        "Explain how the policy changes affected Alice's team",
+        "Find reports about vendors linked to compliance failures",
+        "What do the documents say about the people who own the payments service?",
+        "Describe the impact of the outage on teams connected to service A",
+        "Which policies apply to employees who report to Bob and what do they require?",
+        "Summarize audit findings for vendors related to Project Apollo",
+    ],
+}
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form used as a cache key: lowercase, single-spaced, no edge punctuation.
+    """
+    return " ".join(query.lower().split()).strip(" ?!.")
+
+
+@dataclass
+class PlanDecision:
+    plan: str
+    confidence: float
+
+
+class QueryClassifier:
+    """
+    Local vector/graph/hybrid classifier that replaces the planner's LLM round trip
+    for clear-cut queries.
+
+    Keyword and entity cues plus hashed unigram/bigram features feed a small
+    softmax-regression model trained on SEED_QUERIES on first use.
+    Trained on so few examples, the model is confident about nearly anything,
+    so its confidence is capped at CONFLICT_CONFIDENCE when the query also has
+    cues for another plan: a vector plan for a query naming people or
+    relations ("the leave policy for Bob Smith", "documents approved by the
+    CFO"), or a graph plan for one asking about documents.
+    """
+
+    def __init__(self, dim: int = 4096, epochs: int = 60, lr: float = 0.3):
+        self.dim = dim
+        self.epochs = epochs
+        self.lr = lr
+        self.weights = {plan: [0.0] * dim for plan in PLANS}
+        self.bias = {plan: 0.0 for plan in PLANS}
+        self._trained = False
+        self._lock = threading.Lock()
+
+    def _ensure_trained(self):
+        if self._trained:
+            return
+        with self._lock:
+            if not self._trained:
+                self._train(SEED_QUERIES, self.epochs, self.lr)
+                self._trained = True
+
+    def _features(self, query: str) -> List[int]:
+        normalized = normalize_query(query)
+        tokens = _TOKEN.findall(normalized)
+        names = [f"w:{t}" for t in tokens]
+        names += [f"b:{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+        graph_cues = len(GRAPH_CUES.findall(normalized))
+        vector_cues = len(VECTOR_CUES.findall(normalized))
+        names += ["cue:graph"] * graph_cues + ["cue:vector"] * vector_cues
+        if graph_cues and vector_cues:
+            names.append("cue:both")
+        if len(_ENTITY.findall(query.strip())) >= 2:
+            names.append("cue:entities")
+        if _NAME.search(query.strip()):
+            names.append("cue:name")
+        return [zlib.crc32(name.encode()) % self.dim for name in names]
+
+    def _probabilities(self, features: List[int]) -> Dict[str, float]:
+        scores = {
+            plan: self.bias[plan] + sum(self.weights[plan][f] for f in features)
+            for plan in PLANS
+        }
+        top = max(scores.values())
+        exps = {plan: math.exp(score - top) for plan, score in scores.items()}
+        total = sum(exps.values())
+        return {plan: value / total for plan, value in exps.items()}
+
+    def _train(self, examples: Dict[str, List[str]], epochs: int, lr: float):
+        samples = [
+            (self._features(query), plan)
+            for plan, queries in examples.items()
+            for query in queries
+        ]
+        for _ in range(epochs):
+            for features, label in samples:
+                probs = self._probabilities(features)
+                for plan in PLANS:
+                    gradient = probs[plan] - (1.0 if plan == label else 0.0)
+                    self.bias[plan] -= lr * gradient
+                    row = self.weights[plan]
+                    for f in features:
+                        row[f] -= lr * gradient
+
+    def classify(self, query: str) -> PlanDecision:
+        self._ensure_trained()
+        probs = self._probabilities(self._features(query))
+        plan = max(probs, key=probs.get)
+        confidence = probs[plan]
+        normalized = normalize_query(query)
+        if plan == "vector":
+            conflict = GRAPH_CUES.search(normalized) or _NAME.search(query.strip())
+        elif plan == "graph":
+            # "reports to" is a relation, not a document
+            conflict = DOCUMENT_NOUNS.search(GRAPH_CUES.sub(" ", normalized))
+        else:
+            conflict = None
+        if conflict:
+            confidence = min(confidence, CONFLICT_CONFIDENCE)
+        return PlanDecision(plan=plan, confidence=confidence)
+
+
+class PlanCache(UsesSharedCache):
+    """
+    LRU cache of plan decisions keyed by normalized query. With a shared cache
+    (CACHE_BACKEND), plans are written through to it and local misses are
+    looked up there, so every worker process benefits from each plan.
+    """
+
+    def __init__(self, max_size: int = None, shared: SharedCache = None):
+        self.max_size = max_size or int(os.getenv("PLANNER_CACHE_SIZE", "10000"))
+        if shared is not None:
+            self.shared = shared
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, query: str) -> Optional[str]:
+        key = normalize_query(query)
+        plan = self._entries.get(key)
+        if plan is not None:
+            self._entries.move_to_end(key)
+        elif self.shared is not None:
+            plan = self.shared.get("plan", key)
+            if plan is not None:
+                self._remember(key, plan)
+        return plan
+
+    def put(self, query: str, plan: str):
+        key = normalize_query(query)
+        self._remember(key, plan)
+        if self.shared is not None:
+            self.shared.put("plan", key, plan)
+
+    async def aget(self, query: str) -> Optional[str]:
+        """
+        `get` for the event loop: the shared cache lookup runs in a thread.
+        """
+        key = normalize_query(query)
+        plan = self._entries.get(key)
+        if plan is not None:
+            self._entries.move_to_end(key)
+        elif self.shared is not None:
+            plan = await asyncio.to_thread(self.shared.get, "plan", key)
+            if plan is not None:
+                self._remember(key, plan)
+        return plan
+
+    async def aput(self, query: str, plan: str):
+        key = normalize_query(query)
+        self._remember(key, plan)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.put, "plan", key, plan)
+
+    def _remember(self, key: str, plan: str):
+        self._entries[key] = plan
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        if self.shared is not None:
+            self.shared.clear("plan")
+
+    def __len__(self):
+        return len(self._entries)
+
+
+classifier = QueryClassifier()
+plan_cache = PlanCache()
@@ -1,17 +1,82 @@
+import asyncio
+import os
+import httpx
 from src.agents.state import AgentState
+from src.agents.plan_classifier import classifier, plan_cache
 from src.llm.client import LLMClient
 from src.utils.logger import logger
+from src.utils.resilience import CircuitOpen, breakers, remaining
 
+# Backend each retrieval branch depends on
+BRANCH_DEPENDENCIES = {"vector": "qdrant", "graph": "neo4j"}
 
-def planner_node(state: AgentState) -> AgentState:
+
+def _branches(plan: str):
+    return list(BRANCH_DEPENDENCIES) if plan == "hybrid" else [plan]
+
+
+def available_plan(plan: str) -> str:
+    """
+    `plan` without the retrieval branches whose backend circuit is open: hybrid
+    degrades to the branch that is still up and a single-branch plan switches
+    to the other one. Unchanged when no backend is up.
+    """
+    up = [
+        branch
+        for branch, dependency in BRANCH_DEPENDENCIES.items()
+        if not breakers.get(dependency).is_open
+    ]
+    kept = [branch for branch in _branches(plan) if branch in up] or up
+    if not kept:
+        return plan
+    return "hybrid" if len(kept) > 1 else kept[0]
+
+
+async def planner_node(state: AgentState) -> AgentState:
     """
     Decides the execution strategy based on the user query.
+
+    Cached decisions are reused; otherwise the local classifier decides, and only
+    queries it is unsure about pay for an LLM planning round trip. That round
+    trip is bounded by PLANNER_LLM_TIMEOUT_S and the request deadline; if it
+    times out, fails (an HTTP or transport error) or the LLM circuit is open,
+    the classifier's guess is used (and not cached). Branches whose backend
+    circuit is open are dropped from the plan.
     """
     query = state["query"]
-    llm = LLMClient()
 
-    # In a real scenario, the LLM analyzes the complexity
-    plan = llm.plan_query(query)
+    plan = await plan_cache.aget(query)
+    source = "cache"
+    if plan is None:
+        decision = classifier.classify(query)
+        threshold = float(os.getenv("PLANNER_CONFIDENCE_THRESHOLD", "0.8"))
+        if decision.confidence >= threshold:
+            plan, source = decision.plan, "classifier"
+        else:
+            # In a real scenario, the LLM analyzes the complexity
+            llm = LLMClient()
+            try:
+                timeout_s = remaining(
+                    state.get("deadline"),
+                    float(os.getenv("PLANNER_LLM_TIMEOUT_S", "3")),
+                )
+                plan = await llm.aplan_query(query, timeout_s=timeout_s)
+                source = "llm"
+            except (asyncio.TimeoutError, CircuitOpen, httpx.HTTPError) as e:
+                logger.warning("Planner: LLM unavailable (%r); using classifier", e)
+                plan, source = decision.plan, "fallback"
+        if source != "fallback":
+            # The LLM should decide once it is back, so fallbacks are not cached
+            await plan_cache.aput(query, plan)
 
-    logger.info(f"Planner: Decided on {plan} strategy for query: '{query}'")
-    return {"plan": plan}
+    logger.info(
+        "Planner: Decided on %s strategy (%s) for query: '%s'", plan, source, query
+    )
+    update = {"plan": available_plan(plan)}
+    if update["plan"] != plan:
+        skipped = set(_branches(plan)) - set(_branches(update["plan"]))
+        update["degraded"] = [f"{branch}_search" for branch in sorted(skipped)]
+        logger.warning(
+            "Planner: degraded %s to %s (circuit open)", plan, update["plan"]
+        )
+    return update
@@ -1,9 +1,25 @@
-from typing import TypedDict, List, Dict, Any, Optional
+import operator
+from typing import Annotated, TypedDict, List, Dict, Any, Optional
+
+
+def merge_dicts(left: Optional[Dict], right: Optional[Dict]) -> Dict:
+    """
+    Reducer for dict-valued channels written by parallel branches.
+    """
+    return {**(left or {}), **(right or {})}
 
 
 class AgentState(TypedDict):
     query: str
+    filters: Optional[Dict[str, Any]]  # payload filters for vector search
     plan: Optional[str]  # "vector", "graph", or "hybrid"
-    vector_results: List[str]
-    graph_results: List[str]
+    # Reducers let the parallel hybrid branches write concurrently without clobbering
+    vector_results: Annotated[List[str], operator.add]
+    graph_results: Annotated[List[str], operator.add]
+    context: Optional[List[str]]  # fused, budgeted evidence for the prompt
     final_answer: Optional[str]
+    timings: Annotated[Dict[str, float], merge_dicts]  # node name -> milliseconds
+    deadline: Optional[float]  # time.monotonic() by which the answer is due
+    # Nodes that were skipped (open circuit, missed deadline) or fell back to
+    # mock or error output; such answers are never cached
+    degraded: Annotated[List[str], operator.add]
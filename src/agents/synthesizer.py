@@ -1,27 +1,46 @@
 from src.agents.state import AgentState
-from src.llm.client import LLMClient
+from src.llm.client import MOCK_RESPONSE, LLMClient
+from src.llm.prompts import SYNTHESIS_SYSTEM_PROMPT, synthesis_prompt
 from src.utils.logger import logger
+from src.utils.resilience import remaining
 
 
-def synthesizer_node(state: AgentState) -> AgentState:
+def build_synthesis_prompt(state: AgentState) -> str:
     """
-    Synthesizes the final answer using results from both searchers.
+    Builds the per-request part of the synthesis prompt from the retrieved
+    context; shared by the workflow node and the streaming endpoint. It is sent
+    after SYNTHESIS_SYSTEM_PROMPT, which holds the instructions.
     """
-    llm = LLMClient()
-
     context = ""
-    if state.get("vector_results"):
-        context += "Vector Context:\n" + "\n".join(state["vector_results"]) + "\n\n"
-    if state.get("graph_results"):
-        context += "Graph Context:\n" + "\n".join(state["graph_results"]) + "\n\n"
+    if state.get("context") is not None:
+        # Already ranked, deduplicated and budgeted by the fusion node
+        context = "Evidence (most relevant first):\n" + "\n".join(state["context"])
+        context += "\n\n"
+    else:
+        if state.get("vector_results"):
+            context += "Vector Context:\n" + "\n".join(state["vector_results"])
+            context += "\n\n"
+        if state.get("graph_results"):
+            context += "Graph Context:\n" + "\n".join(state["graph_results"]) + "\n\n"
 
-    prompt = (
-        f"Context:\n{context}\n"
-        f"User Query: {state['query']}\n"
-        "Generate a comprehensive answer based on the context above."
-    )
+    return synthesis_prompt(state["query"], context)
 
-    response = llm.generate(prompt)
+
+async def synthesizer_node(state: AgentState) -> AgentState:
+    """
+    Synthesizes the final answer using results from both searchers, within
+    what is left of the request deadline (asyncio.TimeoutError otherwise).
+    The mock answer given while the LLM is unreachable is flagged in `degraded`.
+    """
+    llm = LLMClient()
+
+    response = await llm.agenerate(
+        build_synthesis_prompt(state),
+        system_prompt=SYNTHESIS_SYSTEM_PROMPT,
+        timeout_s=remaining(state.get("deadline")),
+    )
 
     logger.info("Synthesizer: Generated Final Answer")
+    if response == MOCK_RESPONSE:
+        return {"final_answer": response, "degraded": ["synthesizer"]}
     return {"final_answer": response}
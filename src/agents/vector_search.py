@@ -1,25 +1,32 @@
 from src.agents.state import AgentState
-from qdrant_client import QdrantClient
-import os
+from src.embeddings.service import get_embedding_service
+from src.retrieval.vector import VectorRetriever, vector_retriever
 from src.utils.logger import logger
 
 
-def vector_search_node(state: AgentState) -> AgentState:
+async def vector_search_node(state: AgentState) -> AgentState:
     """
-    Performs semantic search using Qdrant.
+    Performs semantic search using Qdrant. With Qdrant unreachable the branch
+    contributes no evidence and is flagged in `degraded`, so the answer is not
+    cached. Search errors are raised, for the workflow's circuit breaker to
+    count.
     """
     query = state["query"]
-    qdrant_url = os.getenv("QDRANT_URL", "http://localhost:6333")
 
-    logger.info(f"Vector Search: Searching for '{query}'")
+    logger.info("Vector Search: Searching for '%s'", query)
 
-    try:
-        # client = QdrantClient(url=qdrant_url)
-        # results = client.search(collection_name="enterprise_docs", query_vector=embed(query), limit=5)
-        # mock results:
-        results = [f"Vector Result 1 for {query}", f"Vector Result 2 for {query}"]
-    except Exception as e:
-        logger.error(f"Vector search failed: {e}")
-        results = ["Error retrieving vector results"]
+    results, degraded = [], []
+    # Shared client; `filters` are applied server-side, see src/retrieval/vector.py
+    if await vector_retriever.healthy():
+        # Served from the query embedding cache when this query was seen before
+        query_vector = await get_embedding_service().aembed_one(query, query=True)
+        points = await vector_retriever.search(query_vector, state.get("filters"))
+        results = VectorRetriever.format(points)
+    else:
+        logger.warning("Vector Search: Qdrant unreachable; no vector evidence")
+        degraded = ["vector_search"]
 
-    return {"vector_results": results}
+    update = {"vector_results": results}
+    if degraded:
+        update["degraded"] = degraded
+    return update
@@ -1,9 +1,15 @@
+import asyncio
+import os
 from langgraph.graph import StateGraph, END
 from src.agents.state import AgentState
 from src.agents.planner import planner_node
 from src.agents.vector_search import vector_search_node
 from src.agents.graph_search import graph_search_node
+from src.agents.fusion import fusion_node
 from src.agents.synthesizer import synthesizer_node
+from src.utils.logger import logger
+from src.utils.resilience import CircuitOpen, breakers, remaining
+from src.utils.tracing import span, traced
 
 
 # Define the routing logic
@@ -14,46 +20,97 @@ def router(state: AgentState):
     elif plan == "graph":
         return ["graph_search"]
     else:
+        # Both branches are scheduled in the same superstep and run concurrently
         return ["vector_search", "graph_search"]
 
 
-# Construct the graph
-workflow = StateGraph(AgentState)
-
-# Add nodes
-workflow.add_node("planner", planner_node)
-workflow.add_node("vector_search", vector_search_node)
-workflow.add_node("graph_search", graph_search_node)
-workflow.add_node("synthesizer", synthesizer_node)
-
-# Add edges
-workflow.set_entry_point("planner")
-
-# Conditional edges from planner to searchers
-workflow.add_conditional_edges(
-    "planner",
-    router,
-    {
-        "vector_search": "vector_search",
-        "graph_search": "graph_search",
-        # For hybrid, we map to both (parallel execution is supported by LangGraph if branching)
-        # NOTE: LangGraph API varies; to fan-out, we might need a specific structure or just return list.
-        # Assuming the 'router' returns a list of next nodes for parallel execution:
-    },
-)
-
-# In current LangGraph (0.0.x), conditional edges usually return a single next node or we use a Map step.
-# For simplicity in this scaffold, we will just fan out to both if hybrid,
-# but strictly speaking standard conditional edges direct flow.
-# To achieve parallel fan-out easily:
-# We can make planner go to a 'fork' node or define the edges explicitly.
-# For this scaffold, let's simplify: Planner -> (Router logic) -> Searchers -> Synthesizer
-
-# To support the list output from router, we need to ensure the graph supports it.
-# If not, we'll force hybrid to run vector then graph sequentially for safety in this scaffold.
-
-workflow.add_edge("vector_search", "synthesizer")
-workflow.add_edge("graph_search", "synthesizer")
-workflow.add_edge("synthesizer", END)
-
-app = workflow.compile()
+def retrieval_branch(
+    name: str, node, results_key: str, timeout_s: float, dependency: str
+):
+    """
+    Wraps a retrieval node with a deadline (`timeout_s` or what is left of the
+    request's, whichever is sooner) and records its wall time in `timings`.
+    A branch that fails, misses its deadline, or whose backend's circuit
+    breaker is open, contributes no results and is listed in `degraded`
+    instead of holding up synthesis. Errors and timeouts count against the
+    breaker.
+    """
+
+    async def run(state: AgentState) -> AgentState:
+        breaker = breakers.get(dependency)
+        with span(name) as timing:
+            try:
+                timeout = remaining(state.get("deadline"), timeout_s)
+                update = await breaker.call(lambda: node(state), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("%s missed its deadline; skipping", name)
+                update = {results_key: [], "degraded": [name]}
+            except CircuitOpen:
+                logger.warning("%s skipped: %s circuit is open", name, dependency)
+                update = {results_key: [], "degraded": [name]}
+            except Exception as e:
+                logger.error("%s failed: %s", name, e)
+                update = {results_key: [], "degraded": [name]}
+        update["timings"] = {name: timing["ms"]}
+        return update
+
+    return run
+
+
+def build_workflow(include_synthesizer: bool = True):
+    """
+    Compiles the agent graph. Without the synthesizer the graph stops after
+    retrieval and fusion, which lets the streaming endpoint run synthesis token
+    by token.
+    """
+    timeout_s = float(os.getenv("RETRIEVAL_BRANCH_TIMEOUT_S", "5"))
+
+    # Construct the graph
+    workflow = StateGraph(AgentState)
+
+    # Add nodes
+    workflow.add_node("planner", traced("planner")(planner_node))
+    workflow.add_node(
+        "vector_search",
+        retrieval_branch(
+            "vector_search", vector_search_node, "vector_results", timeout_s, "qdrant"
+        ),
+    )
+    workflow.add_node(
+        "graph_search",
+        retrieval_branch(
+            "graph_search", graph_search_node, "graph_results", timeout_s, "neo4j"
+        ),
+    )
+    workflow.add_node("fusion", fusion_node)
+    if include_synthesizer:
+        workflow.add_node("synthesizer", traced("synthesizer")(synthesizer_node))
+
+    # Add edges
+    workflow.set_entry_point("planner")
+
+    # Conditional edges from planner to searchers; "hybrid" fans out to both
+    workflow.add_conditional_edges(
+        "planner",
+        router,
+        {
+            "vector_search": "vector_search",
+            "graph_search": "graph_search",
+        },
+    )
+
+    # Fan-in: fusion is triggered once, after every branch scheduled in the
+    # retrieval superstep has finished (or hit its deadline).
+    workflow.add_edge("vector_search", "fusion")
+    workflow.add_edge("graph_search", "fusion")
+    if include_synthesizer:
+        workflow.add_edge("fusion", "synthesizer")
+        workflow.add_edge("synthesizer", END)
+    else:
+        workflow.add_edge("fusion", END)
+
+    return workflow.compile()
+
+
+app = build_workflow()
+retrieval_app = build_workflow(include_synthesizer=False)
@@ -0,0 +1,73 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+
+class Saturated(Exception):
+    """
+    Raised when the API cannot admit another query within its queueing budget.
+    """
+
+    def __init__(self, retry_after_s: int):
+        super().__init__("Query capacity exhausted")
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionController:
+    """
+    Bounds how many workflow executions run at once on this worker.
+
+    Up to `max_concurrent` queries execute; up to `max_queued` more may wait at most
+    `queue_timeout_s` for a slot. Anything beyond that is rejected immediately so the
+    caller can return a fast 503 instead of letting latency grow without bound.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = None,
+        max_queued: int = None,
+        queue_timeout_s: float = None,
+        retry_after_s: int = None,
+    ):
+        self.max_concurrent = max_concurrent or int(
+            os.getenv("QUERY_MAX_CONCURRENCY", "64")
+        )
+        self.max_queued = (
+            max_queued
+            if max_queued is not None
+            else int(os.getenv("QUERY_MAX_QUEUE", "128"))
+        )
+        self.queue_timeout_s = (
+            queue_timeout_s
+            if queue_timeout_s is not None
+            else float(os.getenv("QUERY_QUEUE_TIMEOUT_S", "1.0"))
+        )
+        self.retry_after_s = retry_after_s or int(os.getenv("QUERY_RETRY_AFTER_S", "1"))
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def admit(self):
+        if self._slots.locked():
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                raise Saturated(self.retry_after_s)
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout_s)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Saturated(self.retry_after_s)
+            finally:
+                self.queued -= 1
+        else:
+            await self._slots.acquire()
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
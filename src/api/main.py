@@ -1,14 +1,27 @@
+import asyncio
+import json
+import math
 import os
-import uvicorn
 import time
 import uuid
-from fastapi import FastAPI, HTTPException, Request, Depends, Security
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, HTTPException, Request, Response
+from fastapi import Depends, Security
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, field_validator
+from typing import Optional, Dict, Any
 
-from src.agents.workflow import app as graph_app
-from src.utils.logger import logger
+# Only light modules at import time: LangGraph, the Qdrant and Neo4j clients and
+# the embedding model are loaded by the lifespan (or on first use), so a new
+# worker or test process starts in a fraction of the time.
+from src.api.admission import AdmissionController, Saturated
+from src.cache.answer_cache import answer_cache
+from src.retrieval.vector import validate_filters
+from src.utils.logger import logger, setup_logger
+from src.utils.resilience import CircuitOpen, breakers, deadline_after
+from src.utils.tracing import correlation_id as correlation_id_var
+from src.utils.tracing import metrics, span
 
 # --- Security Setup ---
 API_KEY_NAME = "X-API-Key"
@@ -28,30 +41,110 @@ def get_api_key(api_key_header: str = Security(api_key_header)):
     raise HTTPException(status_code=403, detail="Could not validate credentials")
 
 
-# --- App Setup ---
-app = FastAPI(
-    title="CogniGraph API",
-    description="Gateway for Hybrid Search using Neo4j and Qdrant",
-    version="1.0.0",
-)
+# --- Resources ---
+# Compiled LangGraph workflows, built by the lifespan at startup or on first use
+# when the app runs without one (e.g. a TestClient outside a `with` block)
+graph_app = None
+retrieval_app = None
+
+
+def load_workflows():
+    """
+    Imports and compiles the query workflows unless already loaded; this is what
+    pulls in LangGraph and, through the agents, the Qdrant and Neo4j clients.
+    """
+    global graph_app, retrieval_app
+    if graph_app is None or retrieval_app is None:
+        from src.agents import workflow
+
+        graph_app = graph_app or workflow.app
+        retrieval_app = retrieval_app or workflow.retrieval_app
+    return graph_app, retrieval_app
+
+
+async def warm_up():
+    """
+    Creates the shared Qdrant client and Neo4j driver (connections are opened
+    lazily by their pools), connects the shared cache, trains the plan
+    classifier and runs one embedding, which loads the model.
+    """
+    from src.agents.plan_classifier import classifier
+    from src.cache.shared import get_shared_cache
+    from src.embeddings.service import get_embedding_service
+    from src.retrieval.graph import get_driver
+    from src.retrieval.vector import get_qdrant_client
+
+    get_qdrant_client()
+    await asyncio.to_thread(get_driver)
+    await asyncio.to_thread(get_shared_cache)
+    await asyncio.to_thread(classifier.classify, "warm-up")
+    await get_embedding_service().aembed(["warm-up"], query=True)
+
+
+async def close_resources():
+    from src.cache.shared import close_shared_cache
+    from src.llm.client import aclose_pool, close_pool
+    from src.retrieval.graph import close_driver
+    from src.retrieval.vector import close_client
+
+    await aclose_pool()
+    close_pool()
+    await close_client()
+    await asyncio.to_thread(close_driver)
+    close_shared_cache()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup: logging, the compiled workflows and, unless API_WARMUP=false, the
+    client pools and embedding model, so the first request pays for none of
+    them. A failed warm-up is logged; those resources then load on first use.
+    Shutdown: closes the pools.
+    """
+    setup_logger()
+    start = time.perf_counter()
+    load_workflows()
+    if os.getenv("API_WARMUP", "true").lower() == "true":
+        try:
+            await warm_up()
+        except Exception as e:
+            logger.warning("Warm-up failed, continuing without it: %s", e)
+    logger.info("API ready in %.2fs", time.perf_counter() - start)
+    try:
+        yield
+    finally:
+        await close_resources()
+
+
+# Caps concurrent workflow executions; excess load is shed with 503 + Retry-After
+admission = AdmissionController()
+router = APIRouter()
 
 
 # --- Middleware: Correlation ID ---
-@app.middleware("http")
 async def add_correlation_id(request: Request, call_next):
     correlation_id = request.headers.get("X-Correlation-ID", str(uuid.uuid4()))
-    # In a real logger, we would set this in the context var
-    logger.info(f"Processing request {correlation_id} - Path: {request.url.path}")
+    # Every log line and span of this request, down to the LLM call, carries it
+    token = correlation_id_var.set(correlation_id)
+    try:
+        logger.info(
+            "Processing request %s - Path: %s", correlation_id, request.url.path
+        )
 
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+        with span("http_request", path=request.url.path) as timing:
+            response = await call_next(request)
 
-    response.headers["X-Correlation-ID"] = correlation_id
-    logger.info(
-        f"Completed request {correlation_id} - Duration: {process_time:.4f}s - Status: {response.status_code}"
-    )
-    return response
+        response.headers["X-Correlation-ID"] = correlation_id
+        logger.info(
+            "Completed request %s - Duration: %.4fs - Status: %s",
+            correlation_id,
+            timing["ms"] / 1000,
+            response.status_code,
+        )
+        return response
+    finally:
+        correlation_id_var.reset(token)
 
 
 # --- Models ---
@@ -59,47 +152,387 @@ class QueryRequest(BaseModel):
     query: str
     filters: Optional[Dict[str, Any]] = None
 
+    @field_validator("filters")
+    @classmethod
+    def check_filters(cls, filters):
+        # Rejected here with a 422 rather than failing inside vector search
+        validate_filters(filters)
+        return filters
+
 
 class QueryResponse(BaseModel):
     answer: str
     execution_plan: Optional[str]
+    cached: bool = False
+    cache_tier: Optional[str] = None  # "exact" or "semantic" when cached
 
 
 # --- Endpoints ---
 
 
-@app.get("/health")
+@router.get("/health")
 async def health_check():
     logger.debug("Health check requested")
     return {"status": "healthy"}
 
 
-@app.post("/query", response_model=QueryResponse)
-async def query_system(request: QueryRequest, api_key: str = Depends(get_api_key)):
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Per-stage latency histograms and recent p50/p95/p99, in the Prometheus text
+    format (planner, vector_search, graph_search, fusion, synthesizer, llm_http,
+    llm_http_plan, llm_http_batch, http_request), and the state of each dependency's circuit breaker.
+    """
+    return PlainTextResponse(
+        metrics.render() + breakers.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@router.post("/query", response_model=QueryResponse)
+async def query_system(
+    request: QueryRequest, response: Response, api_key: str = Depends(get_api_key)
+):
     """
     Main entry point for the RAG system.
     Orchestrates the query through the Multi-Agent Logic.
     Secured by API Key.
+
+    The request has REQUEST_DEADLINE_S to complete, time spent queueing for
+    admission included. Retrieval branches that would miss it, or whose backend
+    circuit is open, are skipped. Answers built without them, or on fallback
+    results or the mock LLM answer, are listed in the X-Degraded header and not
+    cached. Missing the deadline altogether is a 504.
     """
+    deadline = deadline_after()
     try:
-        logger.info(f"Received query: {request.query}")
-        # Run the LangGraph workflow
+        logger.info("Received query: %s", request.query)
+        cached, tier = await answer_cache.aget(request.query, request.filters)
+        if cached is not None:
+            logger.info("Serving query from %s answer cache", tier)
+            return QueryResponse(
+                answer=cached.answer,
+                execution_plan=cached.execution_plan,
+                cached=True,
+                cache_tier=tier,
+            )
+
+        # Run the LangGraph workflow without blocking the event loop
         initial_state = {
             "query": request.query,
+            "filters": request.filters,
             "vector_results": [],
             "graph_results": [],
+            "deadline": deadline,
         }
-        result = graph_app.invoke(initial_state)
+        workflow, _ = load_workflows()
+        async with admission.admit():
+            result = await workflow.ainvoke(initial_state)
 
-        logger.info(f"Query processed successfully. Plan: {result.get('plan')}")
-        return QueryResponse(
+        logger.info("Query processed successfully. Plan: %s", result.get("plan"))
+        answer = QueryResponse(
             answer=result.get("final_answer", "No answer generated."),
             execution_plan=result.get("plan"),
         )
+        if result.get("degraded"):
+            response.headers["X-Degraded"] = ",".join(result["degraded"])
+        else:
+            await answer_cache.aput(
+                request.query, request.filters, answer.answer, answer.execution_plan
+            )
+        return answer
+    except Saturated as e:
+        logger.warning("Rejecting query: worker at capacity")
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, retry later",
+            headers={"Retry-After": str(e.retry_after_s)},
+        )
+    except CircuitOpen as e:
+        logger.warning("Rejecting query: %s", e)
+        raise HTTPException(
+            status_code=503,
+            detail=f"{e}, retry later",
+            headers={"Retry-After": str(math.ceil(e.retry_after_s))},
+        )
+    except asyncio.TimeoutError:
+        logger.warning("Query missed its deadline")
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
     except Exception as e:
-        logger.error(f"Error processing query: {e}", exc_info=True)
+        logger.error("Error processing query: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Streaming response that holds an admission slot until it is done, whether
+    the body was sent in full, failed, or the client went away before the body
+    was iterated at all.
+    """
+
+    def __init__(self, content, admitted=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.admitted = admitted
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.admitted is not None:
+                await self.admitted.__aexit__(None, None, None)
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/query/stream")
+async def query_stream(request: QueryRequest, api_key: str = Depends(get_api_key)):
+    """
+    Streaming variant of /query using Server-Sent Events.
+    Emits `plan`, one `retrieval` event per search branch as it finishes, `token`
+    events while the answer is synthesized, then `done` with the full answer,
+    time-to-first-token and total latency. Planning and retrieval run within
+    the request deadline, as for /query.
+    """
+    deadline = deadline_after()
+    start_time = time.perf_counter()
+    logger.info("Received streaming query: %s", request.query)
+
+    cached, tier = await answer_cache.aget(request.query, request.filters)
+
+    from src.agents.synthesizer import build_synthesis_prompt
+    from src.llm.client import MOCK_RESPONSE, LLMClient
+    from src.llm.prompts import SYNTHESIS_SYSTEM_PROMPT
+
+    _, retrieval = load_workflows()
+
+    admitted = None
+    if cached is None:
+        # Admit before the response starts so saturation is still a plain 503,
+        # and after everything that can fail before the response owns the slot
+        admitted = admission.admit()
+        try:
+            await admitted.__aenter__()
+        except Saturated as e:
+            logger.warning("Rejecting streaming query: worker at capacity")
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, retry later",
+                headers={"Retry-After": str(e.retry_after_s)},
+            )
+
+    def elapsed_ms() -> float:
+        return (time.perf_counter() - start_time) * 1000
+
+    async def events():
+        try:
+            if cached is not None:
+                yield _sse("plan", {"plan": cached.execution_plan})
+                yield _sse("token", {"text": cached.answer})
+                latency = elapsed_ms()
+                yield _sse(
+                    "done",
+                    {
+                        "answer": cached.answer,
+                        "execution_plan": cached.execution_plan,
+                        "cached": True,
+                        "cache_tier": tier,
+                        "ttft_ms": latency,
+                        "total_ms": latency,
+                    },
+                )
+                return
+
+            state = {
+                "query": request.query,
+                "filters": request.filters,
+                "plan": None,
+                "vector_results": [],
+                "graph_results": [],
+                "timings": {},
+                "deadline": deadline,
+                "degraded": [],
+            }
+            async for update in retrieval.astream(state, stream_mode="updates"):
+                for node, values in update.items():
+                    state["degraded"] += values.get("degraded", [])
+                    if node == "planner":
+                        state["plan"] = values["plan"]
+                        yield _sse("plan", {"plan": state["plan"]})
+                        continue
+                    if node == "fusion":
+                        state["context"] = values["context"]
+                        state["timings"].update(values["timings"])
+                        continue
+                    results = []
+                    for key in ("vector_results", "graph_results"):
+                        state[key] = state[key] + values.get(key, [])
+                        results += values.get(key, [])
+                    state["timings"].update(values.get("timings", {}))
+                    yield _sse(
+                        "retrieval",
+                        {
+                            "source": node,
+                            "results": results,
+                            "ms": state["timings"].get(node),
+                        },
+                    )
+
+            tokens = []
+            ttft_ms = None
+            prompt = build_synthesis_prompt(state)
+            async for token in LLMClient().astream(prompt, SYNTHESIS_SYSTEM_PROMPT):
+                if ttft_ms is None:
+                    ttft_ms = elapsed_ms()
+                tokens.append(token)
+                yield _sse("token", {"text": token})
+
+            answer = "".join(tokens)
+            if answer == MOCK_RESPONSE:
+                state["degraded"].append("synthesizer")
+            total_ms = elapsed_ms()
+            ttft_ms = ttft_ms if ttft_ms is not None else total_ms
+            logger.info(
+                "Streamed answer. Plan: %s - TTFT: %.1fms - Total: %.1fms",
+                state["plan"],
+                ttft_ms,
+                total_ms,
+            )
+            if not state["degraded"]:
+                await answer_cache.aput(
+                    request.query, request.filters, answer, state["plan"]
+                )
+            yield _sse(
+                "done",
+                {
+                    "answer": answer,
+                    "execution_plan": state["plan"],
+                    "cached": False,
+                    "cache_tier": None,
+                    "ttft_ms": ttft_ms,
+                    "total_ms": total_ms,
+                    "timings": state["timings"],
+                    "degraded": state["degraded"],
+                },
+            )
+        except Exception as e:
+            logger.error("Error streaming query: %s", e, exc_info=True)
+            yield _sse("error", {"detail": str(e)})
+
+    return AdmittedStreamingResponse(
+        events(),
+        admitted,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/query/batch")
+async def query_batch(
+    request: Request, order: str = "input", api_key: str = Depends(get_api_key)
+):
+    """
+    Answers many queries in one call, amortizing planning, retrieval and
+    synthesis across the batch (see src/agents/batch.py); identical queries are
+    answered once. The body is JSONL or a JSON array of query strings or
+    {"query", "filters"} objects, or {"queries": [...], "order": ...}.
+
+    Streams one NDJSON line per query with its `index` and `status`, in input
+    order or, with `order=completion`, as each result is ready.
+    """
+    from src.agents.batch import ORDERS, batch_runner, parse_items
+
+    body = (await request.body()).decode()
+    try:
+        items = None
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None  # JSONL with more than one line
+        # Only an object with "queries" is an envelope; {"query": ...} is JSONL
+        if isinstance(payload, dict) and "queries" in payload:
+            order = payload.get("order", order)
+            items = parse_items(json.dumps(payload["queries"]))
+        if items is None:
+            items = parse_items(body)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid batch: {e}")
+    if order not in ORDERS:
+        raise HTTPException(status_code=422, detail=f"order must be one of {ORDERS}")
+    max_items = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+    if len(items) > max_items:
+        raise HTTPException(
+            status_code=413, detail=f"Batch exceeds {max_items} queries"
+        )
+    logger.info("Received batch of %d queries", len(items))
+
+    # The whole batch holds one workflow slot; admit before the response starts
+    admitted = admission.admit()
+    try:
+        await admitted.__aenter__()
+    except Saturated as e:
+        logger.warning("Rejecting batch: worker at capacity")
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, retry later",
+            headers={"Retry-After": str(e.retry_after_s)},
+        )
+
+    async def lines():
+        async for result in batch_runner.run(items, order):
+            yield json.dumps(result) + "\n"
+
+    return AdmittedStreamingResponse(
+        lines(), admitted, media_type="application/x-ndjson"
+    )
+
+
+def create_app() -> FastAPI:
+    """
+    Builds the API application; resources are managed by `lifespan`.
+    """
+    app = FastAPI(
+        title="CogniGraph API",
+        description="Gateway for Hybrid Search using Neo4j and Qdrant",
+        version="1.0.0",
+        lifespan=lifespan,
+    )
+    app.middleware("http")(add_correlation_id)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
+
+
+def api_workers() -> int:
+    """
+    Worker processes to serve with: API_WORKERS, where "auto" means one per
+    core. Unset, that is "auto" when ENV=production and 1 (with auto-reload)
+    otherwise.
+    """
+    default = "auto" if os.getenv("ENV") == "production" else "1"
+    workers = os.getenv("API_WORKERS", default)
+    return (os.cpu_count() or 1) if workers == "auto" else int(workers)
+
+
 if __name__ == "__main__":
-    uvicorn.run("src.api.main:app", host="0.0.0.0", port=8080, reload=True)
+    import uvicorn
+
+    workers = api_workers()
+    if workers > 1:
+        # Workers see each other's cached plans and answers only through a
+        # shared backend; the environment is inherited by the worker processes
+        os.environ.setdefault("CACHE_BACKEND", "sqlite")
+        logger.info(
+            "Starting %d workers (cache backend: %s)",
+            workers,
+            os.environ["CACHE_BACKEND"],
+        )
+    uvicorn.run(
+        "src.api.main:app",
+        host=os.getenv("API_HOST", "0.0.0.0"),
+        port=int(os.getenv("API_PORT", "8080")),
+        workers=workers,
+        reload=workers == 1 and os.getenv("ENV") != "production",
+    )
@@ -0,0 +1,402 @@
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.agents.plan_classifier import normalize_query
+from src.cache.invalidation import register_invalidation_hook
+from src.cache.shared import SharedCache, UsesSharedCache
+
+SparseVector = Dict[int, float]
+
+_WORD = re.compile(r"[a-z0-9]+")
+_RAW_WORD = re.compile(r"[A-Za-z0-9]+")
+
+# Words that flip or narrow the meaning of an otherwise identical question
+NEGATIONS = frozenset(
+    "no not never without none nor neither cannot nothing nobody except excluding".split()
+)
+# Words whose presence or absence does not change what is being asked
+FUNCTION_WORDS = frozenset("""
+    a an and are as at be by can could did do does for from had has have how i
+    in is it its me my of on or our should so that the their there these this
+    those to us was we were what whats when where which who whom whose why will
+    with would you your please tell show give list find
+    """.split())
+
+
+def text_vector(text: str, dim: int = 1 << 18) -> SparseVector:
+    """
+    L2-normalized hashed bag of words and character trigrams; cheap enough to run
+    on every request and robust to small rephrasings and typos.
+    """
+    normalized = normalize_query(text)
+    counts: SparseVector = {}
+    grams = [f"w:{w}" for w in _WORD.findall(normalized)]
+    padded = f" {normalized} "
+    grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    for gram in grams:
+        index = zlib.crc32(gram.encode()) % dim
+        counts[index] = counts.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {k: v / norm for k, v in counts.items()}
+
+
+def anchors(text: str) -> frozenset:
+    """
+    Tokens a near-duplicate must match exactly, because they change the answer
+    rather than the phrasing: numbers and one-letter identifiers ("2023" vs
+    "2024", "vendor X" vs "vendor Y"), capitalized names ("Alice" vs "Bob")
+    and negations ("allowed" vs "not allowed").
+    """
+    found = set()
+    for i, w in enumerate(_RAW_WORD.findall(text)):
+        lower = w.lower()
+        # The first word is capitalized anyway; same_subject still compares it
+        capitalized = w[0].isupper() and (i > 0 or w[1:] != lower[1:])
+        if (
+            len(w) == 1
+            or any(ch.isdigit() for ch in w)
+            or lower in NEGATIONS
+            or (capitalized and lower not in FUNCTION_WORDS)
+        ):
+            found.add(lower)
+    return frozenset(found)
+
+
+def content_words(text: str) -> Tuple[str, ...]:
+    return tuple(
+        dict.fromkeys(
+            w for w in _WORD.findall(normalize_query(text)) if w not in FUNCTION_WORDS
+        )
+    )
+
+
+def _close(word: str, others: Tuple[str, ...]) -> bool:
+    # Same word up to a typo, plural or spelling variant ("summarize"/"summarise")
+    return any(
+        word == other or SequenceMatcher(None, word, other).ratio() >= 0.8
+        for other in others
+    )
+
+
+def same_subject(a: Tuple[str, ...], b: Tuple[str, ...]) -> bool:
+    """
+    True when every content word of each query has a close counterpart in the
+    other, so "finance policy" and "legal policy" are never near-duplicates
+    however similar the rest of the question is.
+    """
+    return all(_close(w, b) for w in a) and all(_close(w, a) for w in b)
+
+
+def cosine(a: SparseVector, b: SparseVector) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    execution_plan: Optional[str]
+    created_at: float = field(default_factory=time.monotonic)
+    vector: SparseVector = field(default_factory=dict, repr=False)
+    anchors: frozenset = frozenset()
+    words: Tuple[str, ...] = ()
+
+
+class AnswerCache(UsesSharedCache):
+    """
+    Two-tier cache of final answers, keyed by normalized query plus filters.
+
+    1. Exact tier: O(1) LRU lookup with a TTL.
+    2. Semantic tier: if there is no exact hit, the most recent `semantic_scan`
+       entries with the same filters and anchors are compared by cosine
+       similarity. An answer above `semantic_threshold` whose query asks about
+       the same content words (up to typos and inflection) is reused for the
+       near-duplicate query.
+
+    With a shared cache (CACHE_BACKEND), answers are also written through to
+    it and local exact misses are looked up there, so a worker process reuses
+    the answers of the others. Hits are copied into the local tiers. When any
+    process invalidates, the others drop their local entries within
+    CACHE_SYNC_INTERVAL_S.
+    """
+
+    def __init__(
+        self,
+        max_size: int = None,
+        ttl_s: float = None,
+        semantic_threshold: float = None,
+        semantic_scan: int = None,
+        embed_fn: Callable[[str], SparseVector] = text_vector,
+        shared: SharedCache = None,
+    ):
+        self.max_size = (
+            max_size
+            if max_size is not None
+            else int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+        )
+        self.ttl_s = ttl_s or float(os.getenv("ANSWER_CACHE_TTL_S", "300"))
+        self.semantic_threshold = semantic_threshold or float(
+            os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0.9")
+        )
+        self.semantic_scan = (
+            semantic_scan
+            if semantic_scan is not None
+            else int(os.getenv("ANSWER_CACHE_SEMANTIC_SCAN", "512"))
+        )
+        self.embed_fn = embed_fn
+        if shared is not None:
+            self.shared = shared
+        self.sync_interval_s = float(os.getenv("CACHE_SYNC_INTERVAL_S", "1"))
+        self._entries: "OrderedDict[Tuple[str, str], CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation: Optional[int] = None
+        self._synced_at = -math.inf
+        self.stats = {
+            "exact_hits": 0,
+            "shared_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    @staticmethod
+    def _filters_key(filters: Optional[Dict[str, Any]]) -> str:
+        return json.dumps(filters or {}, sort_keys=True, default=str)
+
+    def _expired(self, entry: CachedAnswer, now: float) -> bool:
+        return now - entry.created_at > self.ttl_s
+
+    def _sync_due(self, now: float) -> bool:
+        # Another process may have invalidated the shared cache since the last check
+        if self.shared is None or now - self._synced_at < self.sync_interval_s:
+            return False
+        self._synced_at = now
+        return True
+
+    def _resync(self, generation: Optional[int]):
+        if generation is None:
+            return
+        with self._lock:
+            if self._generation is not None and generation != self._generation:
+                self._entries.clear()
+            self._generation = generation
+
+    def _remember(
+        self,
+        key: Tuple[str, str],
+        query: str,
+        answer: str,
+        execution_plan: Optional[str],
+        created_at: float,
+    ) -> CachedAnswer:
+        entry = CachedAnswer(
+            answer,
+            execution_plan,
+            created_at=created_at,
+            vector=self.embed_fn(query),
+            anchors=anchors(query),
+            words=content_words(query),
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return entry
+
+    def _key(self, query: str, filters: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+        return normalize_query(query), self._filters_key(filters)
+
+    def get(
+        self, query: str, filters: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Optional[CachedAnswer], Optional[str]]:
+        """
+        Returns (entry, tier) where tier is "exact" or "semantic", or (None, None).
+        Blocks on the shared cache, if any; use `aget` on the event loop.
+        """
+        if self.max_size <= 0:
+            return None, None
+        key, now = self._key(query, filters), time.monotonic()
+        if self._sync_due(now):
+            self._resync(self.shared.generation("answer"))
+        entry = self._exact(key, now)
+        if entry is None and self.shared is not None:
+            hit = self.shared.get("answer", json.dumps(key))
+            entry = self._shared_hit(key, query, now, hit)
+        if entry is not None:
+            return entry, "exact"
+        return self._semantic(query, key[1], now)
+
+    async def aget(
+        self, query: str, filters: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Optional[CachedAnswer], Optional[str]]:
+        """
+        `get` for the event loop: calls to the shared cache, which may wait on a
+        lock or the network, run in a thread.
+        """
+        if self.max_size <= 0:
+            return None, None
+        key, now = self._key(query, filters), time.monotonic()
+        if self._sync_due(now):
+            generation = await asyncio.to_thread(self.shared.generation, "answer")
+            self._resync(generation)
+        entry = self._exact(key, now)
+        if entry is None and self.shared is not None:
+            hit = await asyncio.to_thread(self.shared.get, "answer", json.dumps(key))
+            entry = self._shared_hit(key, query, now, hit)
+        if entry is not None:
+            return entry, "exact"
+        return self._semantic(query, key[1], now)
+
+    def _exact(self, key: Tuple[str, str], now: float) -> Optional[CachedAnswer]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not self._expired(entry, now):
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry
+            del self._entries[key]
+            self.stats["expirations"] += 1
+        return None
+
+    def _shared_hit(
+        self, key: Tuple[str, str], query: str, now: float, hit: Optional[Dict]
+    ) -> Optional[CachedAnswer]:
+        if hit is None:
+            return None
+        # Keep the original expiry rather than restarting the TTL
+        age = max(0.0, time.time() - hit["stored_at"])
+        entry = self._remember(
+            key, query, hit["answer"], hit["execution_plan"], now - age
+        )
+        with self._lock:
+            self.stats["shared_hits"] += 1
+        return entry
+
+    def _semantic(
+        self, query: str, filters_key: str, now: float
+    ) -> Tuple[Optional[CachedAnswer], Optional[str]]:
+        with self._lock:
+            candidates = []
+            for other_key in reversed(self._entries):
+                if len(candidates) >= self.semantic_scan:
+                    break
+                if other_key[1] == filters_key:
+                    candidates.append(other_key)
+
+        if candidates:
+            vector, query_anchors = self.embed_fn(query), anchors(query)
+            words = content_words(query)
+            best_key, best_score = None, self.semantic_threshold
+            with self._lock:
+                for other_key in candidates:
+                    other = self._entries.get(other_key)
+                    if other is None or self._expired(other, now):
+                        continue
+                    if other.anchors != query_anchors:
+                        continue
+                    score = cosine(vector, other.vector)
+                    if score >= best_score and same_subject(words, other.words):
+                        best_key, best_score = other_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.stats["semantic_hits"] += 1
+                    return self._entries[best_key], "semantic"
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None, None
+
+    def put(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        answer: str,
+        execution_plan: Optional[str],
+    ):
+        """
+        Blocks on the shared cache, if any; use `aput` on the event loop.
+        """
+        if self.max_size <= 0:
+            return
+        key = self._key(query, filters)
+        self._remember(key, query, answer, execution_plan, time.monotonic())
+        if self.shared is not None:
+            self.shared.put("answer", *self._shared_entry(key, answer, execution_plan))
+
+    async def aput(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        answer: str,
+        execution_plan: Optional[str],
+    ):
+        if self.max_size <= 0:
+            return
+        key = self._key(query, filters)
+        self._remember(key, query, answer, execution_plan, time.monotonic())
+        if self.shared is not None:
+            await asyncio.to_thread(
+                self.shared.put,
+                "answer",
+                *self._shared_entry(key, answer, execution_plan),
+            )
+
+    def _shared_entry(
+        self, key: Tuple[str, str], answer: str, execution_plan: Optional[str]
+    ) -> Tuple[str, Dict, float]:
+        # (key, value, ttl_s) as stored in the shared cache
+        value = {
+            "answer": answer,
+            "execution_plan": execution_plan,
+            "stored_at": time.time(),
+        }
+        return json.dumps(key), value, self.ttl_s
+
+    def invalidate(self, doc_ids: Optional[List[str]] = None):
+        """
+        Drops cached answers after a document change. Answers do not record which
+        documents they were built from, so any change clears the whole cache,
+        shared tier included.
+        """
+        with self._lock:
+            self.stats["invalidations"] += 1
+            self._entries.clear()
+        self._clear_shared()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self._clear_shared()
+
+    def _clear_shared(self):
+        if self.shared is None:
+            return
+        self.shared.clear("answer")
+        # Our own clear is not news to us
+        generation = self.shared.generation("answer")
+        with self._lock:
+            self._generation = generation
+
+    def __len__(self):
+        return len(self._entries)
+
+
+answer_cache = AnswerCache()
+register_invalidation_hook(answer_cache.invalidate)
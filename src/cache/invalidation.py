@@ -0,0 +1,52 @@
+from typing import Callable, Iterable, List, Optional
+
+from src.utils.logger import logger
+
+# Callables invoked with the changed document ids (None means "anything may have changed")
+_hooks: List[Callable[[Optional[List[str]]], None]] = []
+
+
+def register_invalidation_hook(hook: Callable[[Optional[List[str]]], None]):
+    """
+    Registers a callback that drops derived data when source documents change.
+    """
+    if hook not in _hooks:
+        _hooks.append(hook)
+    return hook
+
+
+def notify_documents_changed(doc_ids: Optional[Iterable[str]] = None):
+    """
+    Called by the ingestion pipeline after it writes, updates or deletes documents.
+    """
+    ids = list(doc_ids) if doc_ids is not None else None
+    for hook in list(_hooks):
+        try:
+            hook(ids)
+        except Exception as e:
+            logger.error("Cache invalidation hook %r failed: %s", hook, e)
+
+
+# Callables invoked with the graph entity keys a write touched (None: any of them)
+_entity_hooks: List[Callable[[Optional[List[str]]], None]] = []
+
+
+def register_entity_invalidation_hook(hook: Callable[[Optional[List[str]]], None]):
+    """
+    Registers a callback that drops derived data when graph entities change.
+    """
+    if hook not in _entity_hooks:
+        _entity_hooks.append(hook)
+    return hook
+
+
+def notify_entities_changed(keys: Optional[Iterable[str]] = None):
+    """
+    Called by the Neo4j writer after a batch touching these entities commits.
+    """
+    keys = list(keys) if keys is not None else None
+    for hook in list(_entity_hooks):
+        try:
+            hook(keys)
+        except Exception as e:
+            logger.error("Entity invalidation hook %r failed: %s", hook, e)
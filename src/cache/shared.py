@@ -0,0 +1,430 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional, Tuple
+
+from src.utils.logger import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (stored_at);
+CREATE TABLE IF NOT EXISTS generations (
+    namespace TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    namespace TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, seq)
+) WITHOUT ROWID;
+"""
+
+# Events kept per namespace; a reader further behind starts over
+MAX_EVENTS = 10000
+
+
+class SharedCache(ABC):
+    """
+    Cross-process key-value store behind the plan and answer caches, so that a
+    plan or answer computed by one API worker is a hit in all of them. Values
+    are JSON-serializable; keys are strings scoped by a namespace ("plan",
+    "answer").
+
+    clear() bumps the namespace's generation counter, which tells in-process
+    tiers in other workers that their copies are stale (e.g. after the
+    ingestion pipeline changed documents). publish() bumps it too, recording
+    an event (such as the graph entities a write touched) that events() hands
+    to the other workers, so they can drop only what the change affects.
+
+    A cache is an optimization: backend errors are logged and read as misses.
+    Every call blocks (on a SQLite lock or a Redis round trip), so async code
+    runs them with asyncio.to_thread, as AnswerCache.aget and PlanCache.aget do.
+    """
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        try:
+            return self._get(namespace, key)
+        except Exception as e:
+            logger.warning("Shared cache get failed: %s", e)
+            return None
+
+    def put(self, namespace: str, key: str, value: Any, ttl_s: float = None):
+        try:
+            self._put(namespace, key, json.dumps(value), ttl_s)
+        except Exception as e:
+            logger.warning("Shared cache put failed: %s", e)
+
+    def clear(self, namespace: str):
+        try:
+            self._clear(namespace)
+        except Exception as e:
+            logger.warning("Shared cache clear failed: %s", e)
+
+    def generation(self, namespace: str) -> Optional[int]:
+        """
+        Counter bumped by every clear() of `namespace`; None if unavailable.
+        """
+        try:
+            return self._generation(namespace)
+        except Exception as e:
+            logger.warning("Shared cache generation check failed: %s", e)
+            return None
+
+    def publish(self, namespace: str, event: Any) -> Optional[int]:
+        """
+        Records `event` and returns the generation it bumped `namespace` to;
+        None if unavailable.
+        """
+        try:
+            return self._publish(namespace, json.dumps(event))
+        except Exception as e:
+            logger.warning("Shared cache publish failed: %s", e)
+            return None
+
+    def events(
+        self, namespace: str, since: Optional[int]
+    ) -> Optional[Tuple[int, Optional[List[Any]]]]:
+        """
+        (generation, events published after generation `since`). The events are
+        None when they cannot all be replayed (a clear(), or events pruned
+        since), and then everything derived from the namespace is stale. The
+        result is None if the backend is unavailable.
+        """
+        try:
+            generation = self._generation(namespace)
+            if since is None or generation == since:
+                return generation, []
+            if not 0 < generation - since <= MAX_EVENTS:
+                return generation, None
+            values = self._events(namespace, since, generation)
+            if len(values) != generation - since:
+                return generation, None
+            return generation, [json.loads(value) for value in values]
+        except Exception as e:
+            logger.warning("Shared cache events check failed: %s", e)
+            return None
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def _get(self, namespace: str, key: str) -> Optional[Any]: ...
+
+    @abstractmethod
+    def _put(self, namespace: str, key: str, value: str, ttl_s: Optional[float]): ...
+
+    @abstractmethod
+    def _clear(self, namespace: str): ...
+
+    @abstractmethod
+    def _generation(self, namespace: str) -> int: ...
+
+    @abstractmethod
+    def _publish(self, namespace: str, event: str) -> int: ...
+
+    @abstractmethod
+    def _events(self, namespace: str, since: int, until: int) -> List[str]:
+        """
+        The stored events with since < generation <= until, in order.
+        """
+
+
+class SQLiteSharedCache(SharedCache):
+    """
+    Shared cache in one SQLite file in WAL mode: readers never block each other
+    or the writer, so the workers on one machine share it with point lookups of
+    a few microseconds. Expired rows, and the oldest rows beyond `max_entries`,
+    are pruned every `prune_every` writes.
+
+    The connection is opened on first use, and again in a forked child.
+    """
+
+    def __init__(self, path: str, max_entries: int = None, prune_every: int = 1000):
+        self.path = path
+        self.max_entries = max_entries or int(
+            os.getenv("CACHE_SHARED_MAX_ENTRIES", "100000")
+        )
+        self.prune_every = prune_every
+        self.timeout_s = float(os.getenv("CACHE_SQLITE_TIMEOUT_S", "1"))
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self.path,
+                timeout=self.timeout_s,
+                isolation_level=None,  # transactions are managed explicitly
+                check_same_thread=False,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def _get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT value, expires_at FROM entries "
+                    "WHERE namespace = ? AND key = ?",
+                    (namespace, key),
+                )
+                .fetchone()
+            )
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def _put(self, namespace: str, key: str, value: str, ttl_s: Optional[float]):
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, value, now, now + ttl_s if ttl_s else None),
+            )
+            self._puts += 1
+            if self._puts % self.prune_every == 0:
+                self._prune(db, now)
+
+    def _prune(self, db: sqlite3.Connection, now: float):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            (count,) = db.execute("SELECT count(*) FROM entries").fetchone()
+            if count > self.max_entries:
+                db.execute(
+                    "DELETE FROM entries WHERE (namespace, key) IN "
+                    "(SELECT namespace, key FROM entries ORDER BY stored_at LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _clear(self, namespace: str):
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+                db.execute(
+                    "INSERT INTO generations VALUES (?, 1) ON CONFLICT (namespace) "
+                    "DO UPDATE SET value = value + 1",
+                    (namespace,),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _generation(self, namespace: str) -> int:
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT value FROM generations WHERE namespace = ?", (namespace,)
+                )
+                .fetchone()
+            )
+        return row[0] if row else 0
+
+    def _publish(self, namespace: str, event: str) -> int:
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "INSERT INTO generations VALUES (?, 1) ON CONFLICT (namespace) "
+                    "DO UPDATE SET value = value + 1",
+                    (namespace,),
+                )
+                (generation,) = db.execute(
+                    "SELECT value FROM generations WHERE namespace = ?", (namespace,)
+                ).fetchone()
+                db.execute(
+                    "INSERT OR REPLACE INTO events VALUES (?, ?, ?)",
+                    (namespace, generation, event),
+                )
+                db.execute(
+                    "DELETE FROM events WHERE namespace = ? AND seq <= ?",
+                    (namespace, generation - MAX_EVENTS),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return generation
+
+    def _events(self, namespace: str, since: int, until: int) -> List[str]:
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "SELECT value FROM events "
+                    "WHERE namespace = ? AND seq > ? AND seq <= ? ORDER BY seq",
+                    (namespace, since, until),
+                )
+                .fetchall()
+            )
+        return [value for (value,) in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT count(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
+
+
+class RedisSharedCache(SharedCache):
+    """
+    Shared cache in Redis (optional dependency), for workers on several
+    machines. Entries expire through Redis TTLs; bound the total size with the
+    server's maxmemory policy.
+    """
+
+    def __init__(self, url: str, prefix: str = "cognigraph"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError(
+                "CACHE_BACKEND=redis needs the redis package; use "
+                "CACHE_BACKEND=sqlite to share caches between workers on one machine"
+            ) from e
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=float(os.getenv("CACHE_REDIS_TIMEOUT_S", "0.5"))
+        )
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def _get(self, namespace: str, key: str) -> Optional[Any]:
+        value = self.client.get(self._key(namespace, key))
+        return None if value is None else json.loads(value)
+
+    def _put(self, namespace: str, key: str, value: str, ttl_s: Optional[float]):
+        ex = math.ceil(ttl_s) if ttl_s else None
+        self.client.set(self._key(namespace, key), value, ex=ex)
+
+    def _clear(self, namespace: str):
+        batch = []
+        for key in self.client.scan_iter(match=self._key(namespace, "*"), count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+        self.client.incr(f"{self.prefix}-generation:{namespace}")
+
+    def _generation(self, namespace: str) -> int:
+        return int(self.client.get(f"{self.prefix}-generation:{namespace}") or 0)
+
+    def _event_key(self, namespace: str, generation: int) -> str:
+        return f"{self.prefix}-event:{namespace}:{generation}"
+
+    def _publish(self, namespace: str, event: str) -> int:
+        # A reader between the two calls finds the event missing and starts over
+        generation = self.client.incr(f"{self.prefix}-generation:{namespace}")
+        self.client.set(
+            self._event_key(namespace, generation),
+            event,
+            ex=int(os.getenv("CACHE_EVENT_TTL_S", "3600")),
+        )
+        return generation
+
+    def _events(self, namespace: str, since: int, until: int) -> List[str]:
+        values = self.client.mget(
+            [self._event_key(namespace, g) for g in range(since + 1, until + 1)]
+        )
+        return [value for value in values if value is not None]
+
+    def close(self):
+        self.client.close()
+
+
+_shared: Optional[SharedCache] = None
+_shared_configured = False
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """
+    Process-wide shared cache selected by CACHE_BACKEND: "local" (default; no
+    shared tier, each process caches on its own), "sqlite" (CACHE_SQLITE_PATH,
+    for the workers on one machine) or "redis" (CACHE_REDIS_URL).
+    """
+    global _shared, _shared_configured
+    with _shared_lock:
+        if not _shared_configured:
+            backend = os.getenv("CACHE_BACKEND", "local")
+            if backend == "sqlite":
+                _shared = SQLiteSharedCache(
+                    os.getenv(
+                        "CACHE_SQLITE_PATH", os.path.join("data", "cache.sqlite3")
+                    )
+                )
+            elif backend == "redis":
+                _shared = RedisSharedCache(
+                    os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+                )
+            elif backend != "local":
+                raise ValueError(
+                    f"CACHE_BACKEND must be local, sqlite or redis, not {backend!r}"
+                )
+            _shared_configured = True
+        return _shared
+
+
+def close_shared_cache():
+    with _shared_lock:
+        if _shared is not None:
+            _shared.close()
+
+
+class UsesSharedCache:
+    """
+    Mixin for caches with a `shared` tier: unless one is passed in, the
+    process-wide shared cache is looked up on first use rather than at
+    construction, so module-level caches cost nothing at import time.
+    """
+
+    _shared: Optional[SharedCache] = None
+    _shared_resolved = False
+
+    @property
+    def shared(self) -> Optional[SharedCache]:
+        if not self._shared_resolved:
+            self.shared = get_shared_cache()
+        return self._shared
+
+    @shared.setter
+    def shared(self, value: Optional[SharedCache]):
+        self._shared = value
+        self._shared_resolved = True
@@ -0,0 +1,288 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    key BLOB PRIMARY KEY,
+    slot INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta VALUES ('next_slot', 0);
+"""
+
+# Only bounded caches track when each slot was last used
+BOUNDED_SCHEMA = """
+CREATE INDEX IF NOT EXISTS vectors_slot ON vectors (slot);
+CREATE TABLE IF NOT EXISTS recency (
+    slot INTEGER PRIMARY KEY,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recency_used_at ON recency (used_at);
+"""
+
+_LOOKUP_CHUNK = 500  # stays under SQLite's bound-parameter limit
+
+
+class _Local:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.db: Optional[sqlite3.Connection] = None
+        self.shards: Dict[int, np.memmap] = {}
+
+
+_LOCALS: Dict[tuple, _Local] = {}
+_LOCALS_LOCK = threading.Lock()
+
+
+def content_key(namespace: str, text: str) -> bytes:
+    return hashlib.sha1(f"{namespace}\0{text}".encode()).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by content hash, shared across processes.
+
+    Vectors live in fixed-size `.npy` shards that are memory-mapped, so a lookup
+    reads only the rows it needs; a SQLite index maps each key to its slot
+    (shard * shard_rows + row). Writers take SQLite's write lock before claiming
+    slots, so concurrent ingestion workers never overwrite each other's rows.
+    Each embedder gets its own directory, since vectors from different models
+    (or dimensions) are not interchangeable.
+
+    With a `capacity`, at most that many rows are kept and the least recently
+    used ones are overwritten. An evicted key is unmapped (and committed) before
+    its row is reused, and readers re-check their keys' slots after copying, so
+    a reader never returns a row that was overwritten under it.
+
+    Connections and maps are opened lazily and are not pickled, so a cache can be
+    handed to worker processes.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        namespace: str,
+        dim: int,
+        shard_rows: int = None,
+        capacity: Optional[int] = None,
+    ):
+        self.root = root
+        self.namespace = namespace
+        self.dim = dim
+        self.shard_rows = shard_rows or int(
+            os.getenv("EMBEDDING_CACHE_SHARD_ROWS", "65536")
+        )
+        self.capacity = capacity
+        if capacity is not None:
+            # A bounded cache never needs more rows than it keeps
+            self.shard_rows = min(self.shard_rows, capacity)
+        self.path = os.path.join(root, namespace)
+        self._init_local()
+
+    def _init_local(self):
+        # Instances for the same directory (e.g. unpickled once per task in a worker
+        # process) share one connection and set of maps per process.
+        key = (os.getpid(), os.path.abspath(self.path))
+        with _LOCALS_LOCK:
+            local = _LOCALS.get(key)
+            if local is None:
+                local = _LOCALS[key] = _Local()
+        self._local = local
+
+    def __getstate__(self):
+        return {
+            k: self.__dict__[k]
+            for k in ("root", "namespace", "dim", "shard_rows", "capacity", "path")
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_local()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._local.db is None:
+            os.makedirs(self.path, exist_ok=True)
+            db = sqlite3.connect(
+                os.path.join(self.path, "index.sqlite3"),
+                timeout=30,
+                isolation_level=None,  # transactions are managed explicitly
+                check_same_thread=False,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            if self.capacity is not None:
+                db.executescript(BOUNDED_SCHEMA)
+            self._local.db = db
+        return self._local.db
+
+    def _shard(self, shard: int) -> np.memmap:
+        matrix = self._local.shards.get(shard)
+        if matrix is None:
+            path = os.path.join(self.path, f"shard-{shard:05d}.npy")
+            if os.path.exists(path):
+                matrix = np.lib.format.open_memmap(path, mode="r+")
+            else:
+                # Only reached under the write lock: shards are created by writers
+                matrix = np.lib.format.open_memmap(
+                    path, mode="w+", dtype=np.float32, shape=(self.shard_rows, self.dim)
+                )
+            self._local.shards[shard] = matrix
+        return matrix
+
+    @staticmethod
+    def _slots(db: sqlite3.Connection, keys: List[bytes]) -> Dict[bytes, int]:
+        slots = {}
+        for i in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[i : i + _LOOKUP_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            slots.update(
+                db.execute(
+                    f"SELECT key, slot FROM vectors WHERE key IN ({marks})", chunk
+                )
+            )
+        return slots
+
+    def get(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        Returns the cached vectors for whichever of `keys` are present.
+        """
+        with self._local.lock:
+            db = self._connect()
+            slots = self._slots(db, keys)
+            found = {
+                key: np.array(
+                    self._shard(slot // self.shard_rows)[slot % self.shard_rows]
+                )
+                for key, slot in slots.items()
+            }
+            if self.capacity is None or not found:
+                return found
+            # Drop rows whose slot was recycled while we copied them
+            current = self._slots(db, list(found))
+            found = {k: v for k, v in found.items() if current.get(k) == slots[k]}
+            db.executemany(
+                "UPDATE recency SET used_at = ? WHERE slot = ?",
+                [(time.time(), slots[key]) for key in found],
+            )
+            return found
+
+    def put(self, keys: List[bytes], vectors: np.ndarray):
+        if self.capacity is not None:
+            self._put_bounded(keys, vectors)
+            return
+        with self._local.lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have stored some of these since our lookup
+                present = self._slots(db, keys)
+                keep = [i for i, key in enumerate(keys) if key not in present]
+                new_keys, new = [keys[i] for i in keep], vectors[keep]
+                (next_slot,) = db.execute(
+                    "SELECT value FROM meta WHERE name = 'next_slot'"
+                ).fetchone()
+                # Slots are contiguous, so rows are copied a shard-sized slice at a time
+                done = 0
+                while done < len(new):
+                    shard, row = divmod(next_slot + done, self.shard_rows)
+                    n = min(self.shard_rows - row, len(new) - done)
+                    matrix = self._shard(shard)
+                    matrix[row : row + n] = new[done : done + n]
+                    # Rows must be on disk before the index points readers at them
+                    matrix.flush()
+                    done += n
+                db.executemany(
+                    "INSERT INTO vectors VALUES (?, ?)",
+                    [(key, next_slot + i) for i, key in enumerate(new_keys)],
+                )
+                db.execute(
+                    "UPDATE meta SET value = ? WHERE name = 'next_slot'",
+                    (next_slot + len(new),),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _put_bounded(self, keys: List[bytes], vectors: np.ndarray):
+        with self._local.lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                present = self._slots(db, keys)
+                keep = [i for i, key in enumerate(keys) if key not in present]
+                keep = keep[len(keep) - self.capacity :] if self.capacity else []
+                (next_slot,) = db.execute(
+                    "SELECT value FROM meta WHERE name = 'next_slot'"
+                ).fetchone()
+                grow = max(0, min(len(keep), self.capacity - next_slot))
+                slots = list(range(next_slot, next_slot + grow))
+                if len(keep) > grow:
+                    victims = [
+                        slot
+                        for (slot,) in db.execute(
+                            "SELECT slot FROM recency ORDER BY used_at LIMIT ?",
+                            (len(keep) - grow,),
+                        )
+                    ]
+                    db.executemany(
+                        "DELETE FROM vectors WHERE slot = ?", [(s,) for s in victims]
+                    )
+                    db.executemany(
+                        "DELETE FROM recency WHERE slot = ?", [(s,) for s in victims]
+                    )
+                    slots += victims
+                    keep = keep[len(keep) - len(slots) :]
+                db.execute(
+                    "UPDATE meta SET value = ? WHERE name = 'next_slot'",
+                    (next_slot + grow,),
+                )
+                # Evicted keys are unmapped before their rows are overwritten
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+            for slot, i in zip(slots, keep):
+                matrix = self._shard(slot // self.shard_rows)
+                matrix[slot % self.shard_rows] = vectors[i]
+            for shard in {slot // self.shard_rows for slot in slots}:
+                self._local.shards[shard].flush()
+
+            now = time.time()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for slot, i in zip(slots, keep):
+                    inserted = db.execute(
+                        "INSERT OR IGNORE INTO vectors VALUES (?, ?)", (keys[i], slot)
+                    ).rowcount
+                    # A slot whose key another process stored meanwhile is reused first
+                    db.execute(
+                        "INSERT OR REPLACE INTO recency VALUES (?, ?)",
+                        (slot, now if inserted else 0.0),
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def __len__(self):
+        with self._local.lock:
+            return self._connect().execute("SELECT count(*) FROM vectors").fetchone()[0]
+
+    def close(self):
+        with self._local.lock:
+            if self._local.db is not None:
+                self._local.db.close()
+                self._local.db = None
+            self._local.shards.clear()
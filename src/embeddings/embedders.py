@@ -0,0 +1,77 @@
+import os
+import re
+import zlib
+from typing import List
+
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Deterministic, model-free embedder: signed feature hashing of words, word
+    bigrams and character trigrams. Similar texts get similar vectors, which is
+    enough for offline tests and for running the stack without model weights.
+    """
+
+    def __init__(self, dim: int = None):
+        self.dim = dim or int(os.getenv("EMBEDDING_DIM", "384"))
+        self.name = f"hashing-{self.dim}"
+
+    @staticmethod
+    def _features(text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        padded = f" {' '.join(words)} "
+        return (
+            words
+            + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            + [f"#{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        )
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if not features:
+                continue
+            hashes = np.fromiter(
+                (zlib.crc32(f.encode()) for f in features),
+                dtype=np.uint32,
+                count=len(features),
+            )
+            # The top bit picks the sign, so collisions cancel out on average
+            signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix[row], hashes % self.dim, signs)
+        return matrix
+
+
+class SentenceTransformerEmbedder:
+    """
+    CPU inference with a sentence-transformers model (optional dependency).
+    """
+
+    def __init__(self, model_name: str, device: str = "cpu"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                f"EMBEDDING_MODEL={model_name!r} needs the sentence-transformers "
+                "package; use EMBEDDING_MODEL=hashing to run without it"
+            ) from e
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name.replace('/', '--')}"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        # EmbeddingService normalizes, so the model does not have to
+        return self.model.encode(
+            texts, batch_size=len(texts), convert_to_numpy=True
+        ).astype(np.float32, copy=False)
+
+
+def get_embedder(model: str = None):
+    model = model or os.getenv("EMBEDDING_MODEL", "hashing")
+    if model == "hashing":
+        return HashingEmbedder()
+    return SentenceTransformerEmbedder(model)
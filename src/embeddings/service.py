@@ -0,0 +1,126 @@
+import asyncio
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from src.embeddings.cache import EmbeddingCache, content_key
+from src.embeddings.embedders import get_embedder
+
+
+class EmbeddingService:
+    """
+    Embeds texts through a content-hash cache, computing only the misses.
+    Query-side callers pass query=True: their misses go to `query_cache`, a
+    bounded LRU cache, so the corpus cache grows with ingestion and not with
+    API traffic, while a repeated query is still embedded only once.
+
+    Misses are deduplicated and encoded in batches of `batch_size`; a shorter
+    batch is padded to the next power of two, so a model sees few input shapes
+    and can reuse their execution plans without encoding dozens of empty
+    strings for one query. The whole output is L2-normalized in one vectorized
+    step.
+    """
+
+    def __init__(
+        self,
+        embedder=None,
+        cache: Optional[EmbeddingCache] = None,
+        batch_size: int = None,
+        query_cache: Optional[EmbeddingCache] = None,
+    ):
+        self.embedder = embedder or get_embedder()
+        self.cache = cache
+        self.query_cache = query_cache
+        self.batch_size = batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        self.stats = {"hits": 0, "misses": 0, "batches": 0}
+
+    def __getstate__(self):
+        # Counters are per process; a copy sent to a worker starts from zero
+        return {**self.__dict__, "stats": dict.fromkeys(self.stats, 0)}
+
+    @property
+    def dim(self) -> int:
+        return self.embedder.dim
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start : start + self.batch_size]
+            size = min(self.batch_size, 1 << (len(batch) - 1).bit_length())
+            padded = batch + [""] * (size - len(batch))
+            out[start : start + len(batch)] = self.embedder.encode(padded)[: len(batch)]
+            self.stats["batches"] += 1
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+    def embed(self, texts: List[str], query: bool = False) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 matrix of unit vectors. With
+        query=True, misses are stored in the bounded query cache.
+        """
+        keys = [content_key(self.embedder.name, text) for text in texts]
+        unique = list(set(keys))
+        found = self.cache.get(unique) if self.cache is not None else {}
+        if query and self.query_cache is not None and len(found) < len(unique):
+            found.update(self.query_cache.get([k for k in unique if k not in found]))
+        missing = {}  # key -> text, in first-seen order
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.stats["hits"] += len(texts) - len(missing)
+        self.stats["misses"] += len(missing)
+
+        if missing:
+            vectors = self._encode(list(missing.values()))
+            found.update(zip(missing, vectors))
+            cache = self.query_cache if query else self.cache
+            if cache is not None:
+                cache.put(list(missing), vectors)
+
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def embed_one(self, text: str, query: bool = False) -> np.ndarray:
+        return self.embed([text], query)[0]
+
+    async def aembed(self, texts: List[str], query: bool = False) -> np.ndarray:
+        # Encoding is CPU-bound; keep it off the event loop
+        return await asyncio.to_thread(self.embed, texts, query)
+
+    async def aembed_one(self, text: str, query: bool = False) -> np.ndarray:
+        return (await self.aembed([text], query))[0]
+
+
+_service: Optional[EmbeddingService] = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """
+    Process-wide service configured from the environment. EMBEDDING_CACHE_DIR
+    (default data/embeddings) holds the on-disk cache; set it empty to disable.
+    Query embeddings are kept in its queries/ subdirectory, up to
+    EMBEDDING_QUERY_CACHE_ROWS of them (0 disables it).
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            embedder = get_embedder()
+            root = os.getenv("EMBEDDING_CACHE_DIR", os.path.join("data", "embeddings"))
+            cache = query_cache = None
+            if root:
+                cache = EmbeddingCache(root, embedder.name, embedder.dim)
+                rows = int(os.getenv("EMBEDDING_QUERY_CACHE_ROWS", "100000"))
+                if rows > 0:
+                    query_cache = EmbeddingCache(
+                        os.path.join(root, "queries"),
+                        embedder.name,
+                        embedder.dim,
+                        capacity=rows,
+                    )
+            _service = EmbeddingService(embedder, cache, query_cache=query_cache)
+        return _service
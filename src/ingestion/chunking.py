@@ -0,0 +1,208 @@
+import os
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.utils.text import TOKEN
+
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*(?=\s|$)")
+
+
+class ChunkSpan(NamedTuple):
+    """
+    A chunk as offsets into its document; the text is only sliced out on demand.
+    """
+
+    doc_id: str
+    index: int
+    start: int
+    end: int
+    token_count: int
+
+    def text(self, source: str, offset: int = 0) -> str:
+        # `offset` is the document position of source[0] when source is a window
+        return source[self.start - offset : self.end - offset]
+
+
+class _Sentence(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    opens_paragraph: bool
+
+
+def _sentences(
+    text: str, start: int, end: int, base: int = 0, continues: bool = False
+) -> Iterator[_Sentence]:
+    """
+    Splits text[start:end] into sentences with document offsets (text[0] is at
+    `base`). `continues` means the range starts mid-paragraph.
+    """
+    paragraph_start, first = start, not continues
+    for boundary in [*PARAGRAPH_BREAK.finditer(text, start, end), None]:
+        paragraph_end = boundary.start() if boundary else end
+        cursor = paragraph_start
+        while cursor < paragraph_end:
+            match = SENTENCE_END.search(text, cursor, paragraph_end)
+            stop = match.end() if match else paragraph_end
+            token = TOKEN.search(text, cursor, stop)
+            if token:
+                tokens = sum(1 for _ in TOKEN.finditer(text, token.start(), stop))
+                yield _Sentence(base + token.start(), base + stop, tokens, first)
+                first = False
+            cursor = stop
+        if boundary:
+            paragraph_start, first = boundary.end(), True
+
+
+class _Packer:
+    """
+    Greedily packs sentences into chunks; see TokenChunker for the rules.
+    """
+
+    def __init__(self, chunker: "TokenChunker", doc_id: str):
+        self.max_tokens = chunker.max_tokens
+        self.overlap_tokens = chunker.overlap_tokens
+        self.doc_id = doc_id
+        self.index = 0
+        self.current: List[_Sentence] = []
+        self.tokens = 0
+
+    def _close(self) -> ChunkSpan:
+        current = self.current
+        span = ChunkSpan(
+            self.doc_id, self.index, current[0].start, current[-1].end, self.tokens
+        )
+        self.index += 1
+        # Carry whole trailing sentences (never the entire chunk) as overlap
+        self.current, self.tokens = [], 0
+        for sentence in reversed(current[1:]):
+            if self.tokens + sentence.tokens > self.overlap_tokens:
+                break
+            self.current.insert(0, sentence)
+            self.tokens += sentence.tokens
+        return span
+
+    def add(self, sentence: _Sentence) -> Optional[ChunkSpan]:
+        span = None
+        full = self.tokens + sentence.tokens > self.max_tokens
+        paragraph = sentence.opens_paragraph and self.tokens >= self.max_tokens // 2
+        if self.current and (full or paragraph):
+            span = self._close()
+            if self.tokens + sentence.tokens > self.max_tokens:
+                self.current, self.tokens = [], 0
+        self.current.append(sentence)
+        self.tokens += sentence.tokens
+        return span
+
+    def finish(self) -> Optional[ChunkSpan]:
+        return self._close() if self.current else None
+
+    @property
+    def open_start(self) -> Optional[int]:
+        return self.current[0].start if self.current else None
+
+
+class TokenChunker:
+    """
+    Packs whole sentences into chunks of at most `max_tokens` tokens.
+
+    A chunk closes early at a paragraph break once it is at least half full, and
+    consecutive chunks share up to `overlap_tokens` tokens of trailing sentences.
+    Sentences longer than a chunk are cut at token boundaries. Chunks are emitted
+    as ChunkSpan offsets into the document rather than copies of its text.
+    """
+
+    def __init__(self, max_tokens: int = None, overlap_tokens: int = None):
+        self.max_tokens = max_tokens or int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+        self.overlap_tokens = (
+            overlap_tokens
+            if overlap_tokens is not None
+            else int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+        )
+        if not 0 <= self.overlap_tokens < self.max_tokens:
+            raise ValueError("overlap_tokens must be in [0, max_tokens)")
+
+    def _fit(self, text: str, sentence: _Sentence, base: int) -> Iterator[_Sentence]:
+        if sentence.tokens <= self.max_tokens:
+            yield sentence
+            return
+        tokens = TOKEN.finditer(text, sentence.start - base, sentence.end - base)
+        spans = [m.span() for m in tokens]
+        for i in range(0, len(spans), self.max_tokens):
+            window = spans[i : i + self.max_tokens]
+            yield _Sentence(
+                base + window[0][0],
+                base + window[-1][1],
+                len(window),
+                sentence.opens_paragraph and i == 0,
+            )
+
+    def spans(self, doc_id: str, text: str) -> List[ChunkSpan]:
+        packer, spans = _Packer(self, doc_id), []
+        for sentence in _sentences(text, 0, len(text)):
+            for piece in self._fit(text, sentence, 0):
+                span = packer.add(piece)
+                if span:
+                    spans.append(span)
+        last = packer.finish()
+        return spans + [last] if last else spans
+
+    def chunk(self, text: str) -> List[str]:
+        return [span.text(text) for span in self.spans("", text)]
+
+    def stream(
+        self, doc_id: str, pieces: Iterable[str]
+    ) -> Iterator[Tuple[ChunkSpan, str]]:
+        """
+        Chunks a document arriving as text pieces (e.g. a streamed S3 body), holding
+        only the text of the chunk being built instead of the whole document.
+        Yields each span with its text, since the caller keeps no source buffer.
+
+        Produces the same spans as `spans`, except that a run of text with no
+        sentence end longer than 64 chunks' worth of characters is cut at a space.
+        """
+        packer = _Packer(self, doc_id)
+        window, base = "", 0  # window[0] is at document offset `base`
+        segmented = 0  # document offset up to which sentences were packed
+        max_pending = self.max_tokens * 64 * 8  # ~8 characters per token
+        for piece in _eof(pieces):
+            eof = piece is None
+            window += piece or ""
+            start = segmented - base
+            safe = len(window) if eof else _last_sentence_end(window, start)
+            if not eof and safe <= start and len(window) - start > max_pending:
+                safe = window.rfind(" ", start) + 1
+            if safe <= start and not eof:
+                continue
+            for sentence in _sentences(window, start, safe, base, segmented > 0):
+                for part in self._fit(window, sentence, base):
+                    span = packer.add(part)
+                    if span:
+                        yield span, span.text(window, base)
+            segmented = base + safe
+            if eof:
+                break
+            keep = packer.open_start
+            keep = segmented if keep is None else min(keep, segmented)
+            window, base = window[keep - base :], keep
+        last = packer.finish()
+        if last:
+            yield last, last.text(window, base)
+
+
+def _eof(pieces: Iterable[str]) -> Iterator[Optional[str]]:
+    yield from pieces
+    yield None
+
+
+def _last_sentence_end(window: str, start: int) -> int:
+    """
+    Offset just past the last sentence end that is followed by more text; one
+    at the very end of the window may still continue in the next piece.
+    """
+    safe = start
+    for match in SENTENCE_END.finditer(window, start):
+        if match.end() < len(window):
+            safe = match.end()
+    return safe
@@ -0,0 +1,396 @@
+import json
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.llm.prompts import EXTRACTION_SYSTEM_PROMPT, extraction_prompt
+from src.utils.logger import logger
+
+DEFAULT_LABEL = "Entity"
+
+# Head words that give a capitalized phrase its label ("Project X", "Acme Corp")
+LABEL_CUES = {
+    "project": "Project",
+    "program": "Project",
+    "initiative": "Project",
+    "inc": "Organization",
+    "corp": "Organization",
+    "corporation": "Organization",
+    "ltd": "Organization",
+    "llc": "Organization",
+    "gmbh": "Organization",
+    "group": "Organization",
+    "bank": "Organization",
+    "university": "Organization",
+    "team": "Team",
+    "department": "Team",
+    "division": "Team",
+    "policy": "Document",
+    "report": "Document",
+    "audit": "Document",
+    "contract": "Document",
+}
+
+# Dropped from keys, so "Acme Corp." and "Acme" are the same node
+_KEY_SUFFIXES = {"inc", "corp", "corporation", "ltd", "llc", "gmbh", "co", "plc"}
+
+# Relation cues between two mentions in one sentence, passive forms first; a
+# reversed cue points the edge from the second mention to the first
+RELATION_CUES: List[Tuple[str, str, bool]] = [
+    (r"(?:is |was )?(?:managed|led|run|headed) by", "MANAGES", True),
+    (r"(?:is |was )?owned by", "OWNS", True),
+    (r"(?:is |was )?(?:supplied|provided) by", "SUPPLIES", True),
+    (r"(?:is |was )?approved by", "APPROVED", True),
+    (r"(?:is |was )?(?:acquired|bought) by", "ACQUIRED", True),
+    (r"reports? to|reported to", "REPORTS_TO", False),
+    (r"manages|managed|leads|led|runs|heads|headed", "MANAGES", False),
+    (r"owns|owned", "OWNS", False),
+    (r"supplies|supplied|provides|provided", "SUPPLIES", False),
+    (r"approves|approved|signed off(?: on)?", "APPROVED", False),
+    (r"acquires|acquired|bought", "ACQUIRED", False),
+    (r"(?:works?|worked|partners?|partnered|collaborates?) with", "WORKS_WITH", False),
+    (r"depends? on|relies on|relied on|requires", "DEPENDS_ON", False),
+    (r"(?:is |was )?(?:part|a member|a subsidiary) of|belongs to", "PART_OF", False),
+    (r"(?:is |was )?(?:located|based|headquartered) in", "LOCATED_IN", False),
+]
+# Up to a few words (articles, adverbs) may surround the cue
+_RELATIONS = [
+    (re.compile(rf"^\W*(?:\w+\W+){{0,2}}?(?:{cue})\W+(?:(?:the|a|an)\W+)?$"), t, rev)
+    for cue, t, rev in RELATION_CUES
+]
+
+_SENTENCE = re.compile(r"[^.!?\n]+(?:[.!?]+|$)")
+# Capitalized phrases: "Alice", "Project X", "Q3 Audit", "Acme Corp"
+_PHRASE = re.compile(r"\b[A-Z][\w&'-]*(?:\s+(?:of\s+|for\s+|&\s+)?[A-Z0-9][\w&'-]*)*")
+_TOKEN = re.compile(r"\S+")
+_ACRONYM = re.compile(r"\s*\(([A-Z][A-Z0-9&]{1,9})\)")
+_REL_TYPE = re.compile(r"^[A-Z][A-Z0-9_]*$")
+_NON_WORD = re.compile(r"[^\w\s&]+")
+_SPACES = re.compile(r"\s+")
+
+# Capitalized only because they start a sentence, or not names at all
+STOPWORDS = set("""
+    a an the this that these those it its they them their he she his her we our
+    you your i in on at by for from to of and or but if when while after before
+    during since until as with without about over under into there here what
+    which who whom whose where why how all any each every some no not yes also
+    however meanwhile then thus so today yesterday tomorrow
+    """.split())
+
+
+def entity_key(name: str) -> str:
+    """
+    Normalized form that identifies an entity: case, accents, punctuation,
+    possessives, a leading article and company suffixes do not matter.
+    """
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = re.sub(r"'s\b", "", text)
+    words = _SPACES.sub(" ", _NON_WORD.sub(" ", text)).split()
+    if len(words) > 1 and words[0] == "the":
+        words = words[1:]
+    while len(words) > 1 and words[-1] in _KEY_SUFFIXES:
+        words = words[:-1]
+    return " ".join(words)
+
+
+def label_for(name: str) -> str:
+    words = _NON_WORD.sub(" ", name.lower()).split()
+    for word in (words[-1:] + words[:1]) if words else ():
+        if word in LABEL_CUES:
+            return LABEL_CUES[word]
+    return DEFAULT_LABEL
+
+
+def relation_type(text: str) -> Optional[str]:
+    # Types become relationship types in Cypher, so only plain identifiers pass
+    rel_type = re.sub(r"[^A-Z0-9]+", "_", text.upper()).strip("_")
+    return rel_type if _REL_TYPE.match(rel_type) else None
+
+
+@dataclass
+class Extraction:
+    """
+    What one chunk mentions, by name as written; resolved to entity keys later.
+    Plain tuples keep it cheap to send back from worker processes.
+    """
+
+    entities: List[Tuple[str, str]] = field(default_factory=list)  # (name, label)
+    relations: List[Tuple[str, str, str]] = field(
+        default_factory=list
+    )  # (source name, TYPE, target name)
+    aliases: List[Tuple[str, str]] = field(default_factory=list)  # (alias, name)
+
+
+class Gazetteer:
+    """
+    Known entities, each with a canonical name, a label and aliases, matched in
+    text as whole words. Aliases in capitals (acronyms) match case-sensitively,
+    everything else case-insensitively. EXTRACTION_GAZETTEER points to a JSON
+    list of {"name", "label", "aliases"} objects.
+    """
+
+    def __init__(self, entries: Iterable[Dict] = ()):
+        self.entries: Dict[str, Tuple[str, str]] = {}  # surface key -> (name, label)
+        exact, folded = [], []
+        for entry in entries:
+            name = entry["name"]
+            label = entry.get("label", DEFAULT_LABEL)
+            for surface in [name] + list(entry.get("aliases", ())):
+                self.entries[entity_key(surface)] = (name, label)
+                (exact if surface.isupper() else folded).append(surface)
+        self._patterns = [
+            self._compile(surfaces, flags)
+            for surfaces, flags in ((exact, 0), (folded, re.IGNORECASE))
+            if surfaces
+        ]
+
+    @staticmethod
+    def _compile(surfaces: List[str], flags: int) -> re.Pattern:
+        # Longest first, so "Acme Holdings" wins over "Acme"
+        alternation = "|".join(
+            re.escape(s) for s in sorted(set(surfaces), key=len, reverse=True)
+        )
+        return re.compile(rf"(?<!\w)(?:{alternation})(?!\w)", flags)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Gazetteer":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def aliases(self) -> Iterator[Tuple[str, str]]:
+        """
+        (surface key, canonical name) for every name and alias.
+        """
+        return ((key, name) for key, (name, _) in self.entries.items())
+
+    def match(self, text: str) -> Iterator[Tuple[int, int, str, str]]:
+        """
+        (start, end, canonical name, label) of each mention, left to right and
+        without overlaps.
+        """
+        found = []
+        for pattern in self._patterns:
+            for m in pattern.finditer(text):
+                name, label = self.entries[entity_key(m.group())]
+                found.append((m.start(), m.end(), name, label))
+        end = -1
+        for mention in sorted(found, key=lambda f: (f[0], f[0] - f[1])):
+            if mention[0] >= end:
+                end = mention[1]
+                yield mention
+
+
+class RuleExtractor:
+    """
+    Offline extraction from gazetteer matches and capitalized phrases.
+
+    Two mentions in the same sentence are related when the words between them
+    are one of RELATION_CUES ("Alice manages Project X" -> MANAGES). Mentions
+    without such a cue are entities only; no co-occurrence edges are made.
+    A phrase followed by a parenthesized acronym registers the acronym as an
+    alias ("International Business Machines (IBM)"). A single capitalized word
+    at the start of a sentence only counts if it is related to something or
+    recurs elsewhere in the chunk.
+    """
+
+    def __init__(self, gazetteer: Optional[Gazetteer] = None, max_gap_words: int = 6):
+        self.gazetteer = gazetteer or Gazetteer()
+        self.max_gap_words = max_gap_words
+
+    def _mentions(self, sentence: str) -> List[Tuple[int, int, str, str, bool]]:
+        """
+        (start, end, name, label, from the gazetteer) per mention, in order.
+        """
+        mentions = [m + (True,) for m in self.gazetteer.match(sentence)]
+        for m in _PHRASE.finditer(sentence):
+            tokens = [(m.start() + t.start(), t.group()) for t in _TOKEN.finditer(m[0])]
+            # Function words capitalized by the sentence start ("The Q3 audit")
+            while tokens and tokens[0][1].lower() in STOPWORDS:
+                tokens.pop(0)
+            if not tokens:
+                continue
+            start, end = tokens[0][0], m.end()
+            name = re.sub(r"'s$", "", sentence[start:end])
+            if len(name) < 2 or name.isdigit():
+                continue
+            if any(start < m_end and m_start < end for m_start, m_end, *_ in mentions):
+                continue
+            mentions.append((start, end, name, label_for(name), False))
+        return sorted(mentions)
+
+    def extract(self, text: str) -> Extraction:
+        result = Extraction()
+        names, related, initial = {}, set(), set()
+        counts: Dict[str, int] = {}
+        for sentence in _SENTENCE.findall(text):
+            mentions = self._mentions(sentence)
+            lead = len(sentence) - len(sentence.lstrip())
+            for start, end, name, label, known in mentions:
+                names.setdefault(name, label)
+                counts[name] = counts.get(name, 0) + 1
+                if start == lead and " " not in name and not known:
+                    initial.add(name)
+                acronym = _ACRONYM.match(sentence, end)
+                if acronym and acronym.group(1) != name:
+                    result.aliases.append((acronym.group(1), name))
+            for (_, end, src, *_), (start, _, dst, *_) in zip(mentions, mentions[1:]):
+                gap = _ACRONYM.sub("", sentence[end:start], count=1).lower()
+                if len(gap.split()) > self.max_gap_words:
+                    continue
+                for pattern, rel_type, reverse in _RELATIONS:
+                    if pattern.match(gap):
+                        a, b = (dst, src) if reverse else (src, dst)
+                        result.relations.append((a, rel_type, b))
+                        related.update((src, dst))
+                        break
+        for name, label in names.items():
+            if name in initial and name not in related and counts[name] < 2:
+                continue
+            result.entities.append((name, label))
+        return result
+
+
+class LLMExtractor:
+    """
+    Extraction by the LLM, one batched request for many chunks. A response
+    that is not the expected JSON (including the mock response when the LLM
+    is unreachable) falls back to the rule extractor for that chunk.
+    """
+
+    def __init__(self, fallback: Optional[RuleExtractor] = None, client=None):
+        self.fallback = fallback or RuleExtractor()
+        self.client = client
+
+    @staticmethod
+    def parse(response: str) -> Optional[Extraction]:
+        start, end = response.find("{"), response.rfind("}")
+        if start < 0 or end < start:
+            return None
+        try:
+            data = json.loads(response[start : end + 1])
+            result = Extraction()
+            for entity in data.get("entities", []):
+                name = str(entity["name"]).strip()
+                if name:
+                    label = str(entity.get("label") or DEFAULT_LABEL).strip()
+                    result.entities.append((name, label))
+            for relation in data.get("relations", []):
+                rel_type = relation_type(str(relation["type"]))
+                src, dst = str(relation["src"]).strip(), str(relation["dst"]).strip()
+                if rel_type and src and dst:
+                    result.relations.append((src, rel_type, dst))
+            for alias in data.get("aliases", []):
+                result.aliases.append((str(alias["alias"]), str(alias["name"])))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return result
+
+    async def aextract_many(self, texts: List[str]) -> List[Extraction]:
+        from src.llm.client import LLMClient
+
+        client = self.client or LLMClient()
+        responses = await client.agenerate_batch(
+            [extraction_prompt(text) for text in texts],
+            system_prompt=EXTRACTION_SYSTEM_PROMPT,
+        )
+        results = []
+        for text, response in zip(texts, responses):
+            parsed = self.parse(response)
+            if parsed is None:
+                logger.debug("Unparseable extraction response; using rules")
+                parsed = self.fallback.extract(text)
+            results.append(parsed)
+        return results
+
+
+class EntityResolver:
+    """
+    Maps entity names to keys across a whole ingestion run, so every surface
+    form of an entity becomes one node and each mention one compact row.
+
+    Keys are `entity_key` forms. The alias index sends gazetteer aliases and
+    acronyms defined in the text to their entity's key. A batch's aliases are
+    registered before any of its names are resolved. An acronym only defined
+    in a later batch cannot merge nodes already written under its own key.
+    The first name and the first specific label seen for a key are kept, so
+    all rows for it agree.
+    """
+
+    def __init__(self, gazetteer: Optional[Gazetteer] = None):
+        self.aliases: Dict[str, str] = {}  # surface key -> entity key
+        self.entities: Dict[str, Tuple[str, str]] = {}  # entity key -> (name, label)
+        self.stats = {"mentions": 0, "rows": 0, "aliases": 0}
+        for surface, name in (gazetteer or Gazetteer()).aliases():
+            if surface != entity_key(name):
+                self.aliases[surface] = entity_key(name)
+
+    def key(self, name: str) -> str:
+        key = entity_key(name)
+        return self.aliases.get(key, key)
+
+    def _entity(self, name: str, label: str) -> str:
+        key = self.key(name)
+        known = self.entities.get(key)
+        if known is None or (known[1] == DEFAULT_LABEL and label != DEFAULT_LABEL):
+            self.entities[key] = (known[0] if known else name, label)
+        return key
+
+    def resolve(self, extractions: List[Tuple[str, Extraction]]) -> List[List[tuple]]:
+        """
+        Neo4jBulkWriter rows for each (source, extraction), in order: one
+        entity row per distinct entity and one relation row per distinct edge
+        the chunk mentions, both tagged with the chunk's source.
+        """
+        for _, extraction in extractions:
+            for alias, name in extraction.aliases:
+                alias_key, target = entity_key(alias), self.key(name)
+                if alias_key and alias_key != target and alias_key not in self.aliases:
+                    self.aliases[alias_key] = target
+                    self.stats["aliases"] += 1
+
+        out = []
+        for source, extraction in extractions:
+            keys, edges = [], []
+            for name, label in extraction.entities:
+                if entity_key(name):
+                    keys.append(self._entity(name, label))
+            for src, rel_type, dst in extraction.relations:
+                if not (entity_key(src) and entity_key(dst)):
+                    continue
+                a = self._entity(src, DEFAULT_LABEL)
+                b = self._entity(dst, DEFAULT_LABEL)
+                if a != b:
+                    keys += [a, b]
+                    edges.append((a, rel_type, b))
+            self.stats["mentions"] += len(extraction.entities)
+
+            rows = []
+            for key in dict.fromkeys(keys):
+                name, label = self.entities[key]
+                rows.append(
+                    (
+                        "entity",
+                        {"key": key, "name": name, "label": label, "source": source},
+                    )
+                )
+            for a, rel_type, b in dict.fromkeys(edges):
+                rows.append(
+                    (
+                        "relation",
+                        {"src": a, "dst": b, "type": rel_type, "source": source},
+                    )
+                )
+            self.stats["rows"] += len(rows)
+            out.append(rows)
+        return out
+
+
+def get_gazetteer() -> Gazetteer:
+    path = os.getenv("EXTRACTION_GAZETTEER")
+    return Gazetteer.from_file(path) if path else Gazetteer()
@@ -0,0 +1,197 @@
+import json
+import math
+import os
+import sqlite3
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    etag TEXT NOT NULL,
+    last_modified REAL,
+    chunk_count INTEGER NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    key TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    point_id TEXT NOT NULL,
+    graph_rows TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (key, chunk_index)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    last_key TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class ChunkRecord:
+    chunk_hash: str
+    point_id: str
+    graph_rows: List[list] = field(default_factory=list)
+
+
+@dataclass
+class ObjectRecord:
+    key: str
+    etag: str
+    last_modified: Optional[float]
+    chunks: Dict[int, ChunkRecord]
+
+
+class IngestionManifest:
+    """
+    Persistent record of what has been ingested, stored in SQLite.
+
+    Per object it keeps the ETag, and per chunk the content hash, the Qdrant point id
+    and the graph rows it produced. The pipeline uses these to skip unchanged objects,
+    re-embed only changed chunks, and retract what stale chunks (or objects
+    deleted from the bucket) wrote.
+    A checkpoint stores the last key such that every key up to it is fully
+    ingested, so an interrupted run can resume listing from there.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv(
+            "INGEST_MANIFEST_PATH", os.path.join("data", "ingest_manifest.sqlite3")
+        )
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def etag(self, key: str) -> Optional[str]:
+        row = self._db.execute(
+            "SELECT etag FROM objects WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def chunks(self, key: str) -> Dict[int, ChunkRecord]:
+        rows = self._db.execute(
+            "SELECT chunk_index, chunk_hash, point_id, graph_rows FROM chunks "
+            "WHERE key = ?",
+            (key,),
+        )
+        return {
+            index: ChunkRecord(chunk_hash, point_id, json.loads(graph_rows))
+            for index, chunk_hash, point_id, graph_rows in rows
+        }
+
+    def keys(
+        self,
+        prefix: str = "",
+        start_after: Optional[str] = None,
+        before: float = math.inf,
+        page: int = 1000,
+    ) -> Iterator[str]:
+        """
+        Recorded object keys under `prefix`, lazily in key order (the order S3
+        lists them in), optionally only those after `start_after` and those
+        ingested before the Unix time `before`.
+        """
+        last = start_after or ""
+        while True:
+            rows = self._db.execute(
+                "SELECT key FROM objects WHERE key > ? AND substr(key, 1, ?) = ? "
+                "AND ingested_at < ? ORDER BY key LIMIT ?",
+                (last, len(prefix), prefix, before, page),
+            ).fetchall()
+            for (last,) in rows:
+                yield last
+            if len(rows) < page:
+                return
+
+    def commit(
+        self,
+        records: Iterable[ObjectRecord],
+        checkpoint: Optional[str] = None,
+        deleted: Iterable[str] = (),
+    ):
+        """
+        Atomically stores finished objects, forgets deleted ones and (optionally)
+        advances the checkpoint.
+        """
+        now = time.time()
+        with self._db:
+            for key in deleted:
+                self._db.execute("DELETE FROM objects WHERE key = ?", (key,))
+                self._db.execute("DELETE FROM chunks WHERE key = ?", (key,))
+            for record in records:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?)",
+                    (
+                        record.key,
+                        record.etag,
+                        record.last_modified,
+                        len(record.chunks),
+                        now,
+                    ),
+                )
+                self._db.execute("DELETE FROM chunks WHERE key = ?", (record.key,))
+                self._db.executemany(
+                    "INSERT INTO chunks VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            record.key,
+                            index,
+                            chunk.chunk_hash,
+                            chunk.point_id,
+                            json.dumps(chunk.graph_rows),
+                        )
+                        for index, chunk in record.chunks.items()
+                    ],
+                )
+            if checkpoint is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES ('default', ?, ?)",
+                    (checkpoint, now),
+                )
+
+    def checkpoint(self) -> Optional[str]:
+        row = self._db.execute(
+            "SELECT last_key FROM checkpoints WHERE name = 'default'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def clear_checkpoint(self):
+        with self._db:
+            self._db.execute("DELETE FROM checkpoints WHERE name = 'default'")
+
+    def close(self):
+        self._db.close()
+
+
+class CheckpointTracker:
+    """
+    Tracks the low-water mark of a listing processed out of order: the largest
+    listed key such that it and every key before it are skipped or committed.
+    """
+
+    def __init__(self, start_after: Optional[str] = None):
+        self._inflight: Deque[Tuple[str, Optional[str]]] = deque()
+        self._done: Set[str] = set()
+        self._last_listed = start_after
+
+    def listed(self, key: str, dispatched: bool):
+        if dispatched:
+            self._inflight.append((key, self._last_listed))
+        self._last_listed = key
+
+    def committed(self, keys: Iterable[str]):
+        self._done.update(keys)
+        while self._inflight and self._inflight[0][0] in self._done:
+            self._done.discard(self._inflight.popleft()[0])
+
+    @property
+    def low_water_mark(self) -> Optional[str]:
+        if self._inflight:
+            return self._inflight[0][1]
+        return self._last_listed
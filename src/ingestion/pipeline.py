@@ -1,44 +1,690 @@
+import argparse
+import asyncio
+import hashlib
+import os
 import time
-from typing import List, Dict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.cache.invalidation import notify_documents_changed
+from src.embeddings.service import EmbeddingService, get_embedding_service
+from src.ingestion.chunking import TokenChunker
+from src.ingestion.extraction import (
+    EntityResolver,
+    Extraction,
+    LLMExtractor,
+    RuleExtractor,
+    get_gazetteer,
+)
+from src.ingestion.manifest import (
+    CheckpointTracker,
+    ChunkRecord,
+    IngestionManifest,
+    ObjectRecord,
+)
+from src.ingestion.stages import Stage, StageStats, StreamingPipeline
+from src.ingestion.writers import Neo4jBulkWriter, QdrantBulkWriter, point_id
+from src.retrieval.graph import close_driver, ensure_schema, get_driver
+from src.retrieval.vector import close_client, ensure_collection, get_qdrant_client
 from src.utils.logger import logger
 
 
+@dataclass
+class ObjectInfo:
+    key: str
+    etag: str
+    last_modified: float = 0.0
+
+
+@dataclass
+class Document:
+    id: str
+    text: str
+    etag: str = ""
+    last_modified: Optional[float] = None
+
+
+@dataclass
+class Chunk:
+    doc_id: str
+    index: int
+    text: str
+    vector: Optional[np.ndarray] = None
+    content_hash: str = ""
+    start: int = 0  # character offsets into the document
+    end: int = 0
+    token_count: int = 0
+
+    @property
+    def source(self) -> str:
+        return chunk_source(self.doc_id, self.index)
+
+
+def chunk_source(doc_id: str, index: int) -> str:
+    # Provenance id recorded on the graph nodes and edges a chunk mentions
+    return f"{doc_id}#{index}"
+
+
 class MockS3Fetcher:
+    def __init__(
+        self,
+        objects: Optional[Dict[str, str]] = None,
+        last_modified: Optional[Dict[str, float]] = None,
+    ):
+        self.objects = objects or {
+            "raw/doc-1.txt": "Doc 1 content...",
+            "raw/doc-2.txt": "Doc 2 content...",
+        }
+        self.last_modified = last_modified or {}
+
+    def _info(self, key: str) -> ObjectInfo:
+        # S3 reports the MD5 of the body as the ETag of a single-part upload
+        etag = hashlib.md5(self.objects[key].encode()).hexdigest()
+        return ObjectInfo(key, etag, self.last_modified.get(key, 0.0))
+
+    def list_objects(
+        self, bucket: str, prefix: str, start_after: Optional[str] = None
+    ) -> Iterator[ObjectInfo]:
+        """
+        Lists objects lazily in key order, like S3 ListObjectsV2 (which pages
+        through 1000 at a time and supports StartAfter).
+        """
+        logger.info("Fetching from s3://%s/%s...", bucket, prefix)
+        return (
+            self._info(key)
+            for key in sorted(self.objects)
+            if key.startswith(prefix) and (start_after is None or key > start_after)
+        )
+
+    def list_keys(self, bucket: str, prefix: str) -> Iterator[str]:
+        return (info.key for info in self.list_objects(bucket, prefix))
+
+    async def fetch(self, bucket: str, key: str) -> Document:
+        # With boto3/aioboto3: (await s3.get_object(Bucket=bucket, Key=key))["Body"]
+        info = self._info(key)
+        return Document(key, self.objects[key], info.etag, info.last_modified)
+
     def fetch_documents(self, bucket: str, prefix: str):
-        logger.info(f"Fetching from s3://{bucket}/{prefix}...")
-        return ["Doc 1 content...", "Doc 2 content..."]
+        return [self.objects[key] for key in self.list_keys(bucket, prefix)]
+
+
+# --- Stage functions ---
+# CPU-bound stage functions run in worker processes, so they live at module level.
+# What they need beyond their input is set up once per worker by init_worker.
+
+_worker: Dict[str, Any] = {}
+
+
+def init_worker(
+    chunker: Optional[TokenChunker],
+    extractor: Optional[RuleExtractor],
+    service: Optional[EmbeddingService] = None,
+):
+    """
+    Executor initializer: stores the chunker, extractor and embedding service
+    in the worker, so they are pickled once per worker instead of with every
+    item. Without `service` the worker loads the process-wide one itself.
+    """
+    _worker.update(chunker=chunker, extractor=extractor, service=service)
+
+
+def chunk_document(
+    doc: Document, chunker: Optional[TokenChunker] = None
+) -> List[Tuple[Document, List[Chunk]]]:
+    # One item per document: the diff stage needs all of a document's chunks
+    chunker = chunker or _worker.get("chunker") or TokenChunker()
+    chunks = []
+    for span in chunker.spans(doc.id, doc.text):
+        text = span.text(doc.text)
+        chunks.append(
+            Chunk(
+                doc_id=doc.id,
+                index=span.index,
+                text=text,
+                content_hash=hashlib.sha1(text.encode()).hexdigest(),
+                start=span.start,
+                end=span.end,
+                token_count=span.token_count,
+            )
+        )
+    return [(doc, chunks)]
+
+
+def embed_chunks(
+    chunks: List[Chunk], service: Optional[EmbeddingService] = None
+) -> List[Chunk]:
+    # Vectors travel with the chunks to the upsert stage. Chunks embedded by any
+    # earlier run or worker come straight from the shared on-disk cache.
+    service = service or _worker.get("service") or get_embedding_service()
+    vectors = service.embed([chunk.text for chunk in chunks])
+    for chunk, vector in zip(chunks, vectors):
+        chunk.vector = vector
+    return chunks
+
+
+def extract_entities(
+    chunk: Chunk, extractor: Optional[RuleExtractor] = None
+) -> Extraction:
+    # Names as written in the chunk; the merge stage resolves them to entity
+    # keys across its whole batch. No extractor, no extraction.
+    return extractor.extract(chunk.text) if extractor is not None else Extraction()
+
+
+def extract_chunk(
+    chunk: Chunk, extractor: Optional[RuleExtractor] = None
+) -> List[Tuple[str, int, Extraction]]:
+    # Keeps the extraction tagged with its chunk so the manifest can record its rows
+    extractor = extractor or _worker.get("extractor")
+    return [(chunk.doc_id, chunk.index, extract_entities(chunk, extractor))]
+
+
+def retraction(row: tuple) -> tuple:
+    kind, fields_ = row
+    if kind == "entity":
+        return ("retract_entity", {"key": fields_["key"], "source": fields_["source"]})
+    keep = ("src", "dst", "type", "source")
+    return ("retract_relation", {k: fields_[k] for k in keep})
+
 
+async def upsert_chunks(chunks: List[Chunk]):
+    # self.qdrant_client.upsert(...)
+    logger.info("Ingested %d chunks to Qdrant.", len(chunks))
 
-class TextChunker:
-    def chunk(self, text: str):
-        return [text[i : i + 100] for i in range(0, len(text), 100)]
+
+async def merge_entities(entities: List[tuple]):
+    # self.neo4j_session.run(...)
+    logger.info("Ingested %d entities/relations to Neo4j.", len(entities))
+
+
+@dataclass
+class PipelineConfig:
+    """
+    Per-stage parallelism and batching. Defaults come from INGEST_* env vars.
+    """
+
+    queue_size: int = 64
+    fetch_workers: int = 8
+    chunk_workers: int = 2
+    embed_workers: int = 2
+    embed_batch: int = 64
+    upsert_workers: int = 2
+    upsert_batch: int = 256
+    extract_workers: int = 2
+    extract_mode: str = "rules"  # "rules", "llm" or "none"
+    extract_batch: int = 16  # chunks per LLM request in "llm" mode
+    merge_workers: int = 1
+    merge_batch: int = 256
+    cpu_executor: str = "process"  # "process" or "thread"
+    cpu_processes: Optional[int] = None
+    checkpoint_every: int = 256  # finished documents per manifest commit
+    chunk_max_tokens: Optional[int] = None  # None: CHUNK_MAX_TOKENS
+    chunk_overlap_tokens: Optional[int] = None  # None: CHUNK_OVERLAP_TOKENS
+
+    @classmethod
+    def from_env(cls) -> "PipelineConfig":
+        config = cls()
+        for f in fields(cls):
+            value = os.getenv(f"INGEST_{f.name.upper()}")
+            if value is not None:
+                text = isinstance(getattr(config, f.name), str)
+                setattr(config, f.name, value if text else int(value))
+        if config.cpu_executor not in ("process", "thread"):
+            raise ValueError(f"Unknown INGEST_CPU_EXECUTOR {config.cpu_executor!r}")
+        if config.extract_mode not in ("rules", "llm", "none"):
+            raise ValueError(f"Unknown INGEST_EXTRACT_MODE {config.extract_mode!r}")
+        return config
+
+
+@dataclass
+class _PendingObject:
+    record: ObjectRecord
+    outstanding: int  # changed chunks not yet handed to both sinks
 
 
 class IngestionPipeline:
-    def __init__(self):
-        # Initialize clients for Neo4j and Qdrant here
-        pass
+    """
+    Streaming ETL from object storage into Qdrant and Neo4j:
+
+        fetch -> chunk -> diff -> embed -> upsert (Qdrant)
+                              \\-> extract -> merge (Neo4j)
+
+    Stages are connected by bounded queues, so memory stays flat no matter how
+    large the bucket is; CPU stages run in a process pool, I/O stages as async
+    workers on the event loop.
+
+    `extract` finds entity and relation mentions per chunk, with rules and the
+    gazetteer (in the process pool) or with batched LLM calls. `merge`
+    resolves each batch's names to entity keys through the run's alias index,
+    then hands one row per distinct entity and edge per chunk to the writer.
+
+    With a manifest, ingestion is incremental: objects whose ETag is unchanged are
+    not even fetched, and `diff` forwards only chunks whose content hash changed,
+    deleting the Qdrant points of chunks that disappeared and retracting the graph
+    mentions of chunks that changed. Recorded objects missing from the listing
+    were deleted from the bucket: their points are deleted and their graph
+    mentions retracted. An object is recorded in (or forgotten by) the manifest
+    only once its writes have been flushed, so an interrupted run redoes at most
+    the objects since the last commit.
+    """
+
+    def __init__(
+        self,
+        bucket: str = "enterprise-data",
+        prefix: str = "raw",
+        fetcher: MockS3Fetcher = None,
+        config: PipelineConfig = None,
+        qdrant_writer: Optional[QdrantBulkWriter] = None,
+        neo4j_writer: Optional[Neo4jBulkWriter] = None,
+        manifest: Optional[IngestionManifest] = None,
+        embedding_service: Optional[EmbeddingService] = None,
+        resolver: Optional[EntityResolver] = None,
+    ):
+        # Without writers the sinks only log what they would have written, and
+        # nothing is recorded in the manifest (a later run with writers must not
+        # skip what was never stored); without a manifest every object is
+        # ingested in full.
+        self.bucket = bucket
+        self.prefix = prefix
+        self.fetcher = fetcher or MockS3Fetcher()
+        self.config = config or PipelineConfig.from_env()
+        self.qdrant_writer = qdrant_writer
+        self.neo4j_writer = neo4j_writer
+        self.manifest = manifest
+        self.embedding_service = embedding_service or get_embedding_service()
+        gazetteer = get_gazetteer()
+        self.extractor = (
+            RuleExtractor(gazetteer) if self.config.extract_mode != "none" else None
+        )
+        self.resolver = resolver or EntityResolver(gazetteer)
+        self.records = (
+            manifest is not None
+            and qdrant_writer is not None
+            and neo4j_writer is not None
+        )
+        if manifest is not None and not self.records:
+            logger.warning(
+                "Ingesting without both Qdrant and Neo4j writers: "
+                "the manifest is read but not updated"
+            )
+        self.counts: Dict[str, int] = {}
+
+    def build(self) -> Stage:
+        c = self.config
+        # CPU stages find their chunker, extractor and service in the worker;
+        # see _executor
+        fetch = Stage("fetch", self._fetch, workers=c.fetch_workers)
+        chunk = Stage("chunk", chunk_document, workers=c.chunk_workers, cpu=True)
+        diff = Stage("diff", self._diff)
+        embed = Stage(
+            "embed",
+            embed_chunks,
+            workers=c.embed_workers,
+            cpu=True,
+            batch_size=c.embed_batch,
+        )
+        upsert = Stage(
+            "upsert", self._upsert, workers=c.upsert_workers, batch_size=c.upsert_batch
+        )
+        if c.extract_mode == "llm":
+            extract = Stage(
+                "extract",
+                self._extract_llm,
+                workers=c.extract_workers,
+                batch_size=c.extract_batch,
+            )
+        else:
+            extract = Stage(
+                "extract", extract_chunk, workers=c.extract_workers, cpu=True
+            )
+        merge = Stage(
+            "merge", self._merge, workers=c.merge_workers, batch_size=c.merge_batch
+        )
+        fetch.to(chunk)
+        chunk.to(diff)
+        diff.to(embed, extract)
+        embed.to(upsert)
+        extract.to(merge)
+        return fetch
+
+    async def _fetch(self, info: ObjectInfo) -> List[Document]:
+        return [await self.fetcher.fetch(self.bucket, info.key)]
+
+    async def _diff(self, item: Tuple[Document, List[Chunk]]) -> List[Chunk]:
+        doc, chunks = item
+        old = self.manifest.chunks(doc.id) if self.manifest else {}
+        record = ObjectRecord(doc.id, doc.etag, doc.last_modified, {})
+        changed = []
+        for chunk in chunks:
+            previous = old.get(chunk.index)
+            if (
+                not self._full
+                and previous is not None
+                and previous.chunk_hash == chunk.content_hash
+            ):
+                record.chunks[chunk.index] = previous
+            else:
+                record.chunks[chunk.index] = ChunkRecord(
+                    chunk.content_hash, point_id(doc.id, chunk.index)
+                )
+                changed.append(chunk)
 
-    def run(self):
+        # Changed chunks keep their point id and are overwritten by the upsert;
+        # chunks past the new end are deleted outright.
+        removed = [old[i].point_id for i in old if i not in record.chunks]
+        if removed and self.qdrant_writer is not None:
+            await self.qdrant_writer.delete(removed)
+        retractions = [
+            retraction(row)
+            for i, previous in old.items()
+            if record.chunks.get(i) is not previous
+            for row in previous.graph_rows
+        ]
+        # Queued ahead of the chunk's new rows, and the writer preserves order
+        if retractions and self.neo4j_writer is not None:
+            await self.neo4j_writer.add(retractions)
+
+        self.counts["changed_chunks"] += len(changed)
+        self.counts["unchanged_chunks"] += len(chunks) - len(changed)
+        self.counts["deleted_chunks"] += len(removed)
+        self._pending[doc.id] = _PendingObject(record, 2 * len(changed))
+        if not changed:
+            await self._handed_off(doc.id, 0)
+        return changed
+
+    async def _upsert(self, chunks: List[Chunk]):
+        if self.qdrant_writer is None:
+            await upsert_chunks(chunks)
+        else:
+            await self.qdrant_writer.add(
+                {
+                    "id": point_id(chunk.doc_id, chunk.index),
+                    "vector": chunk.vector.tolist(),
+                    "payload": {
+                        "doc_id": chunk.doc_id,
+                        "chunk_index": chunk.index,
+                        "start": chunk.start,
+                        "end": chunk.end,
+                        "token_count": chunk.token_count,
+                        "text": chunk.text,
+                    },
+                }
+                for chunk in chunks
+            )
+        for chunk in chunks:
+            await self._handed_off(chunk.doc_id, 1)
+
+    async def _extract_llm(
+        self, chunks: List[Chunk]
+    ) -> List[Tuple[str, int, Extraction]]:
+        extractions = await LLMExtractor(self.extractor).aextract_many(
+            [chunk.text for chunk in chunks]
+        )
+        return [
+            (chunk.doc_id, chunk.index, extraction)
+            for chunk, extraction in zip(chunks, extractions)
+        ]
+
+    async def _merge(self, extracted: List[Tuple[str, int, Extraction]]):
+        # Every name in the batch is resolved before anything is written
+        resolved = self.resolver.resolve(
+            [
+                (chunk_source(doc_id, index), extraction)
+                for doc_id, index, extraction in extracted
+            ]
+        )
+        rows = [row for chunk_rows in resolved for row in chunk_rows]
+        if self.neo4j_writer is None:
+            await merge_entities(rows)
+        else:
+            await self.neo4j_writer.add(rows)
+        for (doc_id, index, _), chunk_rows in zip(extracted, resolved):
+            record = self._pending[doc_id].record
+            record.chunks[index].graph_rows = [list(row) for row in chunk_rows]
+            await self._handed_off(doc_id, 1)
+
+    async def _handed_off(self, doc_id: str, n: int):
+        pending = self._pending[doc_id]
+        pending.outstanding -= n
+        if pending.outstanding == 0:
+            self._finished.append(self._pending.pop(doc_id).record)
+            if len(self._finished) >= self.config.checkpoint_every:
+                await self._commit()
+
+    async def _commit(self, final: bool = False):
+        """
+        Flushes the writers, then records every object handed off before the
+        flush in the manifest and advances the resume checkpoint.
+        """
+        async with self._commit_lock:
+            finished, self._finished = self._finished, []
+            deleted, self._deleted = self._deleted, []
+            for writer in (self.qdrant_writer, self.neo4j_writer):
+                if writer is not None:
+                    await (writer.close() if final else writer.flush())
+            if not self.records:
+                return
+            self._tracker.committed(record.key for record in finished)
+            self.manifest.commit(
+                finished, checkpoint=self._tracker.low_water_mark, deleted=deleted
+            )
+            if final:
+                self.manifest.clear_checkpoint()
+
+    def _executor(self) -> Executor:
+        c = self.config
+        chunker = TokenChunker(c.chunk_max_tokens, c.chunk_overlap_tokens)
+        # The process-wide service (and its model) is not shipped: each worker
+        # loads its own from the same settings and shares the on-disk cache
+        service = self.embedding_service
+        if service is get_embedding_service():
+            service = None
+        initargs = (chunker, self.extractor, service)
+        if c.cpu_executor == "thread":
+            return ThreadPoolExecutor(
+                max_workers=c.cpu_processes, initializer=init_worker, initargs=initargs
+            )
+        return ProcessPoolExecutor(
+            max_workers=c.cpu_processes, initializer=init_worker, initargs=initargs
+        )
+
+    async def _retract_object(self, key: str):
+        # The object was deleted from the bucket: so is everything it wrote
+        old = self.manifest.chunks(key)
+        removed = [chunk.point_id for chunk in old.values()]
+        if removed and self.qdrant_writer is not None:
+            await self.qdrant_writer.delete(removed)
+        retractions = [
+            retraction(row) for chunk in old.values() for row in chunk.graph_rows
+        ]
+        if retractions and self.neo4j_writer is not None:
+            await self.neo4j_writer.add(retractions)
+        self.counts["deleted_objects"] += 1
+        self.counts["deleted_chunks"] += len(removed)
+        self._deleted.append(key)
+
+    async def _objects(
+        self, since: Optional[float], start_after: Optional[str]
+    ) -> AsyncIterator[ObjectInfo]:
+        # Both the listing and the manifest are in key order, so recorded keys
+        # the listing passes over are the deleted objects. Objects this run
+        # commits meanwhile were listed already and must not be seen again.
+        recorded = iter(())
+        if self.manifest is not None:
+            recorded = self.manifest.keys(self.prefix, start_after, before=time.time())
+        expected = next(recorded, None)
+        for info in self.fetcher.list_objects(self.bucket, self.prefix, start_after):
+            while expected is not None and expected < info.key:
+                await self._retract_object(expected)
+                expected = next(recorded, None)
+            if expected == info.key:
+                expected = next(recorded, None)
+            self.counts["listed"] += 1
+            unchanged = (since is not None and info.last_modified < since) or (
+                not self._full
+                and self.manifest is not None
+                and self.manifest.etag(info.key) == info.etag
+            )
+            self._tracker.listed(info.key, dispatched=not unchanged)
+            if unchanged:
+                self.counts["skipped"] += 1
+                continue
+            yield info
+        while expected is not None:
+            await self._retract_object(expected)
+            expected = next(recorded, None)
+
+    async def arun(
+        self, since: Optional[float] = None, resume: bool = False, full: bool = False
+    ) -> Dict[str, StageStats]:
+        """
+        `since` skips objects last modified before that Unix time; `resume` lists
+        only keys after the checkpoint left by an interrupted run; `full` re-ingests
+        every chunk but still cleans up after, and records into, the manifest.
+        """
         logger.info("Starting ingestion pipeline...")
-        fetcher = MockS3Fetcher()
-        chunker = TextChunker()
+        start = time.perf_counter()
+        if self.neo4j_writer is not None:
+            # Indexes must exist before MERGEs, and before retrieval relies on them
+            await asyncio.to_thread(
+                ensure_schema, self.neo4j_writer.driver, self.neo4j_writer.database
+            )
+        if self.qdrant_writer is not None:
+            # Filtered search needs the payload indexes on the filtered fields
+            await ensure_collection(
+                self.qdrant_writer.client,
+                self.qdrant_writer.collection_name,
+                self.embedding_service.dim,
+            )
+        start_after = self.manifest.checkpoint() if resume and self.manifest else None
+        if start_after:
+            logger.info("Resuming after %s", start_after)
+        self.counts = dict.fromkeys(
+            (
+                "listed",
+                "skipped",
+                "deleted_objects",
+                "changed_chunks",
+                "unchanged_chunks",
+                "deleted_chunks",
+            ),
+            0,
+        )
+        self._pending: Dict[str, _PendingObject] = {}
+        self._finished: List[ObjectRecord] = []
+        self._deleted: List[str] = []
+        self._commit_lock = asyncio.Lock()
+        self._tracker = CheckpointTracker(start_after)
+        self._full = full
+        with self._executor() as executor:
+            pipeline = StreamingPipeline(
+                self.build(), executor, queue_size=self.config.queue_size
+            )
+            stats = await pipeline.run(self._objects(since, start_after))
+        await self._commit(final=True)
+
+        logger.info(
+            "Ingestion finished in %.2fs: %d objects listed, %d unchanged, "
+            "%d deleted; %d chunks (re)ingested, %d unchanged, %d deleted.",
+            time.perf_counter() - start,
+            self.counts["listed"],
+            self.counts["skipped"],
+            self.counts["deleted_objects"],
+            self.counts["changed_chunks"],
+            self.counts["unchanged_chunks"],
+            self.counts["deleted_chunks"],
+        )
+        if self.resolver.stats["mentions"]:
+            logger.info(
+                "Resolved %d entity mentions to %d entities (%d aliases learned), "
+                "%d graph rows.",
+                self.resolver.stats["mentions"],
+                len(self.resolver.entities),
+                self.resolver.stats["aliases"],
+                self.resolver.stats["rows"],
+            )
+        # Cached answers may now be stale
+        if stats["fetch"].items_in or self.counts["deleted_objects"]:
+            notify_documents_changed()
+        return stats
+
+    def run(
+        self, since: Optional[float] = None, resume: bool = False, full: bool = False
+    ) -> Dict[str, StageStats]:
+        return asyncio.run(self.arun(since=since, resume=resume, full=full))
+
+
+def _parse_since(value: str) -> float:
+    # Unix seconds or an ISO 8601 date/time (UTC unless it carries an offset)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
 
-        docs = fetcher.fetch_documents("enterprise-data", "raw")
 
-        for doc in docs:
-            chunks = chunker.chunk(doc)
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Incrementally ingest a bucket prefix into Qdrant and Neo4j."
+    )
+    parser.add_argument("--bucket", default="enterprise-data")
+    parser.add_argument("--prefix", default="raw")
+    parser.add_argument(
+        "--since",
+        type=_parse_since,
+        help="only objects modified at or after this time (ISO 8601 or Unix seconds)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted run from its last checkpoint",
+    )
+    parser.add_argument(
+        "--manifest", help="manifest path (default: $INGEST_MANIFEST_PATH)"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="re-ingest every chunk, even those the manifest has seen",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="log what would be written instead of writing to Qdrant and Neo4j; "
+        "the manifest is not updated",
+    )
+    args = parser.parse_args(argv)
+    asyncio.run(_run_cli(args))
 
-            # 1. Embedding -> Qdrant
-            # self.qdrant_client.upsert(...)
-            logger.info(f"Ingested {len(chunks)} chunks to Qdrant.")
 
-            # 2. Entity Extraction -> Neo4j
-            # entities = extract_entities(doc)
-            # self.neo4j_session.run(...)
-            logger.info(f"Ingested entities/relations to Neo4j.")
+async def _run_cli(args: argparse.Namespace):
+    writers = {}
+    if not args.dry_run:
+        # Same connection settings (QDRANT_*, NEO4J_*) as the API
+        writers = {
+            "qdrant_writer": QdrantBulkWriter(
+                get_qdrant_client(), os.getenv("QDRANT_COLLECTION", "enterprise_docs")
+            ),
+            "neo4j_writer": Neo4jBulkWriter(
+                get_driver(), database=os.getenv("NEO4J_DATABASE") or None
+            ),
+        }
+    manifest = IngestionManifest(args.manifest)
+    pipeline = IngestionPipeline(args.bucket, args.prefix, manifest=manifest, **writers)
+    try:
+        await pipeline.arun(since=args.since, resume=args.resume, full=args.full)
+    finally:
+        manifest.close()
+        if writers:
+            await close_client()
+            close_driver()
 
 
 if __name__ == "__main__":
-    pipeline = IngestionPipeline()
-    pipeline.run()
+    main()
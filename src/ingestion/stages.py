@@ -0,0 +1,169 @@
+import asyncio
+import inspect
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, Callable, Dict, Iterable, List, Optional
+
+from src.utils.logger import logger
+
+_DONE = object()  # end-of-stream marker, one per downstream worker
+
+
+@dataclass
+class StageStats:
+    name: str
+    items_in: int = 0
+    items_out: int = 0
+    busy_s: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    max_queue_depth: int = 0
+
+    @property
+    def wall_s(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        return self.items_in / self.wall_s if self.wall_s else 0.0
+
+
+@dataclass(eq=False)
+class Stage:
+    """
+    One step of a streaming pipeline.
+
+    `fn` maps one input (or a list of `batch_size` inputs) to an iterable of outputs,
+    which are forwarded to every downstream stage. CPU-bound stages run `fn` in the
+    pipeline's executor (a process pool by default) and must therefore be picklable
+    module-level functions; I/O stages may be coroutines and run on the event loop.
+    Each stage reads from a bounded queue, so a slow stage applies backpressure to
+    everything upstream of it.
+    """
+
+    name: str
+    fn: Callable[[Any], Optional[Iterable[Any]]]
+    workers: int = 1
+    cpu: bool = False
+    batch_size: int = 1
+    queue_size: Optional[int] = None
+    downstream: List["Stage"] = field(default_factory=list, repr=False)
+    stats: StageStats = field(init=False)
+
+    def __post_init__(self):
+        self.stats = StageStats(self.name)
+        self._upstreams = 0
+        self._queue: asyncio.Queue = None
+
+    def to(self, *stages: "Stage") -> "Stage":
+        for stage in stages:
+            self.downstream.append(stage)
+            stage._upstreams += 1
+        return self
+
+    async def _emit(self, outputs: Optional[Iterable[Any]]):
+        for output in outputs or ():
+            self.stats.items_out += 1
+            for stage in self.downstream:
+                await stage._queue.put(output)
+                depth = stage._queue.qsize()
+                if depth > stage.stats.max_queue_depth:
+                    stage.stats.max_queue_depth = depth
+
+    async def _process(self, items: List[Any], executor: Executor):
+        arg = items if self.batch_size > 1 else items[0]
+        start = time.perf_counter()
+        if self.stats.started_at is None:
+            self.stats.started_at = start
+        if self.cpu:
+            outputs = await asyncio.get_running_loop().run_in_executor(
+                executor, self.fn, arg
+            )
+        else:
+            outputs = self.fn(arg)
+            if inspect.isawaitable(outputs):
+                outputs = await outputs
+        self.stats.busy_s += time.perf_counter() - start
+        self.stats.items_in += len(items)
+        await self._emit(outputs)
+
+    async def _work(self, executor: Executor):
+        batch = []
+        while True:
+            item = await self._queue.get()
+            if item is _DONE:
+                break
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                await self._process(batch, executor)
+                batch = []
+        if batch:
+            await self._process(batch, executor)
+
+
+class StreamingPipeline:
+    """
+    Runs a DAG of stages connected by bounded queues, fed from an async source.
+    """
+
+    def __init__(self, head: Stage, executor: Executor, queue_size: int = 64):
+        self.head = head
+        self.executor = executor
+        self.queue_size = queue_size
+
+    def stages(self) -> List[Stage]:
+        ordered, pending = [], [self.head]
+        while pending:
+            stage = pending.pop(0)
+            if stage not in ordered:
+                ordered.append(stage)
+                pending.extend(stage.downstream)
+        return ordered
+
+    async def _run_stage(self, stage: Stage, finished: Dict[str, int]):
+        await asyncio.gather(
+            *(stage._work(self.executor) for _ in range(stage.workers))
+        )
+        stage.stats.finished_at = time.perf_counter()
+        for child in stage.downstream:
+            # A stage with several parents only ends once all of them have ended
+            finished[child.name] += 1
+            if finished[child.name] == child._upstreams:
+                for _ in range(child.workers):
+                    await child._queue.put(_DONE)
+
+    async def run(self, source: AsyncIterable[Any]) -> Dict[str, StageStats]:
+        stages = self.stages()
+        for stage in stages:
+            stage._queue = asyncio.Queue(maxsize=stage.queue_size or self.queue_size)
+        finished = {stage.name: 0 for stage in stages}
+
+        async def feed():
+            async for item in source:
+                await self.head._queue.put(item)
+            for _ in range(self.head.workers):
+                await self.head._queue.put(_DONE)
+
+        tasks = [asyncio.ensure_future(feed())]
+        tasks += [asyncio.ensure_future(self._run_stage(s, finished)) for s in stages]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        for stage in stages:
+            logger.info(
+                "Stage %s: %d in / %d out, %.1f items/s, busy %.2fs, peak queue %d",
+                stage.name,
+                stage.stats.items_in,
+                stage.stats.items_out,
+                stage.stats.throughput,
+                stage.stats.busy_s,
+                stage.stats.max_queue_depth,
+            )
+        return {stage.name: stage.stats for stage in stages}
@@ -0,0 +1,299 @@
+import asyncio
+import functools
+import inspect
+import os
+import re
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.cache.invalidation import notify_entities_changed
+from src.utils.logger import logger
+
+# Fixed namespace so a chunk always maps to the same Qdrant point id across runs
+POINT_NAMESPACE = uuid.UUID("5b0c1a43-5c8e-4c43-9f0e-6f3d2a8f1c17")
+
+_REL_TYPE = re.compile(r"^[A-Z][A-Z0-9_]*$")
+
+# Nodes and edges record the chunks that mention them in `sources`, so a
+# re-ingested chunk can retract exactly what it contributed. A batch sends one
+# row per node or edge, carrying all of the batch's sources for it.
+MERGE_ENTITIES = """
+UNWIND $rows AS row
+MERGE (e:Entity {key: row.key})
+ON CREATE SET e.name = row.name, e.label = row.label
+WITH e, [s IN row.sources WHERE NOT s IN coalesce(e.sources, [])] AS added
+WHERE size(added) > 0
+SET e.sources = coalesce(e.sources, []) + added
+"""
+
+# An entity no chunk mentions any more is deleted, with any edges left on it
+RETRACT_ENTITIES = """
+UNWIND $rows AS row
+MATCH (e:Entity {key: row.key})
+SET e.sources = [s IN coalesce(e.sources, []) WHERE s <> row.source]
+WITH e
+WHERE size(e.sources) = 0
+DETACH DELETE e
+"""
+
+
+def _checked_rel_type(rel_type: str) -> str:
+    # Relationship types cannot be query parameters, so they are validated instead
+    if not _REL_TYPE.match(rel_type):
+        raise ValueError(f"Invalid relationship type {rel_type!r}")
+    return rel_type
+
+
+def merge_relations_cypher(rel_type: str) -> str:
+    return f"""
+UNWIND $rows AS row
+MATCH (a:Entity {{key: row.src}})
+MATCH (b:Entity {{key: row.dst}})
+MERGE (a)-[r:{_checked_rel_type(rel_type)}]->(b)
+WITH r, [s IN row.sources WHERE NOT s IN coalesce(r.sources, [])] AS added
+WHERE size(added) > 0
+SET r.sources = coalesce(r.sources, []) + added
+"""
+
+
+def retract_relations_cypher(rel_type: str) -> str:
+    # An edge no chunk mentions any more is deleted outright
+    return f"""
+UNWIND $rows AS row
+MATCH (:Entity {{key: row.src}})-[r:{_checked_rel_type(rel_type)}]->(:Entity {{key: row.dst}})
+SET r.sources = [s IN coalesce(r.sources, []) WHERE s <> row.source]
+WITH r
+WHERE size(r.sources) = 0
+DELETE r
+"""
+
+
+def point_id(doc_id: str, chunk_index: int) -> str:
+    """
+    Deterministic point id: re-ingesting a chunk overwrites it instead of duplicating.
+    """
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{doc_id}#{chunk_index}"))
+
+
+class BulkWriter:
+    """
+    Buffers rows and writes them in batches.
+
+    A batch is flushed when `batch_size` rows are buffered or the oldest buffered row
+    is `flush_interval_s` old, whichever comes first. Failed flushes are retried with
+    exponential backoff, so writes must be idempotent.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = None,
+        flush_interval_s: float = None,
+        max_retries: int = None,
+        backoff_s: float = 0.5,
+    ):
+        self.batch_size = batch_size or int(os.getenv("INGEST_WRITE_BATCH", "512"))
+        self.flush_interval_s = flush_interval_s or float(
+            os.getenv("INGEST_WRITE_FLUSH_S", "2.0")
+        )
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(os.getenv("INGEST_WRITE_RETRIES", "3"))
+        )
+        self.backoff_s = backoff_s
+        self.stats = {"rows": 0, "batches": 0, "retries": 0}
+        self._buffer: List[Any] = []
+        self._oldest: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._timer: Optional[asyncio.Task] = None
+
+    async def _write(self, batch: List[Any]):
+        raise NotImplementedError
+
+    async def add(self, rows: Iterable[Any]):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._timer = asyncio.ensure_future(self._flush_periodically())
+        for row in rows:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size:
+                await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_s / 2)
+            if (
+                self._oldest
+                and time.monotonic() - self._oldest >= self.flush_interval_s
+            ):
+                await self.flush()
+
+    async def flush(self):
+        if self._lock is None:
+            return
+        async with self._lock:
+            while self._buffer:
+                batch = self._buffer[: self.batch_size]
+                await self._write_with_retries(batch)
+                del self._buffer[: len(batch)]
+            self._oldest = None
+
+    async def _write_with_retries(self, batch: List[Any]):
+        await self._retrying(self._write, batch)
+        self.stats["rows"] += len(batch)
+        self.stats["batches"] += 1
+
+    async def _retrying(self, fn, batch: List[Any]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await fn(batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(
+                        "%s: giving up on %d rows: %s",
+                        type(self).__name__,
+                        len(batch),
+                        e,
+                    )
+                    raise
+                self.stats["retries"] += 1
+                delay = self.backoff_s * (2**attempt)
+                logger.warning(
+                    "%s: write failed (%s); retrying in %.2fs",
+                    type(self).__name__,
+                    e,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        await self.flush()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._lock = None
+
+
+class QdrantBulkWriter(BulkWriter):
+    """
+    Batched Qdrant upserts. Rows are dicts with `id`, `vector` and `payload`.
+    With `wait=False` the server acknowledges once the batch is queued for indexing.
+    """
+
+    def __init__(self, client, collection_name: str, wait: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.collection_name = collection_name
+        self.wait = wait
+
+    async def _call(self, method: str, **kwargs):
+        fn = getattr(self.client, method)
+        call = functools.partial(
+            fn, collection_name=self.collection_name, wait=self.wait, **kwargs
+        )
+        if inspect.iscoroutinefunction(fn):  # AsyncQdrantClient
+            await call()
+        else:
+            await asyncio.to_thread(call)
+
+    async def _write(self, batch: List[Dict]):
+        from qdrant_client import models
+
+        points = [
+            models.PointStruct(
+                id=row["id"], vector=row["vector"], payload=row["payload"]
+            )
+            for row in batch
+        ]
+        await self._call("upsert", points=points)
+
+    async def delete(self, point_ids: List[str]):
+        """
+        Deletes points right away; they are never re-upserted in the same run,
+        so this need not be ordered with the buffered upserts.
+        """
+        from qdrant_client import models
+
+        async def delete(ids):
+            await self._call(
+                "delete", points_selector=models.PointIdsList(points=list(ids))
+            )
+
+        for i in range(0, len(point_ids), self.batch_size):
+            await self._retrying(delete, point_ids[i : i + self.batch_size])
+        self.stats["deleted"] = self.stats.get("deleted", 0) + len(point_ids)
+
+
+class Neo4jBulkWriter(BulkWriter):
+    """
+    Batched Neo4j writes as UNWIND ... MERGE statements, one transaction per batch.
+
+    Rows are ("entity", {key, name, label, source}) or
+    ("relation", {src, dst, type, source}), where `source` identifies the chunk
+    that mentions them. ("retract_entity", {key, source}) and
+    ("retract_relation", {src, dst, type, source}) remove a chunk's mentions;
+    nodes and edges left without any are deleted. Within a batch retractions
+    run first, so a re-extracted chunk that retracts and re-adds the same
+    mention ends up with it; entities are merged before the relations that
+    reference them. Mentions of the same node or edge are folded into one
+    UNWIND row with a `sources` list, so a hot entity mentioned by hundreds of
+    chunks costs one MERGE per batch, not one per mention.
+    """
+
+    def __init__(self, driver, database: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.driver = driver
+        self.database = database
+
+    @staticmethod
+    def _fold(target: Dict, key, row: Dict, fields_: tuple):
+        folded = target.get(key)
+        if folded is None:
+            folded = target[key] = {f: row[f] for f in fields_}
+            folded["sources"] = []
+        source = row.get("source")
+        if source is not None and source not in folded["sources"]:
+            folded["sources"].append(source)
+
+    @classmethod
+    def _write_tx(cls, tx, batch: List[tuple]):
+        entities, retracted_entities = {}, {}
+        relations, retracted_relations = defaultdict(dict), defaultdict(dict)
+        for kind, row in batch:
+            if kind == "entity":
+                cls._fold(entities, row["key"], row, ("key", "name", "label"))
+            elif kind == "relation":
+                key = (row["src"], row["dst"])
+                cls._fold(relations[row["type"]], key, row, ("src", "dst"))
+            elif kind == "retract_entity":
+                retracted_entities[(row["key"], row.get("source"))] = row
+            else:
+                key = (row["src"], row["dst"], row.get("source"))
+                retracted_relations[row["type"]][key] = row
+        for rel_type, rows in retracted_relations.items():
+            tx.run(retract_relations_cypher(rel_type), rows=list(rows.values()))
+        if retracted_entities:
+            tx.run(RETRACT_ENTITIES, rows=list(retracted_entities.values()))
+        if entities:
+            tx.run(MERGE_ENTITIES, rows=list(entities.values()))
+        for rel_type, rows in relations.items():
+            tx.run(merge_relations_cypher(rel_type), rows=list(rows.values()))
+
+    def _write_sync(self, batch: List[tuple]):
+        with self.driver.session(database=self.database) as session:
+            session.execute_write(self._write_tx, batch)
+
+    async def _write(self, batch: List[tuple]):
+        # The sync driver blocks on network I/O, so keep it off the event loop
+        await asyncio.to_thread(self._write_sync, batch)
+        touched = set()
+        for kind, row in batch:
+            if kind in ("entity", "retract_entity"):
+                touched.add(row["key"])
+            else:
+                touched.update((row["src"], row["dst"]))
+        notify_entities_changed(touched)
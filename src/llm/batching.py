@@ -0,0 +1,121 @@
+import asyncio
+import os
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+
+class DynamicBatcher:
+    """
+    Coalesces concurrent single-item calls into batched engine calls.
+
+    Equivalent to Ray Serve's `@serve.batch`, but usable outside a replica (tests,
+    CPU benchmarks). A batch is dispatched once `max_batch_size` items are queued or
+    `max_wait_s` has passed since its first item arrived. While up to
+    `max_concurrent_batches` batches execute, new arrivals keep queueing, so batches
+    fill up under load and stay small (low latency) when traffic is light.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = None,
+        max_wait_s: float = None,
+        max_concurrent_batches: int = 1,
+    ):
+        self.handler = handler
+        self.max_batch_size = max_batch_size or int(
+            os.getenv("LLM_BATCH_MAX_SIZE", "16")
+        )
+        self.max_wait_s = (
+            max_wait_s
+            if max_wait_s is not None
+            else float(os.getenv("LLM_BATCH_MAX_WAIT_S", "0.01"))
+        )
+        self.max_concurrent_batches = max_concurrent_batches
+        self.batch_sizes: Counter = Counter()
+        self._loop = None
+        self._queue: asyncio.Queue = None
+        self._worker: asyncio.Task = None
+        self._slots: asyncio.Semaphore = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or the previous loop is gone (tests create one per run)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = loop.create_task(self._collect())
+
+    async def submit(self, item: Any) -> Any:
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self):
+        while True:
+            batch: List[Tuple[Any, asyncio.Future]] = [await self._queue.get()]
+            try:
+                deadline = self._loop.time() + self.max_wait_s
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - self._loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(
+                            await asyncio.wait_for(self._queue.get(), remaining)
+                        )
+                    except asyncio.TimeoutError:
+                        break
+                # Top up with anything that arrived while we were waiting
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                await self._slots.acquire()
+            except asyncio.CancelledError:
+                # Worker stopped (e.g. loop shutdown) before dispatching the batch
+                for _, future in batch:
+                    future.cancel()
+                raise
+            self._loop.create_task(self._execute(batch))
+
+    async def _execute(self, batch: List[Tuple[Any, asyncio.Future]]):
+        live = [(item, future) for item, future in batch if not future.cancelled()]
+        try:
+            if not live:
+                return
+            self.batch_sizes[len(live)] += 1
+            results = await self.handler([item for item, _ in live])
+            if len(results) != len(live):
+                raise RuntimeError(
+                    f"Batch handler returned {len(results)} results "
+                    f"for {len(live)} items"
+                )
+            for (_, future), result in zip(live, results):
+                if not future.done():
+                    future.set_result(result)
+        except asyncio.CancelledError:
+            for _, future in live:
+                future.cancel()
+            raise
+        except BaseException as e:
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        batches = sum(self.batch_sizes.values())
+        items = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": items / batches if batches else 0.0,
+            "utilization": items / (batches * self.max_batch_size) if batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_s": self.max_wait_s,
+        }
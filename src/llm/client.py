@@ -1,54 +1,317 @@
-import os
-import requests
+import asyncio
 import json
+import os
+import threading
+import weakref
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from src.llm.prompts import PLANNER_SYSTEM_PROMPT, planner_prompt
 from src.utils.logger import logger
+from src.utils.resilience import breakers
+from src.utils.tracing import span
+
+MOCK_RESPONSE = "This is a mock LLM response because the Ray service is unreachable."
+
+# Errors that mean the Ray service is not there at all (vs. a slow or failing one)
+_UNREACHABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class _ConnectionPool:
+    """
+    Process-wide, size-bounded keep-alive pools shared by every LLMClient.
+
+    Async clients are bound to the event loop they were created on, so one is kept
+    per running loop (in production that is a single uvicorn loop per worker).
+    Identical in-flight async requests are coalesced into one upstream call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._inflight: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY_S", "30")),
+        )
+
+    @staticmethod
+    def _timeout() -> httpx.Timeout:
+        return httpx.Timeout(float(os.getenv("LLM_TIMEOUT_S", "10")))
+
+    def sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(
+                    limits=self._limits(), timeout=self._timeout()
+                )
+            return self._sync_client
+
+    def async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=self._limits(), timeout=self._timeout())
+            self._async_clients[loop] = client
+        return client
+
+    def inflight(self) -> Dict[Tuple, "asyncio.Future"]:
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(loop)
+        if inflight is None:
+            inflight = {}
+            self._inflight[loop] = inflight
+        return inflight
+
+    async def aclose(self):
+        """
+        Closes the pool bound to the current loop (call on application shutdown).
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+        self._inflight.pop(loop, None)
+
+    def close(self):
+        with self._lock:
+            if self._sync_client is not None:
+                self._sync_client.close()
+                self._sync_client = None
+
+
+_pool = _ConnectionPool()
+
+
+async def aclose_pool():
+    await _pool.aclose()
+
+
+def close_pool():
+    _pool.close()
 
 
 class LLMClient:
     """
     Client to interact with the local Ray Serve LLM endpoint.
+
+    Instances are cheap handles: connections live in a process-wide pool and are
+    reused across requests, so creating a client per query costs nothing.
     """
 
     def __init__(self, base_url: str = None):
         self.base_url = base_url or os.getenv("RAY_SERVE_URL", "http://localhost:8000")
         self.endpoint = f"{self.base_url}/generate"
+        self.stream_endpoint = f"{self.base_url}/generate_stream"
+        self.batch_endpoint = f"{self.base_url}/generate_batch"
 
-    def generate(self, prompt: str, system_prompt: str = None) -> str:
-        """
-        Sends a prompt to the LLM service and returns the text response.
-        """
+    @staticmethod
+    def _payload(prompt: str, system_prompt: str = None) -> Dict:
         # In a real VLLM setup, this might match OpenAI's API or a custom schema.
         # We'll assume a simple JSON schema: {"prompt": "...", "system": "..."}
         payload = {"prompt": prompt}
         if system_prompt:
             payload["system_prompt"] = system_prompt
+        return payload
+
+    def _unreachable(self) -> str:
+        # Fallback for dev/test when Docker isn't running
+        logger.warning(
+            "Could not connect to %s. Returning mock response.", self.endpoint
+        )
+        return MOCK_RESPONSE
+
+    async def _apost(self, payload: Dict, stage: str) -> str:
+        async def post() -> str:
+            try:
+                with span(stage, endpoint=self.endpoint):
+                    response = await _pool.async_client().post(
+                        self.endpoint, json=payload
+                    )
+                response.raise_for_status()
+                return response.json().get("text", "")
+            except _UNREACHABLE_ERRORS:
+                # Not a breaker failure: without Ray (dev) every call ends here
+                return self._unreachable()
 
+        # Errors and timeouts trip the breaker. Generations are not hedged: a
+        # second copy of a slow one would only double the GPU work.
+        return await breakers.get("llm").call(post)
+
+    async def agenerate(
+        self,
+        prompt: str,
+        system_prompt: str = None,
+        timeout_s: float = None,
+        stage: str = "llm_http",
+    ) -> str:
+        """
+        Sends a prompt to the LLM service and returns the text response.
+        Concurrent calls with an identical prompt share a single upstream request.
+        `timeout_s` (e.g. what is left of the request deadline) bounds the wait
+        of this caller only; raises asyncio.TimeoutError when it runs out, and
+        CircuitOpen while the LLM circuit breaker is open. The call is timed
+        under `stage`, so short planner prompts and long syntheses keep
+        separate latency histograms.
+        """
+        key = (self.endpoint, prompt, system_prompt)
+        inflight = _pool.inflight()
+        task = inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._apost(self._payload(prompt, system_prompt), stage)
+            )
+            inflight[key] = task
+            task.add_done_callback(lambda _: inflight.pop(key, None))
+        # Shield so one caller being cancelled does not cancel the shared request
+        return await asyncio.wait_for(asyncio.shield(task), timeout_s)
+
+    @staticmethod
+    def _batch_payload(prompts: List[str], system_prompt: str = None) -> Dict:
+        payload = {"prompts": list(dict.fromkeys(prompts))}  # drop duplicates
+        if system_prompt:
+            payload["system_prompt"] = system_prompt
+        return payload
+
+    @staticmethod
+    def _batch_results(prompts: List[str], payload: Dict, texts: List[str]):
+        by_prompt = dict(zip(payload["prompts"], texts))
+        return [by_prompt.get(prompt, "") for prompt in prompts]
+
+    async def agenerate_batch(
+        self, prompts: List[str], system_prompt: str = None
+    ) -> List[str]:
+        """
+        Sends several prompts in one HTTP call; duplicates are only sent once.
+        Results are returned in the order of `prompts`.
+        """
+        payload = self._batch_payload(prompts, system_prompt)
         try:
-            # For development/testing without the service running, we can use a mock if connection fails
-            # But for "intensive testing", we should try to hit it or mock the network call in tests.
-            response = requests.post(self.endpoint, json=payload, timeout=10)
+            # Timed apart from single-prompt calls
+            with span("llm_http_batch", endpoint=self.batch_endpoint):
+                response = await _pool.async_client().post(
+                    self.batch_endpoint, json=payload
+                )
             response.raise_for_status()
-            return response.json().get("text", "")
-        except requests.exceptions.ConnectionError:
-            # Fallback for dev/test when Docker isn't running
-            logger.warning(
-                f"Could not connect to {self.endpoint}. Returning mock response."
-            )
-            return "This is a mock LLM response because the Ray service is unreachable."
+            texts = response.json().get("texts", [])
+        except _UNREACHABLE_ERRORS:
+            texts = [self._unreachable()] * len(payload["prompts"])
+        return self._batch_results(prompts, payload, texts)
 
-    def plan_query(self, query: str) -> str:
+    def generate_batch(
+        self, prompts: List[str], system_prompt: str = None
+    ) -> List[str]:
         """
-        Specialized method to ask the LLM to classify the query.
+        Blocking variant of `agenerate_batch`.
         """
-        system_prompt = (
-            "You are a query planner. specific 'vector' for unstructured queries, "
-            "'graph' for relationship/entity queries, or 'hybrid' for both. "
-            "Reply ONLY with one of those three words."
-        )
-        response = self.generate(f"Query: {query}", system_prompt=system_prompt)
+        payload = self._batch_payload(prompts, system_prompt)
+        try:
+            with span("llm_http_batch", endpoint=self.batch_endpoint):
+                response = _pool.sync_client().post(self.batch_endpoint, json=payload)
+            response.raise_for_status()
+            texts = response.json().get("texts", [])
+        except _UNREACHABLE_ERRORS:
+            texts = [self._unreachable()] * len(payload["prompts"])
+        return self._batch_results(prompts, payload, texts)
+
+    async def astream(
+        self, prompt: str, system_prompt: str = None
+    ) -> AsyncIterator[str]:
+        """
+        Yields the completion incrementally from the streaming endpoint, so callers
+        can forward tokens before generation has finished. A stream that fails
+        counts against the LLM circuit breaker and one read to the end closes
+        it; one the caller stops reading early counts as neither.
+        """
+        breaker = breakers.get("llm")
+        breaker.check()
+        try:
+            # Whole stream, first byte to last token
+            with span("llm_stream", endpoint=self.stream_endpoint):
+                async with _pool.async_client().stream(
+                    "POST",
+                    self.stream_endpoint,
+                    json=self._payload(prompt, system_prompt),
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line:
+                            yield json.loads(line).get("text", "")
+        except _UNREACHABLE_ERRORS:
+            # Not a breaker failure, as in _apost
+            breaker.abandon()
+            yield self._unreachable()
+            return
+        except Exception:
+            breaker.record(False)
+            raise
+        except BaseException:
+            # Closed early (client gone) or cancelled: no outcome either way
+            breaker.abandon()
+            raise
+        breaker.record(True)
+
+    def generate(
+        self, prompt: str, system_prompt: str = None, stage: str = "llm_http"
+    ) -> str:
+        """
+        Blocking variant of `agenerate` for sync callers (scripts, ingestion).
+        """
+        try:
+            with span(stage, endpoint=self.endpoint):
+                response = _pool.sync_client().post(
+                    self.endpoint, json=self._payload(prompt, system_prompt)
+                )
+            response.raise_for_status()
+            return response.json().get("text", "")
+        except _UNREACHABLE_ERRORS:
+            return self._unreachable()
+
+    @staticmethod
+    def _parse_plan(response: str) -> str:
         cleaned = response.strip().lower()
         if "graph" in cleaned:
             return "graph"
         if "vector" in cleaned:
             return "vector"
         return "hybrid"  # Default safe fallback
+
+    async def aplan_query(self, query: str, timeout_s: float = None) -> str:
+        """
+        Specialized method to ask the LLM to classify the query.
+        """
+        # Same system prompt on every call, so the server reuses its prefill
+        response = await self.agenerate(
+            planner_prompt(query),
+            system_prompt=PLANNER_SYSTEM_PROMPT,
+            timeout_s=timeout_s,
+            stage="llm_http_plan",
+        )
+        return self._parse_plan(response)
+
+    async def aplan_queries(self, queries: List[str]) -> List[str]:
+        """
+        `aplan_query` for several queries in one batch call.
+        """
+        responses = await self.agenerate_batch(
+            [planner_prompt(query) for query in queries],
+            system_prompt=PLANNER_SYSTEM_PROMPT,
+        )
+        return [self._parse_plan(response) for response in responses]
+
+    def plan_query(self, query: str) -> str:
+        """
+        Blocking variant of `aplan_query`.
+        """
+        response = self.generate(
+            planner_prompt(query),
+            system_prompt=PLANNER_SYSTEM_PROMPT,
+            stage="llm_http_plan",
+        )
+        return self._parse_plan(response)
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from src.utils.text import tokenize
+
+
+class PrefixCache:
+    """
+    Block-level prompt prefix cache, modelled on vLLM's automatic prefix caching.
+
+    A prompt's tokens are split into `block_size` blocks, each identified by a
+    hash chained over every block before it, so a block is only reused when the
+    whole prefix up to it matches. A lookup reports how many leading tokens are
+    already computed (the prefill the engine can skip); blocks are evicted LRU
+    once `max_blocks` are held.
+    """
+
+    def __init__(self, block_size: int = None, max_blocks: int = None):
+        self.block_size = block_size or int(os.getenv("LLM_PREFIX_BLOCK_SIZE", "16"))
+        self.max_blocks = max_blocks or int(
+            os.getenv("LLM_PREFIX_CACHE_BLOCKS", "4096")
+        )
+        self._blocks: "OrderedDict[bytes, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "hits": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "evicted_blocks": 0,
+        }
+
+    def _block_hashes(self, tokens: List[str]) -> List[bytes]:
+        hashes, digest = [], b""
+        full = len(tokens) - len(tokens) % self.block_size
+        for start in range(0, full, self.block_size):
+            block = "\x00".join(tokens[start : start + self.block_size])
+            digest = hashlib.blake2b(digest + block.encode(), digest_size=16).digest()
+            hashes.append(digest)
+        return hashes
+
+    def lookup_and_insert(self, prompt: str) -> Tuple[int, int]:
+        """
+        Returns (prompt_tokens, cached_tokens) for `prompt` and caches its blocks.
+        """
+        tokens = tokenize(prompt)
+        hashes = self._block_hashes(tokens)
+        with self._lock:
+            cached = 0
+            for digest in hashes:
+                if digest not in self._blocks:
+                    break
+                cached += 1
+            for digest in hashes:
+                self._blocks[digest] = None
+                self._blocks.move_to_end(digest)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+                self._stats["evicted_blocks"] += 1
+            cached_tokens = cached * self.block_size
+            self._stats["requests"] += 1
+            self._stats["hits"] += cached > 0
+            self._stats["prompt_tokens"] += len(tokens)
+            self._stats["cached_tokens"] += cached_tokens
+        return len(tokens), cached_tokens
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["blocks"] = len(self._blocks)
+        requests, prompt_tokens = stats["requests"], stats["prompt_tokens"]
+        stats["hit_rate"] = stats["hits"] / requests if requests else 0.0
+        stats["token_hit_rate"] = (
+            stats["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0
+        )
+        return stats
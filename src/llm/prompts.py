@@ -0,0 +1,51 @@
+# Prompts are laid out for prefix caching: a server can only reuse the KV cache
+# for the longest prefix byte-identical to one it has already processed, so the
+# fixed system prompt (role and instructions) comes first, then per-request
+# content with the query last. Nothing request-specific belongs in a prefix.
+
+PLANNER_SYSTEM_PROMPT = (
+    "You are a query planner. specific 'vector' for unstructured queries, "
+    "'graph' for relationship/entity queries, or 'hybrid' for both. "
+    "Reply ONLY with one of those three words."
+)
+
+SYNTHESIS_SYSTEM_PROMPT = (
+    "You answer questions about enterprise data using retrieved evidence. "
+    "Evidence lines are tagged with the retrieval branch that found them: "
+    "[vector] for document passages, [graph] for knowledge-graph relations. "
+    "Generate a comprehensive answer based on the context, and say so when "
+    "the context does not contain the answer."
+)
+
+
+def render(prompt: str, system_prompt: str = None) -> str:
+    """
+    The text the model actually sees; the server and its prefix cache must
+    both use this so cached prefixes line up.
+    """
+    return f"{system_prompt}\n{prompt}" if system_prompt else prompt
+
+
+def planner_prompt(query: str) -> str:
+    return f"Query: {query}"
+
+
+def synthesis_prompt(query: str, context: str) -> str:
+    return f"Context:\n{context}\nUser Query: {query}\nAnswer:"
+
+
+EXTRACTION_SYSTEM_PROMPT = (
+    "You extract a knowledge graph from enterprise documents. Find the named "
+    "entities (people, organizations, projects, teams, documents) and the "
+    "relations the text states between them. Reply ONLY with JSON: "
+    '{"entities": [{"name": ..., "label": ...}], '
+    '"relations": [{"src": ..., "type": ..., "dst": ...}], '
+    '"aliases": [{"alias": ..., "name": ...}]}. '
+    "Relation types are UPPER_SNAKE_CASE verbs such as MANAGES, REPORTS_TO, "
+    "OWNS, SUPPLIES, APPROVED, WORKS_WITH, DEPENDS_ON or PART_OF; use names "
+    "exactly as they appear in the text."
+)
+
+
+def extraction_prompt(text: str) -> str:
+    return f"Text:\n{text}\nJSON:"
@@ -1,43 +1,253 @@
+import asyncio
+import json
 import os
-from typing import Dict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import starlette.requests
+from starlette.responses import StreamingResponse
 import ray
 from ray import serve
+from src.llm.batching import DynamicBatcher
+from src.llm.prefix_cache import PrefixCache
+from src.utils.text import tokenize
+from src.llm.prompts import render
 
 # import vllm  # Commented out for dev environments without Linux/GPU
 
 
-@serve.deployment(ray_actor_options={"num_gpus": 1})
+class MockEngine:
+    """
+    CPU stand-in for the VLLM engine, used in development, tests and benchmarks.
+
+    Prefill is modelled as `prefill_s_per_token` per prompt token that has to be
+    computed; with a `prefix_cache`, tokens of an already-seen prefix are free,
+    as with vLLM's automatic prefix caching.
+    """
+
+    def __init__(
+        self,
+        token_delay_s: float = None,
+        batch_overhead_s: float = None,
+        per_prompt_s: float = None,
+        prefill_s_per_token: float = None,
+        prefix_cache: Optional[PrefixCache] = None,
+    ):
+        self.token_delay_s = (
+            token_delay_s
+            if token_delay_s is not None
+            else float(os.getenv("MOCK_ENGINE_TOKEN_DELAY_S", "0"))
+        )
+        # Cost model for one forward pass: a fixed launch/weights-read overhead
+        # plus a small per-sequence cost, which is what makes batching pay off.
+        self.batch_overhead_s = (
+            batch_overhead_s
+            if batch_overhead_s is not None
+            else float(os.getenv("MOCK_ENGINE_BATCH_OVERHEAD_S", "0"))
+        )
+        self.per_prompt_s = (
+            per_prompt_s
+            if per_prompt_s is not None
+            else float(os.getenv("MOCK_ENGINE_PER_PROMPT_S", "0"))
+        )
+        self.prefill_s_per_token = (
+            prefill_s_per_token
+            if prefill_s_per_token is not None
+            else float(os.getenv("MOCK_ENGINE_PREFILL_S_PER_TOKEN", "0"))
+        )
+        self.prefix_cache = prefix_cache
+        self.prompt_tokens = 0
+        self.computed_tokens = 0
+
+    @staticmethod
+    def _completion(prompt: str) -> str:
+        return f"[VLLM Generated]: Response to '{prompt[:20]}...'"
+
+    async def generate(self, prompt: str, full_prompt: str) -> str:
+        return (await self.generate_batch([(prompt, full_prompt)]))[0]
+
+    def _prefill(self, full_prompt: str) -> int:
+        """
+        Returns how many prompt tokens have to be computed for `full_prompt`.
+        """
+        if self.prefix_cache is not None:
+            total, cached = self.prefix_cache.lookup_and_insert(full_prompt)
+        else:
+            total, cached = len(tokenize(full_prompt)), 0
+        self.prompt_tokens += total
+        self.computed_tokens += total - cached
+        return total - cached
+
+    async def generate_batch(self, items: List[Tuple[str, str]]) -> List[str]:
+        computed = sum(self._prefill(full_prompt) for _, full_prompt in items)
+        cost = self.batch_overhead_s + self.per_prompt_s * len(items)
+        cost += self.prefill_s_per_token * computed
+        if cost:
+            await asyncio.sleep(cost)
+        return [self._completion(prompt) for prompt, _ in items]
+
+    async def stream(self, prompt: str, full_prompt: str) -> AsyncIterator[str]:
+        prefill_s = self.prefill_s_per_token * self._prefill(full_prompt)
+        if prefill_s:
+            await asyncio.sleep(prefill_s)
+        words = self._completion(prompt).split(" ")
+        for i, word in enumerate(words):
+            if self.token_delay_s:
+                await asyncio.sleep(self.token_delay_s)
+            yield word if i == len(words) - 1 else word + " "
+
+    def stats(self) -> Dict:
+        stats = {
+            "prompt_tokens": self.prompt_tokens,
+            "computed_tokens": self.computed_tokens,
+            "saved_tokens": self.prompt_tokens - self.computed_tokens,
+        }
+        if self.prefix_cache is not None:
+            stats["prefix_cache"] = self.prefix_cache.stats()
+        return stats
+
+
+def deployment_options() -> Dict:
+    """
+    Replica and concurrency settings, taken from the environment so they can be
+    tuned per cluster without code changes.
+    """
+    options = {
+        "ray_actor_options": {"num_gpus": float(os.getenv("LLM_NUM_GPUS", "1"))},
+        # Must be >= the batch size, or batches can never fill up
+        "max_ongoing_requests": int(os.getenv("LLM_MAX_ONGOING_REQUESTS", "64")),
+    }
+    max_replicas = os.getenv("LLM_AUTOSCALING_MAX_REPLICAS")
+    if max_replicas:
+        options["autoscaling_config"] = {
+            "min_replicas": int(os.getenv("LLM_AUTOSCALING_MIN_REPLICAS", "1")),
+            "max_replicas": int(max_replicas),
+            "target_ongoing_requests": int(
+                os.getenv("LLM_TARGET_ONGOING_REQUESTS", "16")
+            ),
+        }
+    else:
+        options["num_replicas"] = int(os.getenv("LLM_NUM_REPLICAS", "1"))
+    return options
+
+
+@serve.deployment(**deployment_options())
 class VLLMDeployment:
-    def __init__(self):
+    def __init__(
+        self,
+        engine=None,
+        max_batch_size: Optional[int] = None,
+        max_wait_s: Optional[float] = None,
+        prefix_caching: Optional[bool] = None,
+    ):
+        # Reuse the KV cache of shared prompt prefixes (the system prompts in
+        # src/llm/prompts.py) instead of recomputing their prefill per request
+        self.prefix_caching = (
+            prefix_caching
+            if prefix_caching is not None
+            else os.getenv("LLM_PREFIX_CACHING", "true").lower() == "true"
+        )
         # In a real setup, we initialize the VLLM engine here.
         # self.engine = vllm.AsyncLLMEngine.from_engine_args(
-        #     vllm.EngineArgs(model="mistralai/Mistral-7B-Instruct-v0.1")
+        #     vllm.EngineArgs(
+        #         model="mistralai/Mistral-7B-Instruct-v0.1",
+        #         enable_prefix_caching=self.prefix_caching,
+        #     )
         # )
         print("Initializing VLLM Deployment (Mocked for Scaffolding)...")
-        pass
+        self.engine = engine or MockEngine(
+            prefix_cache=PrefixCache() if self.prefix_caching else None
+        )
+        # Concurrent requests to this replica are grouped into engine batches
+        # (LLM_BATCH_MAX_SIZE / LLM_BATCH_MAX_WAIT_S)
+        self.batcher = DynamicBatcher(
+            self._run_batch, max_batch_size=max_batch_size, max_wait_s=max_wait_s
+        )
+
+    async def _run_batch(self, items: List[Tuple[str, Optional[str]]]) -> List[str]:
+        full_prompts = [
+            (prompt, render(prompt, system_prompt)) for prompt, system_prompt in items
+        ]
+
+        # sampling_params = vllm.SamplingParams(temperature=0.7, max_tokens=200)
+        # AsyncLLMEngine batches continuously on its own; submit each prompt with
+        # its own request_id and gather the results:
+        # results = await asyncio.gather(*(collect(self.engine.generate(p, ...)) ...))
+
+        return await self.engine.generate_batch(full_prompts)
 
     async def generate(self, prompt: str, system_prompt: str = None) -> str:
         """
         Generates text based on the prompt.
         """
-        full_prompt = f"{system_prompt}\n{prompt}" if system_prompt else prompt
+        return await self.batcher.submit((prompt, system_prompt))
 
-        # sampling_params = vllm.SamplingParams(temperature=0.7, max_tokens=200)
-        # results = await self.engine.generate(full_prompt, sampling_params, request_id="...")
-        # return results[0].outputs[0].text
+    async def generate_many(
+        self, prompts: List[str], system_prompt: str = None
+    ) -> List[str]:
+        """
+        Generates completions for several prompts; they share the batch queue
+        with concurrent single-prompt requests.
+        """
+        return list(
+            await asyncio.gather(*(self.generate(p, system_prompt) for p in prompts))
+        )
 
-        # Mock response for now
-        return f"[VLLM Generated]: Response to '{prompt[:20]}...'"
+    def stats(self) -> Dict:
+        stats = {"batching": self.batcher.stats()}
+        if hasattr(self.engine, "stats"):
+            # vLLM reports the same through its prefix_cache_hit_rate metrics
+            stats["prefill"] = self.engine.stats()
+        return stats
+
+    async def generate_stream(
+        self, prompt: str, system_prompt: str = None
+    ) -> AsyncIterator[str]:
+        """
+        Yields the completion incrementally, as the engine produces tokens.
+        """
+        full_prompt = render(prompt, system_prompt)
+
+        # With VLLM, iterate the engine's async generator and yield the delta:
+        # sent = 0
+        # async for output in self.engine.generate(full_prompt, sampling_params, request_id):
+        #     text = output.outputs[0].text
+        #     yield text[sent:]
+        #     sent = len(text)
+
+        async for token in self.engine.stream(prompt, full_prompt):
+            yield token
+
+    async def _ndjson_stream(self, prompt: str, system_prompt: str = None):
+        async for token in self.generate_stream(prompt, system_prompt):
+            yield json.dumps({"text": token}) + "\n"
 
     async def __call__(self, request: starlette.requests.Request) -> Dict:
         """
         Handle HTTP requests directly via Ray Serve.
+        POST /generate returns {"text": ...}; POST /generate_batch takes
+        {"prompts": [...]} and returns {"texts": [...]}; POST /generate_stream returns
+        newline-delimited {"text": <token>} chunks as they are produced;
+        GET /stats reports batching and prefill (prefix cache) statistics.
         """
+        path = request.url.path.rstrip("/")
+        if path.endswith("/stats"):
+            return self.stats()
+
         json_input = await request.json()
         prompt = json_input.get("prompt")
         system_prompt = json_input.get("system_prompt")
 
+        if path.endswith("/generate_batch"):
+            texts = await self.generate_many(
+                json_input.get("prompts", []), system_prompt
+            )
+            return {"texts": texts}
+
+        if path.endswith("/generate_stream"):
+            return StreamingResponse(
+                self._ndjson_stream(prompt, system_prompt),
+                media_type="application/x-ndjson",
+            )
+
         output = await self.generate(prompt, system_prompt)
         return {"text": output}
 
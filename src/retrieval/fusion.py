@@ -0,0 +1,155 @@
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.cache.answer_cache import cosine, text_vector
+from src.utils.text import TOKEN
+
+
+@dataclass
+class Evidence:
+    text: str
+    sources: List[str]  # retrieval branches that returned it
+    score: float
+    tokens: int = 0
+    vector: Dict[int, float] = field(default_factory=dict, repr=False)
+
+    def render(self) -> str:
+        return f"[{'+'.join(self.sources)}] {self.text}"
+
+
+def rrf(ranked: Dict[str, Sequence[str]], k: int = 60) -> List[Evidence]:
+    """
+    Reciprocal rank fusion: a passage scores sum(1 / (k + rank)) over the lists
+    it appears in, so agreement between branches outranks a single high rank
+    and no score calibration between retrievers is needed.
+    """
+    fused: Dict[str, Evidence] = {}
+    for source, texts in ranked.items():
+        for rank, text in enumerate(texts, start=1):
+            entry = fused.setdefault(text, Evidence(text, [], 0.0))
+            if source not in entry.sources:
+                entry.sources.append(source)
+                entry.score += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda e: e.score, reverse=True)
+
+
+def lexical_reranker(query: str, texts: List[str]) -> List[float]:
+    """
+    Cosine between hashed word/trigram vectors; cheap enough for every request.
+    """
+    q = text_vector(query)
+    return [cosine(q, text_vector(text)) for text in texts]
+
+
+def embedding_reranker(query: str, texts: List[str]) -> List[float]:
+    from src.embeddings.service import get_embedding_service
+
+    # Unit vectors, so the dot product is the cosine; passages hit the cache
+    vectors = get_embedding_service().embed([query] + texts, query=True)
+    return (vectors[1:] @ vectors[0]).tolist()
+
+
+RERANKERS: Dict[str, Optional[Callable[[str, List[str]], List[float]]]] = {
+    "none": None,
+    "lexical": lexical_reranker,
+    "embedding": embedding_reranker,
+}
+
+
+class ContextFuser:
+    """
+    Turns the per-branch result lists into the evidence that goes into the
+    prompt: RRF merge, optional rerank of the top candidates, near-duplicate
+    removal, then greedy packing into `token_budget` (counted with the
+    chunker's tokenizer), best evidence first.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = None,
+        reranker: str = None,
+        rerank_top_n: int = None,
+        rerank_weight: float = None,
+        dedupe_threshold: float = None,
+        rrf_k: int = None,
+    ):
+        self.token_budget = token_budget or int(
+            os.getenv("FUSION_TOKEN_BUDGET", "1024")
+        )
+        name = reranker or os.getenv("FUSION_RERANKER", "none")
+        if name not in RERANKERS:
+            raise ValueError(f"Unknown reranker {name!r}; use one of {list(RERANKERS)}")
+        self.reranker = RERANKERS[name]
+        self.rerank_top_n = rerank_top_n or int(os.getenv("FUSION_RERANK_TOP_N", "20"))
+        self.rerank_weight = (
+            rerank_weight
+            if rerank_weight is not None
+            else float(os.getenv("FUSION_RERANK_WEIGHT", "0.5"))
+        )
+        self.dedupe_threshold = dedupe_threshold or float(
+            os.getenv("FUSION_DEDUPE_THRESHOLD", "0.9")
+        )
+        self.rrf_k = rrf_k or int(os.getenv("FUSION_RRF_K", "60"))
+
+    def _rerank(self, query: str, candidates: List[Evidence]) -> List[Evidence]:
+        head = candidates[: self.rerank_top_n]
+        relevance = np.asarray(self.reranker(query, [e.text for e in head]))
+        fused = np.asarray([e.score for e in head])
+        # Both on [0, 1] before blending; RRF scores are tiny in absolute terms
+        blended = (1 - self.rerank_weight) * fused / fused.max() + (
+            self.rerank_weight * relevance
+        )
+        for entry, score in zip(head, blended.tolist()):
+            entry.score = score
+        return (
+            sorted(head, key=lambda e: e.score, reverse=True)
+            + candidates[self.rerank_top_n :]
+        )
+
+    def _is_duplicate(
+        self, entry: Evidence, kept: List[Evidence], vectors: Dict = None
+    ) -> bool:
+        if vectors is None:
+            entry.vector = text_vector(entry.text)
+        else:
+            entry.vector = vectors.get(entry.text)
+            if entry.vector is None:
+                entry.vector = vectors[entry.text] = text_vector(entry.text)
+        return any(
+            cosine(entry.vector, other.vector) >= self.dedupe_threshold
+            for other in kept
+        )
+
+    def fuse(
+        self, query: str, ranked: Dict[str, Sequence[str]], vectors: Dict = None
+    ) -> List[Evidence]:
+        """
+        `vectors` optionally memoizes passage vectors across calls; a batch
+        passes one dict for all its queries, which share many passages.
+        """
+        candidates = rrf(ranked, self.rrf_k)
+        if self.reranker is not None and candidates:
+            candidates = self._rerank(query, candidates)
+
+        packed: List[Evidence] = []
+        used = 0
+        for entry in candidates:
+            if self._is_duplicate(entry, packed, vectors):
+                continue
+            entry.tokens = len(TOKEN.findall(entry.text))
+            if used + entry.tokens > self.token_budget:
+                if packed:
+                    continue  # a shorter, lower-ranked passage may still fit
+                # Never leave the prompt empty: cut the best one to the budget
+                cut = list(TOKEN.finditer(entry.text))[self.token_budget - 1]
+                entry.text = entry.text[: cut.end()]
+                entry.tokens = self.token_budget
+            packed.append(entry)
+            used += entry.tokens
+        return packed
+
+
+fuser = ContextFuser()
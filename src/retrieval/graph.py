@@ -0,0 +1,363 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from src.retrieval.subgraph import Subgraph, SubgraphCache, subgraph_cache
+from src.utils.logger import logger
+from src.utils.resilience import hedged
+from src.utils.tracing import span
+
+# Hop bounds cannot be query parameters, so one variant per depth is built up front
+MAX_HOPS_CEILING = 3
+
+# Index-backed schema; idempotent, run by ingestion before it writes anything.
+# The uniqueness constraint doubles as the range index behind MERGE/MATCH on key.
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT entity_key IF NOT EXISTS "
+    "FOR (e:Entity) REQUIRE e.key IS UNIQUE",
+    "CREATE INDEX entity_label IF NOT EXISTS FOR (e:Entity) ON (e.label)",
+    "CREATE FULLTEXT INDEX entity_names IF NOT EXISTS "
+    "FOR (e:Entity) ON EACH [e.name]",
+]
+
+
+def _seeds(search: str = "$search") -> str:
+    # Seeds come from the full-text index instead of a `CONTAINS` scan over every node
+    return f"""
+CALL db.index.fulltext.queryNodes('entity_names', {search}) YIELD node, score
+WITH node, score ORDER BY score DESC LIMIT $seeds
+"""
+
+
+def _neighborhood(hops: int, search: str = "$search") -> str:
+    return _seeds(search) + f"""
+MATCH path = (node)-[*1..{hops}]-(:Entity)
+WITH node, path, score LIMIT $paths
+UNWIND relationships(path) AS r
+WITH node.key AS seed, startNode(r) AS a, type(r) AS rel, endNode(r) AS b,
+     max(score) AS score
+RETURN seed, a.name AS src, rel, b.name AS dst, score
+ORDER BY score DESC LIMIT $limit
+"""
+
+
+def _neighborhood_batch(hops: int) -> str:
+    # One round trip for many searches: $searches is a list of {i, search} maps
+    # and the subquery (with its LIMITs) runs once per item
+    return f"""
+UNWIND $searches AS item
+CALL {{
+WITH item
+{_neighborhood(hops, "item.search")}}}
+RETURN item.i AS i, seed, src, rel, dst, score
+"""
+
+
+def _subgraph(hops: int) -> str:
+    # Everything the local cache needs to answer `hops`-bounded traversals from
+    # $key; `paths` tells the caller whether $paths truncated the expansion.
+    return f"""
+MATCH (seed:Entity {{key: $key}})
+MATCH path = (seed)-[*1..{hops}]-(:Entity)
+WITH path LIMIT $paths
+WITH collect(path) AS paths
+WITH paths, size(paths) AS n_paths
+UNWIND paths AS path
+UNWIND relationships(path) AS r
+WITH DISTINCT n_paths, r
+RETURN n_paths AS paths, startNode(r).key AS src_key, startNode(r).name AS src,
+       type(r) AS rel, endNode(r).key AS dst_key, endNode(r).name AS dst
+LIMIT $limit
+"""
+
+
+def _shortest_path(hops: int) -> str:
+    return f"""
+MATCH (a:Entity {{key: $src}}), (b:Entity {{key: $dst}})
+MATCH path = shortestPath((a)-[*..{hops}]-(b))
+UNWIND relationships(path) AS r
+RETURN startNode(r).name AS src, type(r) AS rel, endNode(r).name AS dst
+LIMIT $limit
+"""
+
+
+# Fixed query texts let Neo4j reuse a cached plan for every call
+TEMPLATES: Dict[str, str] = {
+    "entity_search": _seeds()
+    + """
+RETURN node.key AS key, node.name AS name, node.label AS label, score
+LIMIT $limit
+""",
+    "relations_of": """
+MATCH (a:Entity {key: $key})-[r]-(b:Entity)
+RETURN startNode(r).name AS src, type(r) AS rel, endNode(r).name AS dst
+LIMIT $limit
+""",
+    **{f"neighborhood_{h}": _neighborhood(h) for h in range(1, MAX_HOPS_CEILING + 1)},
+    **{
+        f"neighborhood_batch_{h}": _neighborhood_batch(h)
+        for h in range(1, MAX_HOPS_CEILING + 1)
+    },
+    **{f"shortest_path_{h}": _shortest_path(h) for h in range(1, MAX_HOPS_CEILING + 1)},
+    **{f"subgraph_{h}": _subgraph(h) for h in range(1, MAX_HOPS_CEILING + 1)},
+}
+
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+# Boolean operators are only operators in upper case
+_LUCENE_OPERATOR = re.compile(r"\b(AND|OR|NOT)\b")
+
+
+def lucene_escape(text: str) -> str:
+    """
+    Makes user text safe to pass as a full-text query (terms are OR-ed).
+    """
+    text = _LUCENE_OPERATOR.sub(lambda m: m.group().lower(), text)
+    return _LUCENE_SPECIAL.sub(r"\\\1", text)
+
+
+_driver = None
+_driver_lock = threading.Lock()
+
+
+def get_driver():
+    """
+    Process-wide Neo4j driver, created on first use. The driver owns a connection
+    pool, so it is shared by every request instead of being built per call.
+    """
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            from neo4j import GraphDatabase
+
+            _driver = GraphDatabase.driver(
+                os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+                auth=(
+                    os.getenv("NEO4J_USER", "neo4j"),
+                    os.getenv("NEO4J_PASSWORD", "password"),
+                ),
+                max_connection_pool_size=int(os.getenv("NEO4J_MAX_POOL_SIZE", "50")),
+                connection_acquisition_timeout=float(
+                    os.getenv("NEO4J_ACQUISITION_TIMEOUT_S", "5")
+                ),
+                connection_timeout=float(os.getenv("NEO4J_CONNECTION_TIMEOUT_S", "5")),
+                max_connection_lifetime=float(
+                    os.getenv("NEO4J_MAX_CONNECTION_LIFETIME_S", "3600")
+                ),
+                # Pooled connections idle longer than this are pinged before reuse
+                liveness_check_timeout=float(os.getenv("NEO4J_LIVENESS_CHECK_S", "30")),
+                max_transaction_retry_time=float(
+                    os.getenv("NEO4J_MAX_RETRY_TIME_S", "5")
+                ),
+            )
+        return _driver
+
+
+def close_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+def ensure_schema(driver=None, database: str = None):
+    driver = driver or get_driver()
+    with driver.session(database=database) as session:
+        for statement in SCHEMA_STATEMENTS:
+            session.run(statement)
+    logger.info("Neo4j schema (constraints, range and full-text indexes) ensured.")
+
+
+class GraphRetriever:
+    """
+    Graph retrieval through the template library. Every query is bounded: hop
+    depth is clamped to `max_hops` and every template carries a LIMIT.
+
+    Traversals from hot entities are answered from a local SubgraphCache when it
+    holds complete neighborhoods for them; misses go to Neo4j as before and, once
+    an entity is hot, its neighborhood is loaded in the background so the
+    request never waits for it.
+    """
+
+    def __init__(
+        self,
+        driver=None,
+        database: str = None,
+        max_hops: int = None,
+        limit: int = None,
+        seeds: int = None,
+        health_check_s: float = None,
+        cache: Optional[SubgraphCache] = None,
+    ):
+        self._driver = driver
+        self.cache = cache if cache is not None else subgraph_cache
+        self._loading: Set[str] = set()
+        self.database = database or os.getenv("NEO4J_DATABASE") or None
+        self.max_hops = min(
+            max_hops or int(os.getenv("GRAPH_MAX_HOPS", "2")), MAX_HOPS_CEILING
+        )
+        self.limit = limit or int(os.getenv("GRAPH_RESULT_LIMIT", "10"))
+        self.seeds = seeds or int(os.getenv("GRAPH_SEED_LIMIT", "5"))
+        self.health_check_s = (
+            health_check_s
+            if health_check_s is not None
+            else float(os.getenv("NEO4J_HEALTH_CHECK_S", "30"))
+        )
+        self._health: Optional[tuple] = None  # (checked_at, ok)
+
+    @property
+    def driver(self):
+        return self._driver or get_driver()
+
+    def healthy(self) -> bool:
+        """
+        Connectivity check, cached for `health_check_s` so it costs nothing per
+        request.
+        """
+        now = time.monotonic()
+        if self._health is None or now - self._health[0] > self.health_check_s:
+            try:
+                self.driver.verify_connectivity()
+                ok = True
+            except Exception as e:
+                logger.warning("Neo4j health check failed: %s", e)
+                ok = False
+            self._health = (now, ok)
+        return self._health[1]
+
+    def _hops(self, hops: Optional[int]) -> int:
+        return max(1, min(hops or self.max_hops, self.max_hops))
+
+    def run(self, template: str, **params: Any) -> List[Dict[str, Any]]:
+        cypher = TEMPLATES[template]
+        params.setdefault("limit", self.limit)
+        with self.driver.session(database=self.database) as session:
+            return session.execute_read(lambda tx: tx.run(cypher, params).data())
+
+    async def arun(self, template: str, **params: Any) -> List[Dict[str, Any]]:
+        # The sync driver blocks on network I/O, so keep it off the event loop.
+        # Reads slower than usual are hedged on a second pooled connection.
+        return await hedged(
+            "neo4j_query",
+            lambda: asyncio.to_thread(self.run, template, **params),
+            template=template,
+        )
+
+    def _dedupe(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        unique = {(row["src"], row["rel"], row["dst"]): row for row in reversed(rows)}
+        return list(reversed(unique.values()))[: self.limit]
+
+    def _cached(self, search: str, hops: int) -> Optional[List[Dict[str, Any]]]:
+        seeds = self.cache.seeds(search)
+        if seeds is None:
+            return None
+        graphs = [self.cache.get(seed) for seed in seeds]
+        if not all(graph is not None and graph.covers(hops) for graph in graphs):
+            return None
+        rows = []
+        for graph in graphs:
+            rows += graph.rows(graph.bfs_edges(hops, self.limit))
+        return self._dedupe(rows)
+
+    def _fetched(self, search: str, rows: List[Dict[str, Any]]):
+        seeds = list(dict.fromkeys(row["seed"] for row in rows))
+        self.cache.put_seeds(search, seeds)
+        for seed in seeds:
+            if self.cache.get(seed) is None and self.cache.admit(seed):
+                self._load_later(seed)
+        return self._dedupe(rows)
+
+    async def neighborhood(self, query: str, hops: int = None) -> List[Dict[str, Any]]:
+        hops = self._hops(hops)
+        search = lucene_escape(query)
+        await self.cache.sync()
+        rows = self._cached(search, hops)
+        if rows is not None:
+            return rows
+
+        rows = await self.arun(
+            f"neighborhood_{hops}",
+            search=search,
+            seeds=self.seeds,
+            paths=self.limit * 10,
+        )
+        return self._fetched(search, rows)
+
+    async def neighborhood_many(
+        self, queries: List[str], hops: int = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        `neighborhood` for several queries: cache hits are answered locally and
+        all misses share one multi-parameter query.
+        """
+        hops = self._hops(hops)
+        searches = [lucene_escape(query) for query in queries]
+        await self.cache.sync()
+        results = [self._cached(search, hops) for search in searches]
+        missing = [i for i, rows in enumerate(results) if rows is None]
+        if missing:
+            rows = await self.arun(
+                f"neighborhood_batch_{hops}",
+                searches=[{"i": i, "search": searches[i]} for i in missing],
+                seeds=self.seeds,
+                paths=self.limit * 10,
+            )
+            by_item: Dict[int, List[Dict[str, Any]]] = {i: [] for i in missing}
+            for row in rows:
+                by_item[row["i"]].append(row)
+            for i in missing:
+                results[i] = self._fetched(searches[i], by_item[i])
+        return results
+
+    async def shortest_path(
+        self, src_key: str, dst_key: str, hops: int = None
+    ) -> List[Dict[str, Any]]:
+        hops = self._hops(hops)
+        await self.cache.sync()
+        graph = self.cache.get(src_key)
+        if graph is not None and graph.covers(hops):
+            # A complete neighborhood holds every path of up to `radius` hops
+            path = graph.shortest_path(dst_key, hops)
+            return graph.rows(path) if path is not None else []
+        if graph is None and self.cache.admit(src_key):
+            self._load_later(src_key)
+        return await self.arun(f"shortest_path_{hops}", src=src_key, dst=dst_key)
+
+    def _load_later(self, seed: str):
+        if seed not in self._loading:
+            self._loading.add(seed)
+            task = asyncio.ensure_future(self._load(seed))
+            task.add_done_callback(lambda _: self._loading.discard(seed))
+
+    async def _load(self, seed: str):
+        cache = self.cache
+        generation = cache.generation
+        paths = cache.max_edges * 4
+        try:
+            # Not hedged, and timed apart from the point reads whose latencies
+            # set their hedge delay: a load is heavy and nobody waits on it
+            with span("neo4j_subgraph_load"):
+                rows = await asyncio.to_thread(
+                    self.run,
+                    f"subgraph_{cache.radius}",
+                    key=seed,
+                    paths=paths,
+                    limit=cache.max_edges,
+                )
+        except Exception as e:
+            logger.warning("Loading the neighborhood of %r failed: %s", seed, e)
+            return
+        complete = len(rows) < cache.max_edges and (
+            not rows or rows[0]["paths"] < paths
+        )
+        cache.put(Subgraph(seed, cache.radius, rows, complete), generation)
+
+    @staticmethod
+    def format(rows: List[Dict[str, Any]]) -> List[str]:
+        return [f"{row['src']} -[{row['rel']}]-> {row['dst']}" for row in rows]
+
+
+graph_retriever = GraphRetriever()
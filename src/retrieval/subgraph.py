@@ -0,0 +1,345 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from src.cache.invalidation import register_entity_invalidation_hook
+from src.cache.shared import SharedCache, UsesSharedCache
+
+
+class Subgraph:
+    """
+    The k-hop neighborhood of one seed entity as a compact CSR adjacency index.
+
+    Node i's incident edges are edges[offsets[i]:offsets[i + 1]], leading to
+    targets[...]; every edge is stored from both ends, so traversal ignores
+    direction like the Cypher templates do, while src/dst keep the real one.
+    `complete` is False when the fetch was truncated, in which case only the
+    Neo4j answer is exact.
+    """
+
+    def __init__(
+        self, seed: str, radius: int, rows: List[Dict[str, Any]], complete: bool
+    ):
+        self.seed = seed
+        self.radius = radius
+        self.complete = complete
+        self.index: Dict[str, int] = {seed: 0}
+        self.names: List[str] = [seed]
+        rel_codes: Dict[str, int] = {}
+
+        def node(key: str, name: str) -> int:
+            i = self.index.setdefault(key, len(self.index))
+            if i == len(self.names):
+                self.names.append(name)
+            else:
+                self.names[i] = name
+            return i
+
+        m = len(rows)
+        self.src = np.empty(m, dtype=np.int32)
+        self.dst = np.empty(m, dtype=np.int32)
+        self.rel = np.empty(m, dtype=np.int16)
+        for e, row in enumerate(rows):
+            self.src[e] = node(row["src_key"], row["src"])
+            self.dst[e] = node(row["dst_key"], row["dst"])
+            self.rel[e] = rel_codes.setdefault(row["rel"], len(rel_codes))
+        self.rel_types = list(rel_codes)
+
+        n = len(self.index)
+        heads = np.concatenate([self.src, self.dst])
+        order = np.argsort(heads, kind="stable")
+        self.targets = np.concatenate([self.dst, self.src])[order]
+        self.edges = np.concatenate([np.arange(m), np.arange(m)]).astype(np.int32)[
+            order
+        ]
+        self.offsets = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(heads, minlength=n), out=self.offsets[1:])
+
+    @property
+    def keys(self) -> List[str]:
+        return list(self.index)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.src, self.dst, self.rel, self.targets, self.edges, self.offsets)
+        return sum(a.nbytes for a in arrays)
+
+    def covers(self, hops: int) -> bool:
+        return self.complete and hops <= self.radius
+
+    def _positions(self, nodes: np.ndarray) -> np.ndarray:
+        """
+        Positions in targets/edges of every edge incident to `nodes`, gathered
+        without a Python loop over the nodes.
+        """
+        starts = self.offsets[nodes]
+        counts = self.offsets[nodes + 1] - starts
+        total = int(counts.sum())
+        ends = np.cumsum(counts)
+        return np.repeat(starts - (ends - counts), counts) + np.arange(total)
+
+    def bfs_edges(self, hops: int, limit: int) -> List[int]:
+        """
+        Edges within `hops` of the seed (those incident to a node closer than
+        `hops`), nearest first.
+        """
+        visited = np.zeros(len(self.index), dtype=bool)
+        seen = np.zeros(len(self.src), dtype=bool)
+        visited[0] = True
+        frontier = np.array([0], dtype=np.int32)
+        found: List[int] = []
+        for _ in range(hops):
+            positions = self._positions(frontier)
+            edges = np.unique(self.edges[positions])
+            edges = edges[~seen[edges]]
+            seen[edges] = True
+            found.extend(edges.tolist())
+            if len(found) >= limit:
+                break
+            reached = np.unique(self.targets[positions])
+            frontier = reached[~visited[reached]]
+            visited[frontier] = True
+            if not len(frontier):
+                break
+        return found[:limit]
+
+    def shortest_path(self, dst_key: str, max_hops: int) -> Optional[List[int]]:
+        """
+        Edge ids of a shortest path from the seed to `dst_key`, or None if it is
+        not within `max_hops` in this subgraph.
+        """
+        target = self.index.get(dst_key)
+        if target is None:
+            return None
+        parent_edge = np.full(len(self.index), -1, dtype=np.int32)
+        visited = np.zeros(len(self.index), dtype=bool)
+        visited[0] = True
+        frontier = np.array([0], dtype=np.int32)
+        for _ in range(max_hops):
+            if visited[target] or not len(frontier):
+                break
+            positions = self._positions(frontier)
+            reached = self.targets[positions]
+            fresh = ~visited[reached]
+            # First edge to reach a node wins, like a level-synchronous BFS
+            nodes, first = np.unique(reached[fresh], return_index=True)
+            parent_edge[nodes] = self.edges[positions[fresh][first]]
+            visited[nodes] = True
+            frontier = nodes
+        if not visited[target]:
+            return None
+        path, node = [], target
+        while node != 0:
+            edge = int(parent_edge[node])
+            path.append(edge)
+            node = self.src[edge] if self.dst[edge] == node else self.dst[edge]
+        return path[::-1]
+
+    def rows(self, edges: List[int]) -> List[Dict[str, str]]:
+        return [
+            {
+                "src": self.names[self.src[e]],
+                "rel": self.rel_types[self.rel[e]],
+                "dst": self.names[self.dst[e]],
+            }
+            for e in edges
+        ]
+
+
+class SubgraphCache(UsesSharedCache):
+    """
+    In-process cache of hot entities' neighborhoods.
+
+    A seed is admitted only after `admit_after` misses, so one-off entities never
+    displace hubs; entries are evicted LRU and expire after `ttl_s`. A reverse
+    index from every cached node to the entries containing it lets writes that
+    touch a node drop exactly the neighborhoods they change.
+    Full-text seed lookups (query text -> seed keys) are cached alongside.
+
+    Writes in other processes (the ingestion pipeline) publish the entity keys
+    they touched to the shared cache's "graph" namespace; `sync`, at most every
+    CACHE_SYNC_INTERVAL_S, drops the neighborhoods containing them through the
+    same reverse index. Only when the published keys cannot all be replayed is
+    everything dropped. Without a shared cache (CACHE_BACKEND=local) such writes
+    are only picked up as entries expire, after at most `ttl_s`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        radius: int = None,
+        max_edges: int = None,
+        admit_after: int = None,
+        ttl_s: float = None,
+        shared: SharedCache = None,
+    ):
+        self.max_entries = (
+            max_entries
+            if max_entries is not None
+            else int(os.getenv("GRAPH_CACHE_ENTRIES", "256"))
+        )
+        self.radius = radius or int(os.getenv("GRAPH_CACHE_RADIUS", "2"))
+        self.max_edges = max_edges or int(os.getenv("GRAPH_CACHE_MAX_EDGES", "5000"))
+        self.admit_after = admit_after or int(os.getenv("GRAPH_CACHE_ADMIT_AFTER", "2"))
+        self.ttl_s = ttl_s or float(os.getenv("GRAPH_CACHE_TTL_S", "300"))
+        if shared is not None:
+            self.shared = shared
+        self.sync_interval_s = float(os.getenv("CACHE_SYNC_INTERVAL_S", "1"))
+        self._shared_generation: Optional[int] = None
+        self._synced_at = -math.inf
+        self._entries: "OrderedDict[str, Tuple[float, Subgraph]]" = OrderedDict()
+        self._by_node: Dict[str, Set[str]] = {}
+        self._misses: "OrderedDict[str, int]" = OrderedDict()
+        self._seeds: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0  # bumped by every invalidation
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "admissions": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def _expired(self, created_at: float) -> bool:
+        return time.monotonic() - created_at > self.ttl_s
+
+    def get(self, seed: str) -> Optional[Subgraph]:
+        with self._lock:
+            entry = self._entries.get(seed)
+            if entry is not None and self._expired(entry[0]):
+                self._drop(seed)
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(seed)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def admit(self, seed: str) -> bool:
+        """
+        Counts a miss for `seed`; True once it is hot enough to load.
+        """
+        if self.max_entries <= 0:
+            return False
+        with self._lock:
+            count = self._misses.pop(seed, 0) + 1
+            if count >= self.admit_after:
+                self.stats["admissions"] += 1
+                return True
+            self._misses[seed] = count
+            while len(self._misses) > 4 * self.max_entries:
+                self._misses.popitem(last=False)
+            return False
+
+    def put(self, subgraph: Subgraph, generation: Optional[int] = None):
+        """
+        `generation` is the value read before fetching; a neighborhood fetched
+        across an invalidation may already be stale and is discarded.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if subgraph.seed in self._entries:
+                self._drop(subgraph.seed)
+            self._entries[subgraph.seed] = (time.monotonic(), subgraph)
+            for key in subgraph.index:
+                self._by_node.setdefault(key, set()).add(subgraph.seed)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _drop(self, seed: str):
+        _, subgraph = self._entries.pop(seed)
+        for key in subgraph.index:
+            seeds = self._by_node.get(key)
+            if seeds is not None:
+                seeds.discard(seed)
+                if not seeds:
+                    del self._by_node[key]
+
+    def seeds(self, search: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._seeds.get(search)
+            if entry is None or self._expired(entry[0]):
+                return None
+            self._seeds.move_to_end(search)
+            return entry[1]
+
+    def put_seeds(self, search: str, seeds: List[str]):
+        if not seeds:
+            # Nothing matched yet; the entities may be ingested any moment
+            return
+        with self._lock:
+            self._seeds[search] = (time.monotonic(), seeds)
+            self._seeds.move_to_end(search)
+            while len(self._seeds) > 4 * max(self.max_entries, 1):
+                self._seeds.popitem(last=False)
+
+    def invalidate_entities(self, keys: Optional[List[str]] = None):
+        """
+        Drops every neighborhood containing one of `keys` (all of them for None).
+        New mentions can change which entities a text search finds, so cached
+        seed lookups are dropped on any change. `keys` are also published to
+        the other processes through the shared cache.
+        """
+        self._invalidate(keys)
+        if self.shared is None:
+            return
+        generation = self.shared.publish("graph", keys)
+        with self._lock:
+            # Our own event is not news to us, unless others came before it
+            if generation is not None and generation - 1 == self._shared_generation:
+                self._shared_generation = generation
+
+    def _invalidate(self, keys: Optional[List[str]]):
+        with self._lock:
+            self.stats["invalidations"] += 1
+            self.generation += 1
+            self._seeds.clear()
+            if keys is None:
+                self._entries.clear()
+                self._by_node.clear()
+                return
+            stale = set()
+            for key in keys:
+                stale |= self._by_node.get(key, set())
+            for seed in stale:
+                self._drop(seed)
+
+    async def sync(self):
+        """
+        Applies the invalidations other processes published since the last
+        check. The shared cache is polled in a thread, off the event loop.
+        """
+        now = time.monotonic()
+        if self.shared is None or now - self._synced_at < self.sync_interval_s:
+            return
+        self._synced_at = now
+        since = self._shared_generation
+        result = await asyncio.to_thread(self.shared.events, "graph", since)
+        if result is None:
+            return
+        generation, events = result
+        with self._lock:
+            if self._shared_generation != since:
+                return  # a concurrent sync got there first
+            self._shared_generation = generation
+        if events is None or None in events:
+            self._invalidate(None)
+        elif events:
+            self._invalidate([key for keys in events for key in keys])
+
+    def __len__(self):
+        return len(self._entries)
+
+
+subgraph_cache = SubgraphCache()
+register_entity_invalidation_hook(subgraph_cache.invalidate_entities)
@@ -0,0 +1,316 @@
+import inspect
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from src.utils.logger import logger
+from src.utils.resilience import hedged
+
+if TYPE_CHECKING:
+    # qdrant_client takes about a second to import; it is loaded on first use
+    from qdrant_client import AsyncQdrantClient, models
+
+# Payload fields written by ingestion that filters are expected on, with the
+# index type Qdrant needs to plan a filtered HNSW search instead of a scan
+DEFAULT_PAYLOAD_INDEXES = "doc_id:keyword,chunk_index:integer"
+
+# Values of models.PayloadSchemaType
+_SCHEMA_TYPES = ("keyword", "integer", "float", "bool", "datetime")
+
+_RANGE_KEYS = {"gt", "gte", "lt", "lte"}
+
+
+def payload_indexes(spec: str = None) -> Dict[str, "models.PayloadSchemaType"]:
+    """
+    Parses a "field:type,..." spec (default $QDRANT_PAYLOAD_INDEXES).
+    """
+    from qdrant_client import models
+
+    spec = spec if spec is not None else os.getenv("QDRANT_PAYLOAD_INDEXES")
+    spec = spec if spec is not None else DEFAULT_PAYLOAD_INDEXES
+    indexes = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        field, _, kind = item.partition(":")
+        if kind not in _SCHEMA_TYPES:
+            raise ValueError(f"Unknown payload index type {kind!r} for {field!r}")
+        indexes[field] = models.PayloadSchemaType(kind)
+    return indexes
+
+
+def validate_filters(filters: Optional[Dict[str, Any]]):
+    """
+    Raises ValueError unless every value in `filters` is one that build_filter
+    translates. Needs no Qdrant import, so the API checks requests with it.
+    """
+    for field, value in (filters or {}).items():
+        if isinstance(value, dict):
+            if not value or not set(value) <= _RANGE_KEYS:
+                raise ValueError(
+                    f"Filter on {field!r} must use only {sorted(_RANGE_KEYS)}"
+                )
+            if not all(_is_number(bound) for bound in value.values()):
+                raise ValueError(f"Range filter on {field!r} needs numeric bounds")
+        elif isinstance(value, (list, tuple, set)):
+            if not all(isinstance(item, (str, int)) for item in value):
+                raise ValueError(f"Filter on {field!r} must list strings or integers")
+        elif not isinstance(value, (str, int, bool)):
+            raise ValueError(f"Unsupported filter value for {field!r}: {value!r}")
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def build_filter(filters: Optional[Dict[str, Any]]) -> Optional["models.Filter"]:
+    """
+    Translates API `filters` into a Qdrant payload filter (all conditions must
+    hold): a scalar matches exactly, a list matches any of its values and a
+    dict of gt/gte/lt/lte is a range.
+    """
+    if not filters:
+        return None
+    validate_filters(filters)
+    from qdrant_client import models
+
+    conditions = []
+    for field, value in filters.items():
+        if isinstance(value, dict):
+            condition = models.FieldCondition(key=field, range=models.Range(**value))
+        elif isinstance(value, (list, tuple, set)):
+            condition = models.FieldCondition(
+                key=field, match=models.MatchAny(any=list(value))
+            )
+        else:
+            condition = models.FieldCondition(
+                key=field, match=models.MatchValue(value=value)
+            )
+        conditions.append(condition)
+    return models.Filter(must=conditions)
+
+
+def quantization_config(kind: str = None) -> Optional["models.QuantizationConfig"]:
+    """
+    Collection-side quantization for $QDRANT_QUANTIZATION: "scalar" (int8, 4x
+    smaller), "binary" (32x smaller; best with high-dimensional models) or "none".
+    Quantized vectors are kept in RAM while the originals can stay on disk.
+    """
+    from qdrant_client import models
+
+    kind = (kind or os.getenv("QDRANT_QUANTIZATION", "none")).lower()
+    if kind == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if kind == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown quantization {kind!r}")
+
+
+async def _maybe_await(result):
+    return await result if inspect.isawaitable(result) else result
+
+
+async def ensure_collection(
+    client,
+    collection_name: str,
+    dim: int,
+    indexes: Dict[str, "models.PayloadSchemaType"] = None,
+    quantization: str = None,
+):
+    """
+    Creates the collection if missing and the payload indexes on the filtered
+    fields; idempotent. Accepts a sync or an async client.
+    """
+    from qdrant_client import models
+
+    if not await _maybe_await(client.collection_exists(collection_name)):
+        await _maybe_await(
+            client.create_collection(
+                collection_name=collection_name,
+                vectors_config=models.VectorParams(
+                    size=dim, distance=models.Distance.COSINE
+                ),
+                quantization_config=quantization_config(quantization),
+            )
+        )
+    indexes = indexes if indexes is not None else payload_indexes()
+    for field, schema in indexes.items():
+        # Creating an existing index is a no-op on the server
+        await _maybe_await(
+            client.create_payload_index(
+                collection_name=collection_name, field_name=field, field_schema=schema
+            )
+        )
+    logger.info("Qdrant collection %r and payload indexes ensured.", collection_name)
+
+
+_client: Optional["AsyncQdrantClient"] = None
+_client_lock = threading.Lock()
+
+
+def get_qdrant_client() -> "AsyncQdrantClient":
+    """
+    Process-wide async Qdrant client, created on first use and shared by every
+    request (it keeps its HTTP connections alive). QDRANT_URL=":memory:" uses
+    the in-process local mode.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from qdrant_client import AsyncQdrantClient
+
+            url = os.getenv("QDRANT_URL", "http://localhost:6333")
+            if url == ":memory:":
+                _client = AsyncQdrantClient(location=url)
+            else:
+                _client = AsyncQdrantClient(
+                    url=url,
+                    api_key=os.getenv("QDRANT_API_KEY") or None,
+                    timeout=int(os.getenv("QDRANT_TIMEOUT_S", "5")),
+                    prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "false") == "true",
+                    pool_size=int(os.getenv("QDRANT_POOL_SIZE", "32")),
+                    # The version probe is a blocking request at construction time
+                    check_compatibility=False,
+                )
+        return _client
+
+
+async def close_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.close()
+
+
+class VectorRetriever:
+    """
+    Filtered k-NN search over the chunk collection.
+
+    Filters are applied by Qdrant during the HNSW traversal (backed by the
+    payload indexes), so a selective filter still returns `limit` hits without
+    post-filtering in Python. With a quantized collection the candidates are
+    scored on the compressed vectors, `oversampling` x `limit` of them are
+    rescored with the originals, and the best `limit` are returned.
+    """
+
+    def __init__(
+        self,
+        client: Optional["AsyncQdrantClient"] = None,
+        collection_name: str = None,
+        limit: int = None,
+        hnsw_ef: int = None,
+        rescore: bool = None,
+        oversampling: float = None,
+        health_check_s: float = None,
+    ):
+        self._client = client
+        self.collection_name = collection_name or os.getenv(
+            "QDRANT_COLLECTION", "enterprise_docs"
+        )
+        self.limit = limit or int(os.getenv("VECTOR_RESULT_LIMIT", "5"))
+        self.hnsw_ef = hnsw_ef or int(os.getenv("QDRANT_HNSW_EF", "128"))
+        self.rescore = (
+            rescore
+            if rescore is not None
+            else os.getenv("QDRANT_RESCORE", "true").lower() == "true"
+        )
+        self.oversampling = oversampling or float(
+            os.getenv("QDRANT_OVERSAMPLING", "2.0")
+        )
+        self.health_check_s = (
+            health_check_s
+            if health_check_s is not None
+            else float(os.getenv("QDRANT_HEALTH_CHECK_S", "30"))
+        )
+        self._health: Optional[tuple] = None  # (checked_at, ok)
+
+    @property
+    def client(self) -> "AsyncQdrantClient":
+        return self._client or get_qdrant_client()
+
+    async def healthy(self) -> bool:
+        """
+        Whether the collection is reachable, cached for `health_check_s`.
+        """
+        now = time.monotonic()
+        if self._health is None or now - self._health[0] > self.health_check_s:
+            try:
+                ok = await self.client.collection_exists(self.collection_name)
+            except Exception as e:
+                logger.warning("Qdrant health check failed: %s", e)
+                ok = False
+            self._health = (now, ok)
+        return self._health[1]
+
+    def search_params(self) -> "models.SearchParams":
+        from qdrant_client import models
+
+        return models.SearchParams(
+            hnsw_ef=self.hnsw_ef,
+            quantization=models.QuantizationSearchParams(
+                rescore=self.rescore, oversampling=self.oversampling
+            ),
+        )
+
+    async def search(
+        self,
+        vector,
+        filters: Optional[Dict[str, Any]] = None,
+        limit: int = None,
+    ) -> List["models.ScoredPoint"]:
+        query = list(map(float, vector))
+        query_filter = build_filter(filters)
+        # Searches slower than usual are hedged (another connection, and
+        # another replica when the collection is replicated)
+        response = await hedged(
+            "qdrant_search",
+            lambda: self.client.query_points(
+                collection_name=self.collection_name,
+                query=query,
+                query_filter=query_filter,
+                search_params=self.search_params(),
+                limit=limit or self.limit,
+                with_payload=True,
+            ),
+        )
+        return response.points
+
+    async def search_many(
+        self, vectors, filters: Optional[Dict[str, Any]] = None, limit: int = None
+    ) -> List[List["models.ScoredPoint"]]:
+        from qdrant_client import models
+
+        # One round trip for several queries
+        query_filter = build_filter(filters)
+        requests = [
+            models.QueryRequest(
+                query=list(map(float, vector)),
+                filter=query_filter,
+                params=self.search_params(),
+                limit=limit or self.limit,
+                with_payload=True,
+            )
+            for vector in vectors
+        ]
+        responses = await hedged(
+            "qdrant_batch_search",
+            lambda: self.client.query_batch_points(
+                collection_name=self.collection_name, requests=requests
+            ),
+        )
+        return [response.points for response in responses]
+
+    @staticmethod
+    def format(points: List["models.ScoredPoint"]) -> List[str]:
+        return [point.payload.get("text", "") for point in points]
+
+
+vector_retriever = VectorRetriever()
@@ -1,58 +1,291 @@
+import atexit
+import json
 import logging
-import sys
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from src.utils.tracing import correlation_id
+
+
+class CorrelationIdFilter(logging.Filter):
+    """
+    Stamps every record with the current request's correlation id ("-" outside one).
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get() or "-"
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Keeps a `rate` fraction of DEBUG records; other levels always pass.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log shippers; `extra=` fields are included.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "correlation_id": getattr(record, "correlation_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread through a bounded queue, so the caller
+    (usually the event loop) never waits on file or console I/O.
+
+    When the queue is full, records below WARNING are dropped and counted;
+    WARNING and above wait up to `block_s` for space before being dropped too.
+    The listener reports the number dropped once it catches up.
+    """
+
+    def __init__(self, log_queue: queue.Queue, block_s: float = 0.05):
+        super().__init__(log_queue)
+        self.block_s = block_s
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args into the message now, while they still hold their current
+        # values. Everything else, tracebacks included, is formatted by the
+        # listener. Records never leave the process, so no copy is needed.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=self.block_s)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def take_dropped(self) -> int:
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class _ReportingListener(QueueListener):
+    """
+    Queue listener that logs how many records were dropped, at most once per
+    `interval_s`, whenever the queue has drained.
+    """
+
+    def __init__(self, handler: BoundedQueueHandler, *handlers, interval_s=10.0):
+        super().__init__(handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = handler
+        self.interval_s = interval_s
+        self._reported_at = 0.0
+
+    def stop(self):
+        # Safe to call twice (e.g. explicitly and again at exit)
+        if self._thread is not None:
+            super().stop()
+
+    def enqueue_sentinel(self):
+        # The queue may be full; the listener thread is draining it, so wait
+        self.queue.put(self._sentinel)
+
+    def handle(self, record: logging.LogRecord):
+        super().handle(record)
+        now = time.monotonic()
+        if self.queue.empty() and now - self._reported_at > self.interval_s:
+            self._reported_at = now
+            dropped = self.queue_handler.take_dropped()
+            if dropped:
+                super().handle(
+                    logging.makeLogRecord(
+                        {
+                            "name": record.name,
+                            "levelno": logging.WARNING,
+                            "levelname": "WARNING",
+                            "msg": f"Log queue full: dropped {dropped} records",
+                            "correlation_id": "-",
+                        }
+                    )
+                )
+
+
+def _formatter() -> logging.Formatter:
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        return JsonFormatter()
+    return logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] - %(message)s"
+    )
+
+
+def _level() -> str:
+    # Without a DEBUG destination, debug calls return before building a record
+    if os.getenv("LOG_DEBUG_FILE", "true").lower() == "true":
+        return "DEBUG"
+    return os.getenv("LOG_LEVEL", "INFO").upper()
+
+
+class _DeferredSetup(logging.Handler):
+    """
+    Placeholder handler installed at import: the first record that reaches it
+    runs `setup_logger` and is passed on to the real handlers. Importing this
+    module therefore creates no directory, opens no file and starts no thread.
+    """
+
+    def __init__(self, logger_name: str):
+        super().__init__()
+        self.logger_name = logger_name
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        logger = setup_logger(self.logger_name)
+        for handler in logger.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record: logging.LogRecord):
+        pass
+
+
+_setup_lock = threading.Lock()
+_configured = []
+_forked_child = False
 
 
 def setup_logger(name: str = "cognigraph"):
     logger = logging.getLogger(name)
 
-    # prevent adding multiple handlers if setup is called multiple times
-    if logger.hasHandlers():
-        return logger
+    with _setup_lock:
+        # prevent adding multiple handlers if setup is called multiple times
+        if any(not isinstance(h, _DeferredSetup) for h in logger.handlers):
+            return logger
 
-    logger.setLevel(logging.DEBUG)  # Capture all, handlers will filter
+        console_level = os.getenv("LOG_LEVEL", "INFO").upper()
+        debug_file = os.getenv("LOG_DEBUG_FILE", "true").lower() == "true"
+        logger.setLevel(_level())
+        if not any(isinstance(f, CorrelationIdFilter) for f in logger.filters):
+            logger.addFilter(CorrelationIdFilter())
 
-    # Common Formatter
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
+        # Common Formatter
+        formatter = _formatter()
 
-    # 1. Console Handler (Stdout) - Info and above
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+        # 1. Console Handler (Stdout) - Info and above
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setLevel(console_level)
+        console_handler.setFormatter(formatter)
+        handlers = [console_handler]
 
-    # Ensure logs directory exists
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
+        # Ensure logs directory exists
+        log_dir = "logs"
+        os.makedirs(log_dir, exist_ok=True)
 
-    # 2. File Handler (Info) - General application flow
-    info_handler = RotatingFileHandler(
-        os.path.join(log_dir, "app.log"), maxBytes=10 * 1024 * 1024, backupCount=5
-    )
-    info_handler.setLevel(logging.INFO)
-    info_handler.setFormatter(formatter)
-    logger.addHandler(info_handler)
+        # 2. File Handler (Info) - General application flow
+        info_handler = RotatingFileHandler(
+            os.path.join(log_dir, "app.log"), maxBytes=10 * 1024 * 1024, backupCount=5
+        )
+        info_handler.setLevel(logging.INFO)
+        info_handler.setFormatter(formatter)
+        handlers.append(info_handler)
 
-    # 3. File Handler (Error) - Critical issues
-    error_handler = RotatingFileHandler(
-        os.path.join(log_dir, "error.log"), maxBytes=10 * 1024 * 1024, backupCount=5
-    )
-    error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(formatter)
-    logger.addHandler(error_handler)
+        # 3. File Handler (Error) - Critical issues
+        error_handler = RotatingFileHandler(
+            os.path.join(log_dir, "error.log"),
+            maxBytes=10 * 1024 * 1024,
+            backupCount=5,
+        )
+        error_handler.setLevel(logging.ERROR)
+        error_handler.setFormatter(formatter)
+        handlers.append(error_handler)
 
-    # 4. File Handler (Debug) - Detailed execution trace
-    debug_handler = RotatingFileHandler(
-        os.path.join(log_dir, "debug.log"), maxBytes=10 * 1024 * 1024, backupCount=3
-    )
-    debug_handler.setLevel(logging.DEBUG)
-    debug_handler.setFormatter(formatter)
-    logger.addHandler(debug_handler)
+        # 4. File Handler (Debug) - Detailed execution trace
+        if debug_file:
+            debug_handler = RotatingFileHandler(
+                os.path.join(log_dir, "debug.log"),
+                maxBytes=10 * 1024 * 1024,
+                backupCount=3,
+            )
+            debug_handler.setLevel(logging.DEBUG)
+            debug_handler.setFormatter(formatter)
+            handlers.append(debug_handler)
+
+        sampling = DebugSamplingFilter(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0")))
+        if _forked_child:
+            # No listener thread in forked children, see below
+            logger.handlers = handlers
+            logger.addFilter(sampling)
+            return logger
+
+        # The handlers above run on a listener thread; callers only enqueue
+        queue_handler = BoundedQueueHandler(
+            queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))),
+            block_s=float(os.getenv("LOG_QUEUE_BLOCK_S", "0.05")),
+        )
+        queue_handler.addFilter(sampling)
+        # Replaces the deferred-setup placeholder, if any
+        logger.handlers = [queue_handler]
+        listener = _ReportingListener(queue_handler, *handlers)
+        listener.start()
+        # Flushes whatever is still queued on interpreter exit
+        atexit.register(listener.stop)
+        logger.listener = listener
+        _configured.append(logger)
 
     return logger
 
 
-logger = setup_logger()
+def _log_synchronously_in_child():
+    # A forked child (e.g. a ProcessPoolExecutor worker) inherits the queue but
+    # not the listener thread, possibly with a queue lock held mid-put by another
+    # parent thread, and exits without running atexit. It writes to the
+    # handlers directly instead (logging re-creates their locks after a fork).
+    global _setup_lock, _forked_child
+    _setup_lock = threading.Lock()
+    _forked_child = True
+    for logger in _configured:
+        listener = logger.listener
+        logger.handlers = list(listener.handlers)
+        for f in listener.queue_handler.filters:
+            logger.addFilter(f)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_log_synchronously_in_child)
+
+
+logger = logging.getLogger("cognigraph")
+logger.setLevel(_level())
+logger.addFilter(CorrelationIdFilter())
+logger.addHandler(_DeferredSetup(logger.name))
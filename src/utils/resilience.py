@@ -0,0 +1,267 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from src.utils.logger import logger
+from src.utils.tracing import metrics, span
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """
+    Raised when a request's deadline has passed before a call could start; a
+    kind of asyncio.TimeoutError, so callers handle both the same way.
+    """
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of calling a dependency whose circuit breaker is open.
+    """
+
+    def __init__(self, name: str, retry_after_s: float):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+        self.retry_after_s = retry_after_s
+
+
+def deadline_after(seconds: float = None) -> float:
+    """
+    Deadline (a time.monotonic() value) `seconds` from now, by default the
+    per-request budget REQUEST_DEADLINE_S.
+    """
+    if seconds is None:
+        seconds = float(os.getenv("REQUEST_DEADLINE_S", "15"))
+    return time.monotonic() + seconds
+
+
+def remaining(deadline: Optional[float], cap: float = None) -> Optional[float]:
+    """
+    Seconds left before `deadline`, at most `cap`; None when neither is set.
+    Raises DeadlineExceeded once the deadline has passed.
+    """
+    if deadline is None:
+        return cap
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left if cap is None else min(left, cap)
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a dependency after `failure_threshold` consecutive failures
+    (errors or timeouts). While open, callers skip the dependency immediately
+    instead of waiting on it. After `reset_after_s` the circuit is half-open:
+    one trial call goes through while the others are still skipped, and its
+    result closes the circuit or reopens it. A trial that has not finished
+    within another `reset_after_s` no longer holds the others back.
+    """
+
+    def __init__(
+        self, name: str, failure_threshold: int = None, reset_after_s: float = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(
+            os.getenv("BREAKER_FAILURE_THRESHOLD", "5")
+        )
+        self.reset_after_s = (
+            reset_after_s
+            if reset_after_s is not None
+            else float(os.getenv("BREAKER_RESET_S", "10"))
+        )
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_after_s:
+            return "open"
+        return "half_open"
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+    def retry_after_s(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_after_s - time.monotonic())
+
+    def check(self):
+        """
+        Raises CircuitOpen while the circuit is open, and while it is half-open
+        for every caller but the one that gets to make the trial call.
+        """
+        with self._lock:
+            state = self.state
+            if state == "half_open":
+                now = time.monotonic()
+                probing = self.probe_started_at is not None and (
+                    now - self.probe_started_at < self.reset_after_s
+                )
+                if not probing:
+                    self.probe_started_at = now
+                    return
+            if state != "closed":
+                raise CircuitOpen(self.name, self.retry_after_s())
+
+    def abandon(self):
+        """
+        Gives up the trial call of a caller that ended without an outcome (for
+        example, it was cancelled), so the next caller can make one.
+        """
+        with self._lock:
+            self.probe_started_at = None
+
+    def record(self, ok: bool):
+        with self._lock:
+            self.probe_started_at = None
+            if ok:
+                if self.opened_at is not None:
+                    logger.info("%s circuit closed", self.name)
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            # A failed half-open call reopens the circuit straight away
+            half_open = self.opened_at is not None
+            if self.state != "open" and (
+                half_open or self.failures >= self.failure_threshold
+            ):
+                logger.warning(
+                    "%s circuit opened after %d failures; skipping it for %.0fs",
+                    self.name,
+                    self.failures,
+                    self.reset_after_s,
+                )
+                self.opened_at = time.monotonic()
+
+    async def call(self, fn: Callable[[], Awaitable[T]], timeout_s: float = None) -> T:
+        """
+        Awaits `fn()` within `timeout_s` if the circuit allows it, recording the
+        outcome. Cancellation from outside is not counted either way.
+        """
+        self.check()
+        try:
+            result = await asyncio.wait_for(fn(), timeout_s)
+        except asyncio.CancelledError:
+            self.abandon()
+            raise
+        except Exception:
+            self.record(False)
+            raise
+        self.record(True)
+        return result
+
+
+class BreakerRegistry:
+    """
+    One circuit breaker per dependency name ("qdrant", "neo4j", "llm").
+    """
+
+    def __init__(self, namespace: str = "cognigraph"):
+        self.namespace = namespace
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(name, CircuitBreaker(name))
+        return breaker
+
+    def reset(self):
+        with self._lock:
+            self._breakers = {}
+
+    def render(self) -> str:
+        """
+        Breaker states as a Prometheus gauge (0 closed, 1 half-open, 2 open).
+        """
+        name = f"{self.namespace}_circuit_state"
+        lines = [
+            f"# HELP {name} Circuit breaker state per dependency "
+            "(0 closed, 1 half-open, 2 open).",
+            f"# TYPE {name} gauge",
+        ]
+        codes = {"closed": 0, "half_open": 1, "open": 2}
+        for dependency, breaker in sorted(self._breakers.items()):
+            lines.append(f'{name}{{dependency="{dependency}"}} {codes[breaker.state]}')
+        return "\n".join(lines) + "\n"
+
+
+breakers = BreakerRegistry()
+
+
+def hedge_delay(stage: str) -> Optional[float]:
+    """
+    Seconds after which a `stage` call is hedged: its HEDGE_QUANTILE latency
+    over recent calls, but at least HEDGE_MIN_DELAY_S (hedging fast calls buys
+    little). None (no hedging) until HEDGE_MIN_SAMPLES calls have been timed,
+    or when HEDGE_ENABLED=false.
+    """
+    if os.getenv("HEDGE_ENABLED", "true").lower() != "true":
+        return None
+    histogram = metrics.histogram(stage)
+    if len(histogram.recent) < int(os.getenv("HEDGE_MIN_SAMPLES", "20")):
+        return None
+    delay = histogram.quantile(float(os.getenv("HEDGE_QUANTILE", "0.95")))
+    return max(delay, float(os.getenv("HEDGE_MIN_DELAY_S", "0.05")))
+
+
+async def _timed(stage: str, fn: Callable[[], Awaitable[T]], attributes) -> T:
+    with span(stage, **attributes):
+        return await fn()
+
+
+async def hedged(
+    stage: str,
+    fn: Callable[[], Awaitable[T]],
+    backup: Callable[[], Awaitable[T]] = None,
+    **attributes,
+) -> T:
+    """
+    Awaits `fn()` in a `stage` span, which times it into the histogram whose
+    recent quantiles set the hedge delay. If it is still running after
+    `hedge_delay(stage)`, `backup()` is started too and whichever succeeds
+    first wins; the other is cancelled. By default the backup is `fn()` again,
+    which the connection pool or load balancer sends to another replica.
+
+    Only for idempotent reads. Work already handed to a thread cannot be
+    cancelled and runs to completion in the background.
+    """
+    delay = hedge_delay(stage)
+    if delay is None:
+        return await _timed(stage, fn, attributes)
+
+    first = asyncio.ensure_future(_timed(stage, fn, attributes))
+    attempts = [first]
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if done:
+            return first.result()
+        logger.debug("Hedging %s after %.0fms", stage, delay * 1000)
+        attempts.append(asyncio.ensure_future(_timed(stage, backup or fn, attributes)))
+        pending = set(attempts)
+        while True:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+            if not pending:
+                # Both failed: report the original attempt's error
+                return first.result()
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
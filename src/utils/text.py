@@ -0,0 +1,9 @@
+import re
+from typing import List
+
+# Word pieces and punctuation: a cheap, tokenizer-free stand-in for model tokens
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text)
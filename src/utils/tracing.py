@@ -0,0 +1,223 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+# Set per request by the API middleware; copied into every task and thread the
+# request spawns, so agent nodes and LLM calls log under the same id
+correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "correlation_id", default=None
+)
+
+# Seconds; Prometheus' defaults, extended down to 1ms for in-process stages
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """
+    Cumulative-bucket histogram (aggregatable across workers by Prometheus) plus
+    a window of the most recent `window` samples for exact local p50/p95/p99.
+    Observing is O(log buckets); quantiles are only computed at scrape time.
+    """
+
+    def __init__(
+        self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = None
+    ):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent: deque = deque(
+            maxlen=window or int(os.getenv("METRICS_QUANTILE_WINDOW", "1024"))
+        )
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            self.recent.append(seconds)
+
+    def quantiles(self, quantiles: Tuple[float, ...] = QUANTILES) -> Dict[float, float]:
+        import numpy as np  # only needed at scrape time
+
+        with self._lock:
+            recent = np.fromiter(self.recent, dtype=float, count=len(self.recent))
+        if not len(recent):
+            return {q: 0.0 for q in quantiles}
+        values = np.quantile(recent, quantiles)
+        return dict(zip(quantiles, values.tolist()))
+
+    def quantile(self, q: float) -> float:
+        return self.quantiles((q,))[q]
+
+
+class MetricsRegistry:
+    """
+    Latency histograms keyed by stage name, rendered in the Prometheus text format.
+    """
+
+    def __init__(self, namespace: str = "cognigraph"):
+        self.namespace = namespace
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> LatencyHistogram:
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, LatencyHistogram())
+        return histogram
+
+    def observe(self, stage: str, seconds: float):
+        self.histogram(stage).observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        Count and recent p50/p95/p99 (in milliseconds) per stage.
+        """
+        out = {}
+        for stage, histogram in sorted(self._histograms.items()):
+            quantiles = histogram.quantiles()
+            out[stage] = {
+                "count": histogram.count,
+                **{f"p{int(q * 100)}_ms": v * 1000 for q, v in quantiles.items()},
+            }
+        return out
+
+    def render(self) -> str:
+        name = f"{self.namespace}_stage_latency_seconds"
+        recent = f"{self.namespace}_stage_latency_recent_seconds"
+        lines = [
+            f"# HELP {name} Latency of each request stage.",
+            f"# TYPE {name} histogram",
+        ]
+        summaries = [
+            f"# HELP {recent} Latency quantiles over the most recent samples.",
+            f"# TYPE {recent} summary",
+        ]
+        for stage, histogram in sorted(self._histograms.items()):
+            with histogram._lock:
+                counts, count, total = (
+                    list(histogram.counts),
+                    histogram.count,
+                    histogram.sum,
+                )
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+            for q, value in histogram.quantiles().items():
+                summaries.append(f'{recent}{{stage="{stage}",quantile="{q}"}} {value}')
+            summaries.append(f'{recent}_sum{{stage="{stage}"}} {total}')
+            summaries.append(f'{recent}_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines + summaries) + "\n"
+
+
+metrics = MetricsRegistry()
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def _otel_tracer():
+    """
+    OpenTelemetry tracer when TRACING_OTEL=true and the API package is installed.
+    Exporters are configured by the deployment (SDK / opentelemetry-instrument);
+    without one the API hands out no-op spans.
+    """
+    global _tracer
+    if os.getenv("TRACING_OTEL", "false").lower() != "true":
+        return None
+    with _tracer_lock:
+        if _tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                from src.utils.logger import logger
+
+                logger.warning("TRACING_OTEL is set but opentelemetry is not installed")
+                _tracer = False
+            else:
+                _tracer = trace.get_tracer("cognigraph")
+        return _tracer or None
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Dict]:
+    """
+    Times the enclosed block into the `name` histogram and, when enabled,
+    mirrors it as an OpenTelemetry span tagged with the correlation id. Works in
+    sync and async code; yields a dict that receives `ms` on exit. A cancelled
+    block (e.g. the losing attempt of a hedged call) is not a latency sample.
+    """
+    record: Dict = {}
+    tracer = _otel_tracer()
+    otel = None
+    if tracer is not None:
+        otel = tracer.start_as_current_span(name)
+        current = otel.__enter__()
+        current.set_attribute("correlation_id", correlation_id.get() or "")
+        for key, value in attributes.items():
+            current.set_attribute(key, value)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield record
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if not isinstance(error, asyncio.CancelledError):
+            metrics.observe(name, elapsed)
+        record["ms"] = elapsed * 1000
+        if otel is not None:
+            # Records the exception, if any, on the OpenTelemetry span
+            exc_info = (type(error), error, error.__traceback__) if error else ()
+            otel.__exit__(*(exc_info or (None, None, None)))
+
+
+def traced(name: str):
+    """
+    Decorator form of `span` for async functions such as agent nodes.
+    """
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
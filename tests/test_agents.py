@@ -1,23 +1,54 @@
+import asyncio
+import json
+import time
+import httpx
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from src.agents.planner import planner_node
+from src.agents.plan_classifier import classifier, plan_cache
 from src.agents.state import AgentState
-from src.llm.client import LLMClient
+from src.agents.workflow import build_workflow
+from src.llm.client import LLMClient, _pool
+from src.utils.resilience import CircuitBreaker, CircuitOpen, breakers, hedged
+from src.utils.tracing import metrics
 
 # --- Unit Tests for Agents ---
 
 
+@pytest.fixture(autouse=True)
+def empty_plan_cache():
+    plan_cache.clear()
+    yield
+    plan_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def closed_breakers():
+    breakers.reset()
+    yield
+    breakers.reset()
+
+
 @pytest.fixture
 def mock_llm_client():
     with patch("src.agents.planner.LLMClient") as MockClient:
         client_instance = MockClient.return_value
+        client_instance.aplan_query = AsyncMock()
         yield client_instance
 
 
-def test_planner_agent_vector_strategy(mock_llm_client):
+@pytest.fixture
+def llm_planner_only(mock_llm_client):
+    """Disables the local fast path so every plan goes to the (mocked) LLM."""
+    with patch.dict("os.environ", {"PLANNER_CONFIDENCE_THRESHOLD": "1.01"}):
+        yield mock_llm_client
+
+
+def test_planner_agent_vector_strategy(llm_planner_only):
     """Test that the planner correctly identifies a vector strategy."""
+    mock_llm_client = llm_planner_only
     # Setup
-    mock_llm_client.plan_query.return_value = "vector"
+    mock_llm_client.aplan_query.return_value = "vector"
     state = AgentState(
         query="find documents about policy",
         plan=None,
@@ -27,17 +58,20 @@ def test_planner_agent_vector_strategy(mock_llm_client):
     )
 
     # Execute
-    result = planner_node(state)
+    result = asyncio.run(planner_node(state))
 
     # Assert
     assert result["plan"] == "vector"
-    mock_llm_client.plan_query.assert_called_once_with("find documents about policy")
+    mock_llm_client.aplan_query.assert_awaited_once_with(
+        "find documents about policy", timeout_s=3.0
+    )
 
 
-def test_planner_agent_graph_strategy(mock_llm_client):
+def test_planner_agent_graph_strategy(llm_planner_only):
     """Test that the planner correctly identifies a graph strategy."""
+    mock_llm_client = llm_planner_only
     # Setup
-    mock_llm_client.plan_query.return_value = "graph"
+    mock_llm_client.aplan_query.return_value = "graph"
     state = AgentState(
         query="how is entity A related to B?",
         plan=None,
@@ -47,12 +81,53 @@ def test_planner_agent_graph_strategy(mock_llm_client):
     )
 
     # Execute
-    result = planner_node(state)
+    result = asyncio.run(planner_node(state))
 
     # Assert
     assert result["plan"] == "graph"
 
 
+def test_planner_fast_path_skips_llm(mock_llm_client):
+    """Test that clear-cut queries are planned locally without an LLM call."""
+    state = AgentState(query="How is Alice related to Project X delay?")
+
+    result = asyncio.run(planner_node(state))
+
+    assert result["plan"] == "graph"
+    mock_llm_client.aplan_query.assert_not_called()
+
+
+def test_classifier_defers_queries_with_conflicting_cues():
+    """Test that vector-looking queries about people or relations are not fast-pathed."""
+    for query in [
+        "What is the leave policy for Bob Smith?",
+        "list documents approved by the CFO",
+        "Who wrote the incident report?",
+    ]:
+        decision = classifier.classify(query)
+        assert decision.plan == "hybrid" or decision.confidence < 0.8, query
+
+    for query, plan in [
+        ("Find documents about remote work policy", "vector"),
+        ("Who reports to Bob Smith?", "graph"),
+        ("Which teams does Alice work with?", "graph"),
+    ]:
+        decision = classifier.classify(query)
+        assert decision.plan == plan and decision.confidence >= 0.8, query
+
+
+def test_planner_falls_back_to_llm_and_caches(mock_llm_client):
+    """Test that ambiguous queries go to the LLM once, then hit the plan cache."""
+    mock_llm_client.aplan_query.return_value = "vector"
+    assert classifier.classify("tell me something").confidence < 0.8
+
+    first = asyncio.run(planner_node(AgentState(query="Tell me something?")))
+    second = asyncio.run(planner_node(AgentState(query="  tell me   SOMETHING ")))
+
+    assert first["plan"] == second["plan"] == "vector"
+    mock_llm_client.aplan_query.assert_awaited_once()
+
+
 # --- Test LLM Client ---
 
 
@@ -61,3 +136,294 @@ def test_llm_client_fallback():
     client = LLMClient(base_url="http://bad-url:9999")
     response = client.generate("test")
     assert "mock LLM response" in response
+
+
+def test_llm_client_async_fallback():
+    """Test that the async path falls back the same way as the sync one."""
+    client = LLMClient(base_url="http://bad-url:9999")
+    response = asyncio.run(client.agenerate("test"))
+    assert "mock LLM response" in response
+
+
+def test_synthesizer_flags_the_mock_answer_as_degraded(monkeypatch):
+    """Test that an answer from an unreachable LLM is marked so it is not cached."""
+    from src.agents.synthesizer import synthesizer_node
+
+    monkeypatch.setenv("RAY_SERVE_URL", "http://bad-url:9999")
+    result = asyncio.run(synthesizer_node({"query": "q", "context": []}))
+    assert result["degraded"] == ["synthesizer"]
+
+
+def test_llm_client_coalesces_identical_prompts():
+    """Test that concurrent identical prompts share one upstream request."""
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"text": "graph"})
+
+    async def run():
+        pooled = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.object(_pool, "async_client", return_value=pooled):
+            client = LLMClient(base_url="http://llm")
+            results = await asyncio.gather(
+                client.aplan_query("who manages X?"),
+                client.aplan_query("who manages X?"),
+                client.agenerate("a different prompt"),
+            )
+        await pooled.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert results == ["graph", "graph", "graph"]
+    assert len(calls) == 2
+
+
+def test_llm_generations_are_timed_per_call_type_and_never_hedged():
+    """Test that a slow generation is not duplicated and planner calls have their own histogram."""
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"text": "graph"})
+
+    async def run():
+        pooled = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.object(_pool, "async_client", return_value=pooled):
+            client = LLMClient(base_url="http://llm")
+            await client.agenerate("synthesize this")
+            await client.aplan_query("who manages X?")
+        await pooled.aclose()
+
+    metrics.reset()
+    for _ in range(20):
+        metrics.observe("llm_http", 0.001)
+    with patch.dict("os.environ", {"HEDGE_MIN_DELAY_S": "0.01"}):
+        asyncio.run(run())
+
+    assert len(calls) == 2
+    assert len(metrics.histogram("llm_http").recent) == 21
+    assert len(metrics.histogram("llm_http_plan").recent) == 1
+
+
+# --- Test Workflow ---
+
+
+def _slow_node(key, delay_s):
+    async def node(state):
+        await asyncio.sleep(delay_s)
+        return {key: [f"{key} for {state['query']}"]}
+
+    return node
+
+
+async def _hybrid_planner(state):
+    return {"plan": "hybrid"}
+
+
+async def _echo_synthesizer(state):
+    return {
+        "final_answer": " | ".join(state["vector_results"] + state["graph_results"])
+    }
+
+
+def _build_test_workflow(vector_delay_s, graph_delay_s):
+    with patch("src.agents.workflow.planner_node", _hybrid_planner), patch(
+        "src.agents.workflow.vector_search_node",
+        _slow_node("vector_results", vector_delay_s),
+    ), patch(
+        "src.agents.workflow.graph_search_node",
+        _slow_node("graph_results", graph_delay_s),
+    ), patch(
+        "src.agents.workflow.synthesizer_node", _echo_synthesizer
+    ):
+        return build_workflow()
+
+
+def test_hybrid_branches_run_concurrently():
+    """Test that hybrid latency is max(vector, graph) rather than their sum."""
+    graph = _build_test_workflow(0.2, 0.2)
+    start = time.perf_counter()
+    result = asyncio.run(
+        graph.ainvoke({"query": "q", "vector_results": [], "graph_results": []})
+    )
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.35
+    assert result["final_answer"] == "vector_results for q | graph_results for q"
+    assert set(result["timings"]) == {"vector_search", "graph_search", "fusion"}
+
+
+def test_hybrid_branch_deadline_skips_slow_retriever():
+    """Test that a branch past its deadline is dropped instead of blocking synthesis."""
+    with patch.dict("os.environ", {"RETRIEVAL_BRANCH_TIMEOUT_S": "0.05"}):
+        graph = _build_test_workflow(0.0, 1.0)
+    result = asyncio.run(
+        graph.ainvoke({"query": "q", "vector_results": [], "graph_results": []})
+    )
+
+    assert result["graph_results"] == []
+    assert result["final_answer"] == "vector_results for q"
+    assert result["timings"]["graph_search"] < 500
+
+
+def test_failing_retriever_degrades_and_trips_its_breaker():
+    """Test that backend errors reach the branch's breaker instead of counting as successes."""
+
+    async def failing(state):
+        raise ConnectionError("neo4j unreachable")
+
+    with patch("src.agents.workflow.planner_node", _hybrid_planner), patch(
+        "src.agents.workflow.vector_search_node", _slow_node("vector_results", 0)
+    ), patch("src.agents.workflow.graph_search_node", failing), patch(
+        "src.agents.workflow.synthesizer_node", _echo_synthesizer
+    ), patch.dict(
+        "os.environ", {"BREAKER_FAILURE_THRESHOLD": "2"}
+    ):
+        graph = build_workflow()
+        for _ in range(2):
+            result = asyncio.run(
+                graph.ainvoke({"query": "q", "vector_results": [], "graph_results": []})
+            )
+
+    assert result["graph_results"] == []
+    assert result["degraded"] == ["graph_search"]
+    assert breakers.get("neo4j").state == "open"
+
+
+def test_llm_client_streams_tokens():
+    """Test that astream yields tokens from the NDJSON streaming endpoint."""
+
+    async def handler(request):
+        assert request.url.path == "/generate_stream"
+        body = '{"text": "Hello "}\n{"text": "world"}\n'
+        return httpx.Response(200, text=body)
+
+    async def run():
+        pooled = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.object(_pool, "async_client", return_value=pooled):
+            tokens = [t async for t in LLMClient(base_url="http://llm").astream("hi")]
+        await pooled.aclose()
+        return tokens
+
+    assert asyncio.run(run()) == ["Hello ", "world"]
+
+
+def test_failed_llm_streams_trip_the_breaker():
+    """Test that a stream ending in an HTTP error counts against the LLM breaker."""
+
+    async def handler(request):
+        return httpx.Response(503, text="overloaded")
+
+    async def run():
+        pooled = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.object(_pool, "async_client", return_value=pooled):
+            for _ in range(2):
+                with pytest.raises(httpx.HTTPStatusError):
+                    async for _ in LLMClient(base_url="http://llm").astream("hi"):
+                        pass
+        await pooled.aclose()
+
+    with patch.dict("os.environ", {"BREAKER_FAILURE_THRESHOLD": "2"}):
+        asyncio.run(run())
+    assert breakers.get("llm").state == "open"
+
+
+def test_llm_client_batch_dedupes_prompts():
+    """Test that agenerate_batch sends each distinct prompt once, in one call."""
+    calls = []
+
+    async def handler(request):
+        prompts = json.loads(request.content)["prompts"]
+        calls.append(prompts)
+        return httpx.Response(200, json={"texts": [p.upper() for p in prompts]})
+
+    async def run():
+        pooled = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.object(_pool, "async_client", return_value=pooled):
+            client = LLMClient(base_url="http://llm")
+            texts = await client.agenerate_batch(["a", "b", "a"])
+        await pooled.aclose()
+        return texts
+
+    metrics.reset()
+    assert asyncio.run(run()) == ["A", "B", "A"]
+    assert calls == [["a", "b"]]
+    # Batch latencies stay out of the histogram that sets the hedge delay
+    assert metrics.snapshot().keys() == {"llm_http_batch"}
+
+
+def test_circuit_breaker_opens_and_recovers():
+    """Test that a breaker opens after repeated failures and closes after a good half-open call."""
+    breaker = CircuitBreaker("dep", failure_threshold=2, reset_after_s=0.05)
+
+    async def fail():
+        raise ConnectionError("down")
+
+    async def ok():
+        return "up"
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await breaker.call(fail)
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpen):
+            await breaker.call(ok)
+
+        await asyncio.sleep(0.06)
+        assert breaker.state == "half_open"
+        # Only one trial call at a time while half-open
+        probe = asyncio.ensure_future(breaker.call(lambda: asyncio.sleep(0.01, "up")))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpen):
+            await breaker.call(ok)
+        return await probe
+
+    assert asyncio.run(run()) == "up"
+    assert breaker.state == "closed"
+
+
+def test_hedged_call_returns_the_faster_backup():
+    """Test that a call slower than the stage's recent p95 is hedged with a backup."""
+    metrics.reset()
+    for _ in range(20):
+        metrics.observe("test_hedge", 0.01)
+    attempts = []
+
+    async def call():
+        attempts.append(len(attempts))
+        await asyncio.sleep(1.0 if len(attempts) == 1 else 0.0)
+        return len(attempts)
+
+    start = time.perf_counter()
+    with patch.dict("os.environ", {"HEDGE_MIN_DELAY_S": "0.05"}):
+        result = asyncio.run(hedged("test_hedge", call))
+
+    assert result == 2
+    assert attempts == [0, 1]
+    assert time.perf_counter() - start < 0.5
+
+
+def test_planner_falls_back_to_classifier_on_llm_http_errors(llm_planner_only):
+    """Test that an HTTP error from the LLM degrades planning instead of failing."""
+    llm_planner_only.aplan_query.side_effect = httpx.ReadTimeout("slow")
+    result = asyncio.run(planner_node(AgentState(query="who manages project x?")))
+
+    assert result["plan"] in ("vector", "graph", "hybrid")
+    assert plan_cache.get("who manages project x?") is None  # fallbacks not cached
+
+
+def test_open_breaker_degrades_hybrid_plan(mock_llm_client):
+    """Test that the planner drops a branch whose dependency's circuit is open."""
+    mock_llm_client.aplan_query.return_value = "hybrid"
+    breakers.get("neo4j").opened_at = time.monotonic()
+    state = AgentState(query="how does the policy relate to the audit?")
+
+    with patch.dict("os.environ", {"PLANNER_CONFIDENCE_THRESHOLD": "1.01"}):
+        result = asyncio.run(planner_node(state))
+
+    assert result["plan"] == "vector"
+    assert result["degraded"] == ["graph_search"]
@@ -1,12 +1,31 @@
+import asyncio
+import json
 import pytest
 import os
+import subprocess
+import sys
 from fastapi.testclient import TestClient
-from unittest.mock import patch
-from src.api.main import app
+from unittest.mock import AsyncMock, patch
+from src.api.admission import AdmissionController, Saturated
+from src.agents.batch import BatchItem, BatchRunner
+from src.api import main
+from src.api.main import app, create_app
+from src.cache.answer_cache import answer_cache
+from src.llm.client import LLMClient
+from src.llm.prompts import PLANNER_SYSTEM_PROMPT
+from src.utils.resilience import CircuitOpen
+from src.utils.tracing import MetricsRegistry, correlation_id, span
 
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def empty_answer_cache():
+    answer_cache.clear()
+    yield
+    answer_cache.clear()
+
+
 @pytest.fixture
 def mock_graph_app():
     with patch("src.api.main.graph_app") as mock_app:
@@ -22,10 +41,12 @@ def test_health_check():
 def test_query_endpoint(mock_graph_app):
     """Test the /query endpoint calls the graph and returns results."""
     # Setup mock return from graph
-    mock_graph_app.invoke.return_value = {
-        "final_answer": "Test Answer",
-        "plan": "hybrid",
-    }
+    mock_graph_app.ainvoke = AsyncMock(
+        return_value={
+            "final_answer": "Test Answer",
+            "plan": "hybrid",
+        }
+    )
 
     payload = {"query": "test query"}
     headers = {"X-API-Key": "secret-enterprise-key"}
@@ -41,7 +62,390 @@ def test_query_endpoint(mock_graph_app):
     assert json_resp["answer"] == "Test Answer"
     assert json_resp["execution_plan"] == "hybrid"
 
-    # Verify invoke was called with correct initial state
-    mock_graph_app.invoke.assert_called_once()
-    call_args = mock_graph_app.invoke.call_args[0][0]
+    # Verify ainvoke was called with correct initial state
+    mock_graph_app.ainvoke.assert_awaited_once()
+    call_args = mock_graph_app.ainvoke.call_args[0][0]
     assert call_args["query"] == "test query"
+
+
+def test_query_endpoint_sheds_load_when_saturated(mock_graph_app):
+    """Test that a saturated worker answers 503 with Retry-After instead of queueing."""
+    mock_graph_app.ainvoke = AsyncMock(return_value={"final_answer": "x"})
+    full = AdmissionController(max_concurrent=1, max_queued=0, retry_after_s=2)
+    asyncio.run(full._slots.acquire())  # one query already in flight
+
+    with patch("src.api.main.admission", full), patch.dict(
+        os.environ, {"ENV": "development"}
+    ):
+        response = client.post("/query", json={"query": "test query"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+    mock_graph_app.ainvoke.assert_not_called()
+
+
+def test_streaming_endpoints_release_admission_when_client_leaves_early(
+    mock_graph_app,
+):
+    """Test that a client gone before the body starts does not leak a query slot."""
+    from starlette.requests import Request
+
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}, "headers": []}
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client went away")
+
+    async def disconnect_before_body(endpoint):
+        controller = AdmissionController(max_concurrent=1, max_queued=0)
+        request = main.QueryRequest(query="who left?")
+        with patch("src.api.main.admission", controller):
+            if endpoint is main.query_batch:
+                body = Request(scope, receive)
+                body._body = b'["who left?"]'
+                response = await main.query_batch(body, "input", None)
+            else:
+                response = await main.query_stream(request, None)
+            assert controller.active == 1
+            with pytest.raises(Exception):
+                await response(scope, receive, send)
+        return controller.active
+
+    for endpoint in (main.query_stream, main.query_batch):
+        assert asyncio.run(disconnect_before_body(endpoint)) == 0
+
+
+def test_query_stream_releases_admission_when_setup_fails():
+    """Test that a failure before the streaming response exists does not leak a slot."""
+    controller = AdmissionController(max_concurrent=1, max_queued=0)
+    request = main.QueryRequest(query="who is setting up?")
+
+    async def run():
+        with patch("src.api.main.admission", controller), patch(
+            "src.api.main.load_workflows", side_effect=ImportError("no langgraph")
+        ):
+            with pytest.raises(ImportError):
+                await main.query_stream(request, None)
+        return controller.active
+
+    assert asyncio.run(run()) == 0
+
+
+def test_admission_controller_times_out_queued_queries():
+    """Test that queued queries give up after the queue timeout."""
+
+    async def run():
+        controller = AdmissionController(
+            max_concurrent=1, max_queued=1, queue_timeout_s=0.01
+        )
+        async with controller.admit():
+            with pytest.raises(Saturated):
+                async with controller.admit():
+                    pass
+        # The slot is released again once the running query completes
+        async with controller.admit():
+            return controller.rejected
+
+    assert asyncio.run(run()) == 1
+
+
+def test_query_endpoint_serves_repeats_from_cache(mock_graph_app):
+    """Test that a repeated query is answered from the cache without the workflow."""
+    mock_graph_app.ainvoke = AsyncMock(
+        return_value={"final_answer": "Cached Answer", "plan": "vector"}
+    )
+
+    with patch.dict(os.environ, {"ENV": "development"}):
+        first = client.post("/query", json={"query": "HR policies for remote work"})
+        second = client.post("/query", json={"query": "hr policies for remote work?"})
+        other_filters = client.post(
+            "/query",
+            json={"query": "HR policies for remote work", "filters": {"dept": "hr"}},
+        )
+
+    assert first.json()["cached"] is False
+    assert second.json() == {
+        "answer": "Cached Answer",
+        "execution_plan": "vector",
+        "cached": True,
+        "cache_tier": "exact",
+    }
+    assert other_filters.json()["cached"] is False
+    assert mock_graph_app.ainvoke.await_count == 2
+
+
+def test_query_endpoint_reports_degraded_answers_and_open_circuits(mock_graph_app):
+    """Test that degraded answers are flagged and not cached, and an open circuit is a 503."""
+    mock_graph_app.ainvoke = AsyncMock(
+        return_value={
+            "final_answer": "Partial",
+            "plan": "vector",
+            "degraded": ["graph_search"],
+        }
+    )
+    with patch.dict(os.environ, {"ENV": "development"}):
+        first = client.post("/query", json={"query": "degraded question"})
+        second = client.post("/query", json={"query": "degraded question"})
+
+    assert first.headers["X-Degraded"] == "graph_search"
+    assert second.json()["cached"] is False
+
+    mock_graph_app.ainvoke = AsyncMock(side_effect=CircuitOpen("llm", 4.2))
+    with patch.dict(os.environ, {"ENV": "development"}):
+        response = client.post("/query", json={"query": "another question"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+
+def _parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_query_stream_emits_plan_retrieval_and_tokens():
+    """Test that /query/stream sends plan and retrieval events before tokens."""
+
+    async def fake_stream(self, prompt, system_prompt=None):
+        assert "[graph]" not in prompt  # unreachable Neo4j: no made-up evidence
+        for token in ["Alice ", "manages ", "Project X."]:
+            yield token
+
+    with patch.object(LLMClient, "astream", fake_stream), patch.dict(
+        os.environ, {"ENV": "development"}
+    ):
+        response = client.post(
+            "/query/stream", json={"query": "How is Alice related to Project X?"}
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _parse_sse(response.text)
+    names = [name for name, _ in events]
+    assert names == ["plan", "retrieval", "token", "token", "token", "done"]
+    assert events[0][1] == {"plan": "graph"}
+    assert events[1][1]["source"] == "graph_search"
+    done = events[-1][1]
+    assert done["answer"] == "Alice manages Project X."
+    assert 0 < done["ttft_ms"] <= done["total_ms"]
+
+
+def _fake_batch_llm(calls, fail_on=None):
+    async def agenerate_batch(self, prompts, system_prompt=None):
+        if system_prompt == PLANNER_SYSTEM_PROMPT:
+            return ["vector"] * len(prompts)
+        calls.append(prompts)
+        if fail_on and any(fail_on in prompt for prompt in prompts):
+            raise RuntimeError("LLM overloaded")
+        return [f"answer {len(calls)}.{n}" for n in range(len(prompts))]
+
+    return agenerate_batch
+
+
+def test_query_batch_dedupes_and_streams_results_in_order():
+    """Test that /query/batch answers duplicates once and returns one line per query."""
+    calls = []
+    body = "\n".join(
+        [
+            json.dumps("How is Alice related to Project X?"),
+            json.dumps({"query": "how is alice related to project x"}),
+            json.dumps({"query": "Summarize the Q3 audit", "filters": {"year": 2024}}),
+        ]
+    )
+    with patch.object(LLMClient, "agenerate_batch", _fake_batch_llm(calls)), patch.dict(
+        os.environ, {"ENV": "development"}
+    ):
+        response = client.post(
+            "/query/batch",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert all(r["status"] == "ok" for r in results)
+    assert results[0]["answer"] == results[1]["answer"]
+    assert results[0]["execution_plan"] == "graph"
+    assert len(calls) == 1 and len(calls[0]) == 2  # one synthesis batch, deduped
+
+    # JSONL of objects, one line or several, is not mistaken for an envelope
+    with patch.object(LLMClient, "agenerate_batch", _fake_batch_llm(calls)), patch.dict(
+        os.environ, {"ENV": "development"}
+    ):
+        for lines in (['{"query": "a"}'], ['{"query": "a"}', '{"query": "b"}']):
+            response = client.post("/query/batch", content="\n".join(lines))
+            assert response.status_code == 200
+            assert len(response.text.splitlines()) == len(lines)
+
+    with patch.dict(os.environ, {"ENV": "development"}):
+        bad = client.post("/query/batch", json={"queries": [{"q": "x"}]})
+        bad_order = client.post("/query/batch?order=random", json=["x"])
+    assert bad.status_code == 422
+    assert bad_order.status_code == 422
+
+
+def test_invalid_filters_are_rejected_before_the_workflow(mock_graph_app):
+    """Test that filters vector search cannot apply are a 422, not a degraded answer."""
+    bad_filters = [{"year": {"after": 2020}}, {"tags": [{"x": 1}]}, {"score": 0.5}]
+    with patch.dict(os.environ, {"ENV": "development"}):
+        responses = [
+            client.post("/query", json={"query": "q", "filters": filters})
+            for filters in bad_filters
+        ]
+        stream = client.post(
+            "/query/stream", json={"query": "q", "filters": bad_filters[0]}
+        )
+        batch = client.post(
+            "/query/batch", json=[{"query": "q", "filters": bad_filters[0]}]
+        )
+
+    assert [r.status_code for r in responses] == [422, 422, 422]
+    assert stream.status_code == 422 and batch.status_code == 422
+    mock_graph_app.ainvoke.assert_not_called()
+
+
+def test_batch_runner_isolates_failed_chunks_and_streams_as_completed():
+    """Test that a failing chunk only marks its own items as errors."""
+    calls = []
+    items = [BatchItem(f"Summarize the audit of vendor {n}") for n in range(4)]
+    items[2] = BatchItem("Summarize the audit of the failing vendor")
+    runner = BatchRunner(chunk_size=1, max_concurrent_chunks=4)
+
+    async def run():
+        return [result async for result in runner.run(items, order="completion")]
+
+    with patch.object(
+        LLMClient, "agenerate_batch", _fake_batch_llm(calls, fail_on="failing")
+    ):
+        results = asyncio.run(run())
+
+    assert sorted(r["index"] for r in results) == [0, 1, 2, 3]
+    statuses = {r["index"]: r["status"] for r in results}
+    assert statuses == {0: "ok", 1: "ok", 2: "error", 3: "ok"}
+    assert "LLM overloaded" in next(r["error"] for r in results if r["index"] == 2)
+
+
+def test_correlation_id_reaches_the_workflow_and_metrics_are_exposed(
+    mock_graph_app,
+):
+    """Test that the request's correlation id is visible to nodes and spans land in /metrics."""
+    seen = {}
+
+    async def ainvoke(state):
+        seen["correlation_id"] = correlation_id.get()
+        with span("planner"):
+            pass
+        return {"final_answer": "x", "plan": "vector"}
+
+    mock_graph_app.ainvoke = ainvoke
+    with patch.dict(os.environ, {"ENV": "development"}):
+        response = client.post(
+            "/query", json={"query": "q"}, headers={"X-Correlation-ID": "req-42"}
+        )
+
+    assert response.headers["X-Correlation-ID"] == "req-42"
+    assert seen["correlation_id"] == "req-42"
+    assert correlation_id.get() is None  # reset after the request
+
+    body = client.get("/metrics").text
+    assert "# TYPE cognigraph_stage_latency_seconds histogram" in body
+    assert 'cognigraph_stage_latency_seconds_bucket{stage="planner",le="+Inf"}' in body
+    assert (
+        'cognigraph_stage_latency_recent_seconds{stage="http_request",quantile="0.99"}'
+        in body
+    )
+
+
+def test_latency_histogram_buckets_and_quantiles():
+    """Test that buckets are cumulative in the exposition and quantiles are exact."""
+    registry = MetricsRegistry()
+    for ms in range(1, 101):
+        registry.observe("synthesizer", ms / 1000)
+
+    snapshot = registry.snapshot()["synthesizer"]
+    assert snapshot["count"] == 100
+    assert snapshot["p50_ms"] == pytest.approx(50.5)
+    assert snapshot["p99_ms"] == pytest.approx(99.01)
+
+    lines = registry.render().splitlines()
+    assert (
+        'cognigraph_stage_latency_seconds_bucket{stage="synthesizer",le="0.01"} 10'
+        in lines
+    )
+    assert (
+        'cognigraph_stage_latency_seconds_bucket{stage="synthesizer",le="+Inf"} 100'
+        in lines
+    )
+    assert 'cognigraph_stage_latency_seconds_count{stage="synthesizer"} 100' in lines
+
+    registry.reset()
+    assert registry.snapshot() == {}
+
+
+def test_span_exports_to_opentelemetry_when_enabled():
+    """Test that spans are mirrored to OpenTelemetry, tagged with the correlation id."""
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    token = correlation_id.set("req-7")
+    try:
+        with patch.dict(os.environ, {"TRACING_OTEL": "true"}), patch(
+            "src.utils.tracing._tracer", provider.get_tracer("test")
+        ):
+            with span("llm_http", endpoint="http://llm/generate"):
+                pass
+    finally:
+        correlation_id.reset(token)
+
+    (exported,) = exporter.get_finished_spans()
+    assert exported.name == "llm_http"
+    assert exported.attributes["correlation_id"] == "req-7"
+    assert exported.attributes["endpoint"] == "http://llm/generate"
+
+
+def test_importing_the_api_leaves_heavy_clients_to_the_lifespan(tmp_path):
+    """Importing the app must not load LangGraph, Qdrant or Neo4j, nor create files."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = (
+        "import sys, src.api.main; "
+        "print(sorted(m for m in ('langgraph', 'qdrant_client', 'neo4j') "
+        "if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=tmp_path,
+        env=dict(os.environ, PYTHONPATH=root),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_lifespan_compiles_the_workflows_and_closes_pools():
+    close = AsyncMock()
+    with patch.object(main, "graph_app", None), patch.object(
+        main, "retrieval_app", None
+    ), patch.object(main, "close_resources", close), patch.dict(
+        os.environ, {"API_WARMUP": "false"}
+    ):
+        with TestClient(create_app()) as started:
+            assert main.graph_app is not None and main.retrieval_app is not None
+            assert started.get("/health").status_code == 200
+            close.assert_not_awaited()
+    close.assert_awaited_once()
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from src.agents.plan_classifier import PlanCache
+from src.cache.answer_cache import AnswerCache
+from src.cache.invalidation import notify_documents_changed, register_invalidation_hook
+from src.cache.shared import SharedCache, SQLiteSharedCache
+
+
+def test_semantic_tier_reuses_near_duplicates():
+    cache = AnswerCache(max_size=16, ttl_s=60)
+    cache.put("Quarterly financial report 2024", None, "Revenue grew 4%", "vector")
+
+    entry, tier = cache.get("quarterly financial report for 2024")
+    assert tier == "semantic"
+    assert entry.answer == "Revenue grew 4%"
+
+    # Differing numbers or identifiers are never treated as the same question
+    assert cache.get("Quarterly financial report 2023") == (None, None)
+    assert cache.stats["semantic_hits"] == 1
+    assert cache.stats["misses"] == 1
+
+
+def test_semantic_tier_never_swaps_entities_subjects_or_negations():
+    cache = AnswerCache(max_size=16, ttl_s=60)
+    pairs = [
+        (
+            "What is the company finance department policy on travel reimbursement?",
+            "What is the company legal department policy on travel reimbursement?",
+        ),
+        (
+            "Who does Alice in the platform engineering team report to?",
+            "Who does Bob in the platform engineering team report to?",
+        ),
+        (
+            "What components does Acme supply for the data center build?",
+            "What components does Globex supply for the data center build?",
+        ),
+        (
+            "Is remote work from another country allowed under the policy?",
+            "Is remote work from another country not allowed under the policy?",
+        ),
+    ]
+    for cached, asked in pairs:
+        cache.put(cached, None, "A", "vector")
+        assert cache.get(asked) == (None, None)
+    assert cache.stats["semantic_hits"] == 0
+
+    # Spelling variants of the same question still hit
+    cache.put("Summarize the Q3 audit findings for the board", None, "B", "vector")
+    assert cache.get("Summarise the Q3 audit findings for the board")[1] == "semantic"
+
+
+def test_ttl_and_lru_eviction():
+    cache = AnswerCache(max_size=2, ttl_s=10, semantic_scan=0)
+    with patch("src.cache.answer_cache.time.monotonic", return_value=100.0):
+        cache.put("a", None, "A", "vector")
+        cache.put("b", None, "B", "vector")
+        cache.get("a")
+        cache.put("c", None, "C", "vector")  # evicts "b", the least recently used
+
+    with patch("src.cache.answer_cache.time.monotonic", return_value=105.0):
+        assert cache.get("a")[1] == "exact"
+        assert cache.get("b") == (None, None)
+    with patch("src.cache.answer_cache.time.monotonic", return_value=111.0):
+        assert cache.get("c") == (None, None)
+    assert cache.stats["evictions"] == 1
+    assert cache.stats["expirations"] == 1
+
+
+def test_document_changes_invalidate_registered_caches():
+    cache = AnswerCache(max_size=16, ttl_s=60)
+    register_invalidation_hook(cache.invalidate)
+    cache.put("Who manages Project X?", None, "Alice", "graph")
+
+    notify_documents_changed(["doc-1"])
+
+    assert len(cache) == 0
+    assert cache.stats["invalidations"] == 1
+
+
+def test_caches_connect_to_the_shared_cache_on_first_use(tmp_path):
+    """Test that constructing a cache (at import time) does not open the shared tier."""
+    shared = SQLiteSharedCache(str(tmp_path / "cache.sqlite3"))
+    with patch("src.cache.shared.get_shared_cache", return_value=shared) as get:
+        plan_cache = PlanCache()
+        answer_cache = AnswerCache()
+        get.assert_not_called()
+
+        plan_cache.put("who manages project x?", "graph")
+        assert answer_cache.shared is shared
+        assert get.call_count == 2
+    assert PlanCache().get("who manages project x?") is None  # default: local only
+    assert PlanCache(shared=shared).get("who manages project x?") == "graph"
+    shared.close()
+
+
+def test_workers_share_plans_and_answers_through_sqlite(tmp_path):
+    # One cache per "worker", each with its own connection to the shared file
+    path = str(tmp_path / "cache.sqlite3")
+    workers = [
+        AnswerCache(max_size=16, ttl_s=60, shared=SQLiteSharedCache(path))
+        for _ in range(2)
+    ]
+    plans = [PlanCache(shared=SQLiteSharedCache(path)) for _ in range(2)]
+
+    plans[0].put("Who manages Project X?", "graph")
+    workers[0].put("Who manages Project X?", None, "Alice", "graph")
+
+    assert plans[1].get("who manages project x") == "graph"
+    entry, tier = workers[1].get("who manages project x")
+    assert (entry.answer, tier) == ("Alice", "exact")
+    assert workers[1].stats["shared_hits"] == 1
+
+    # An invalidation in one process reaches the local tier of the others
+    workers[1].sync_interval_s = 0
+    workers[0].invalidate(["doc-1"])
+    assert workers[1].get("Who manages Project X?") == (None, None)
+    assert len(workers[1]) == 0
+
+
+class RecordingSharedCache(SharedCache):
+    def __init__(self):
+        self.values, self.threads = {}, set()
+
+    def _get(self, namespace, key):
+        self.threads.add(threading.get_ident())
+        value = self.values.get((namespace, key))
+        return None if value is None else json.loads(value)
+
+    def _put(self, namespace, key, value, ttl_s):
+        self.threads.add(threading.get_ident())
+        self.values[(namespace, key)] = value
+
+    def _clear(self, namespace):
+        self.threads.add(threading.get_ident())
+
+    def _generation(self, namespace):
+        self.threads.add(threading.get_ident())
+        return 0
+
+    def _publish(self, namespace, event):
+        raise NotImplementedError
+
+    def _events(self, namespace, since, until):
+        raise NotImplementedError
+
+
+def test_async_lookups_keep_shared_cache_io_off_the_event_loop():
+    with pytest.raises(TypeError):
+        SharedCache()  # backends must implement every storage method
+
+    shared = RecordingSharedCache()
+    writer, reader = (AnswerCache(max_size=16, ttl_s=60, shared=shared) for _ in "ab")
+    reader.sync_interval_s = 0
+    plans = [PlanCache(shared=shared) for _ in range(2)]
+
+    async def main():
+        await writer.aput("Who manages Project X?", None, "Alice", "graph")
+        await plans[0].aput("Who manages Project X?", "graph")
+        return (
+            await reader.aget("who manages project x"),
+            await plans[1].aget("who manages project x"),
+        )
+
+    (entry, tier), plan = asyncio.run(main())
+    assert (entry.answer, tier, plan) == ("Alice", "exact", "graph")
+    assert threading.get_ident() not in shared.threads
+
+
+def test_published_events_are_replayed_until_a_clear(tmp_path):
+    writer, reader = (SQLiteSharedCache(str(tmp_path / "c.sqlite3")) for _ in "ab")
+    since, _ = reader.events("graph", None)
+
+    writer.publish("graph", ["a", "b"])
+    writer.publish("graph", ["c"])
+    generation, events = reader.events("graph", since)
+    assert events == [["a", "b"], ["c"]]
+
+    # A clear has no event to replay: everything derived is stale
+    writer.clear("graph")
+    assert reader.events("graph", generation)[1] is None
@@ -0,0 +1,546 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.embeddings.cache import EmbeddingCache, content_key
+from src.embeddings.embedders import HashingEmbedder
+from src.embeddings.service import EmbeddingService
+from src.ingestion import pipeline as pipeline_module
+from src.ingestion.chunking import TokenChunker
+from src.ingestion.extraction import (
+    EntityResolver,
+    Extraction,
+    Gazetteer,
+    LLMExtractor,
+    RuleExtractor,
+)
+from src.ingestion.manifest import CheckpointTracker, IngestionManifest
+from src.ingestion.pipeline import (
+    IngestionPipeline,
+    MockS3Fetcher,
+    PipelineConfig,
+)
+from src.ingestion.stages import Stage, StreamingPipeline
+from src.ingestion.writers import (
+    BulkWriter,
+    Neo4jBulkWriter,
+    QdrantBulkWriter,
+    merge_relations_cypher,
+    point_id,
+)
+
+
+@pytest.fixture(autouse=True)
+def embedding_service(tmp_path, monkeypatch):
+    """
+    Pipelines embed with a small hashing model cached under tmp_path.
+    """
+    embedder = HashingEmbedder(dim=8)
+    cache = EmbeddingCache(str(tmp_path / "embeddings"), embedder.name, embedder.dim)
+    service = EmbeddingService(embedder, cache, batch_size=16)
+    monkeypatch.setattr("src.embeddings.service._service", service)
+    return service
+
+
+def _sentences(doc: int, n: int, first: int = 0):
+    # Seven tokens per sentence
+    return [f"Document {doc} sentence {j} says something." for j in range(first, n)]
+
+
+def _corpus(n_docs: int, sentences: int = 20):
+    return {
+        f"raw/doc-{i}.txt": " ".join(_sentences(i, sentences)) for i in range(n_docs)
+    }
+
+
+def _config(**overrides):
+    # Five sentences per chunk, no overlap
+    options = dict(cpu_executor="thread", chunk_max_tokens=35, chunk_overlap_tokens=0)
+    return PipelineConfig(**{**options, **overrides})
+
+
+def test_pipeline_streams_every_chunk_to_both_sinks():
+    objects = _corpus(120)
+    config = _config(queue_size=4, embed_batch=16)
+    pipeline = IngestionPipeline(fetcher=MockS3Fetcher(objects), config=config)
+
+    stats = pipeline.run()
+
+    expected_chunks = 120 * 4
+    assert stats["fetch"].items_in == 120
+    assert stats["diff"].items_out == expected_chunks
+    assert stats["upsert"].items_in == expected_chunks
+    assert stats["extract"].items_in == expected_chunks
+    # Bounded queues: no stage ever buffered more than its queue allows
+    assert all(s.max_queue_depth <= 4 for s in stats.values())
+    assert stats["chunk"].throughput > 0
+
+
+def test_pipeline_runs_cpu_stages_in_process_pool():
+    config = PipelineConfig(cpu_executor="process", cpu_processes=2)
+    pipeline = IngestionPipeline(fetcher=MockS3Fetcher(_corpus(4)), config=config)
+
+    stats = pipeline.run()
+
+    assert stats["upsert"].items_in == stats["diff"].items_out > 0
+    assert pipeline.resolver.stats["mentions"] > 0  # extractor set up per worker
+    # Only the items are pickled per call, not a chunker, model or gazetteer
+    cpu_fns = {
+        s.fn for s in StreamingPipeline(pipeline.build(), None).stages() if s.cpu
+    }
+    assert cpu_fns == {
+        pipeline_module.chunk_document,
+        pipeline_module.embed_chunks,
+        pipeline_module.extract_chunk,
+    }
+
+
+def test_chunker_keeps_sentences_and_paragraphs_whole():
+    text = (
+        "Alice manages Project X. She reports to Bob.\n\n"
+        "Bob owns the Q3 audit. It covers vendors X and Y. The audit is late."
+    )
+    spans = TokenChunker(max_tokens=13, overlap_tokens=0).spans("d", text)
+
+    assert [span.text(text) for span in spans] == [
+        "Alice manages Project X. She reports to Bob.",
+        "Bob owns the Q3 audit. It covers vendors X and Y.",
+        "The audit is late.",
+    ]
+    assert [span.token_count for span in spans] == [10, 13, 5]
+    assert all(span.doc_id == "d" for span in spans)
+
+
+def test_chunker_overlaps_whole_sentences_and_cuts_long_ones():
+    text = "One two three. Four five six. Seven eight nine. " + "word " * 30
+    spans = TokenChunker(max_tokens=10, overlap_tokens=4).spans("d", text)
+    texts = [span.text(text) for span in spans]
+
+    assert texts[:2] == [
+        "One two three. Four five six.",
+        "Four five six. Seven eight nine.",
+    ]
+    assert all(span.token_count <= 10 for span in spans)
+    assert texts[-1].split() == ["word"] * 10
+
+
+def test_chunker_streaming_matches_whole_document():
+    text = "\n\n".join(
+        " ".join(f"Paragraph {p} sentence {s} ends here!" for s in range(p % 7 + 1))
+        for p in range(40)
+    )
+    chunker = TokenChunker(max_tokens=40, overlap_tokens=8)
+    pieces = (text[i : i + 37] for i in range(0, len(text), 37))
+
+    streamed = list(chunker.stream("d", pieces))
+
+    assert [span for span, _ in streamed] == chunker.spans("d", text)
+    assert all(chunk == span.text(text) for span, chunk in streamed)
+
+
+def test_slow_sink_applies_backpressure_to_source():
+    produced = []
+
+    async def source():
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    async def slow_sink(item):
+        await asyncio.sleep(0.001)
+        # Source can only run ahead by the two queues plus one item in hand at
+        # each of the source, the first stage and the sink
+        assert len(produced) - item <= 2 + 2 + 3
+
+    head = Stage("double", lambda x: [x], queue_size=2)
+    head.to(Stage("sink", slow_sink, queue_size=2))
+
+    stats = asyncio.run(StreamingPipeline(head, executor=None).run(source()))
+
+    assert stats["sink"].items_in == 50
+
+
+# --- Bulk writers ---
+
+
+class FakeNeo4jTx:
+    def __init__(self, log):
+        self.log = log
+
+    def run(self, query, **params):
+        self.log.append((query, params))
+
+
+class FakeNeo4jSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_write(self, fn, *args):
+        self.driver.transactions += 1
+        return fn(FakeNeo4jTx(self.driver.queries), *args)
+
+    def run(self, query, **params):
+        self.driver.schema.append(query)
+
+
+class FakeNeo4jDriver:
+    def __init__(self):
+        self.queries = []
+        self.schema = []
+        self.transactions = 0
+
+    def session(self, database=None):
+        return FakeNeo4jSession(self)
+
+
+def test_qdrant_writer_batches_idempotent_upserts():
+    from qdrant_client import QdrantClient, models
+
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        "docs", vectors_config=models.VectorParams(size=4, distance="Cosine")
+    )
+    writer = QdrantBulkWriter(client, "docs", batch_size=100)
+    rows = [
+        {
+            "id": point_id("doc-1", i),
+            "vector": [1.0, float(i), 0.0, 0.5],
+            "payload": {"chunk_index": i},
+        }
+        for i in range(250)
+    ]
+
+    async def run():
+        await writer.add(rows)
+        await writer.add(rows[:10])  # re-ingesting the same chunks
+        await writer.close()
+
+    asyncio.run(run())
+
+    assert client.count("docs").count == 250
+    assert writer.stats == {"rows": 260, "batches": 3, "retries": 0}
+
+
+def test_neo4j_writer_uses_one_unwind_transaction_per_batch():
+    driver = FakeNeo4jDriver()
+    writer = Neo4jBulkWriter(driver, batch_size=1000)
+    rows = [
+        (
+            "entity",
+            {"key": "alice", "name": "Alice", "label": "Person", "source": "d1#0"},
+        ),
+        (
+            "entity",
+            {"key": "alice", "name": "Alice", "label": "Person", "source": "d1#0"},
+        ),
+        (
+            "entity",
+            {"key": "px", "name": "Project X", "label": "Project", "source": "d1#0"},
+        ),
+        (
+            "relation",
+            {"src": "alice", "dst": "px", "type": "MANAGES", "source": "d1#0"},
+        ),
+    ]
+
+    async def run():
+        await writer.add(rows)
+        await writer.close()
+
+    asyncio.run(run())
+
+    assert driver.transactions == 1
+    (entity_query, entity_params), (rel_query, rel_params) = driver.queries
+    assert entity_query.strip().startswith("UNWIND $rows")
+    assert len(entity_params["rows"]) == 2  # duplicate mention merged client-side
+    assert "[r:MANAGES]" in rel_query
+    assert rel_params["rows"][0]["src"] == "alice"
+
+
+def test_rule_extraction_resolves_aliases_across_the_batch():
+    gazetteer = Gazetteer(
+        [{"name": "Red Hat", "label": "Organization", "aliases": ["RH"]}]
+    )
+    extractor = RuleExtractor(gazetteer)
+    first = extractor.extract(
+        "Alice manages Project X. Acme Corp supplies RH. "
+        "The Security Review Board (SRB) approved the plan."
+    )
+    assert ("Alice", "MANAGES", "Project X") in first.relations
+    assert ("Acme Corp", "SUPPLIES", "Red Hat") in first.relations  # gazetteer alias
+    assert ("SRB", "Security Review Board") in first.aliases
+    second = extractor.extract("Acme Corporation is owned by Red Hat. The SRB met.")
+    assert ("Red Hat", "OWNS", "Acme Corporation") in second.relations
+
+    resolver = EntityResolver(gazetteer)
+    rows = resolver.resolve([("d1#0", first), ("d2#0", second)])
+    keys = {
+        r["key"] for chunk_rows in rows for kind, r in chunk_rows if kind == "entity"
+    }
+    assert {"acme", "red hat", "security review board"} <= keys
+    assert "rh" not in keys and "srb" not in keys
+    edges = {
+        (r["src"], r["type"], r["dst"]) for kind, r in rows[0] if kind == "relation"
+    }
+    assert ("acme", "SUPPLIES", "red hat") in edges
+    assert resolver.entities["acme"] == ("Acme Corp", "Organization")
+
+
+def test_resolved_mentions_fold_into_one_row_per_entity_and_edge():
+    mention = Extraction(
+        entities=[("Alice", "Person"), ("Project X", "Project")],
+        relations=[("Alice", "MANAGES", "Project X")],
+    )
+    resolver = EntityResolver()
+    rows = resolver.resolve([(f"d1#{i}", mention) for i in range(3)])
+    assert [len(chunk_rows) for chunk_rows in rows] == [3, 3, 3]
+
+    driver = FakeNeo4jDriver()
+    writer = Neo4jBulkWriter(driver, batch_size=1000)
+
+    async def run():
+        await writer.add([row for chunk_rows in rows for row in chunk_rows])
+        await writer.close()
+
+    asyncio.run(run())
+
+    (_, entity_params), (_, rel_params) = driver.queries
+    assert [row["key"] for row in entity_params["rows"]] == ["alice", "project x"]
+    assert entity_params["rows"][0]["sources"] == ["d1#0", "d1#1", "d1#2"]
+    assert len(rel_params["rows"]) == 1
+    assert rel_params["rows"][0]["sources"] == ["d1#0", "d1#1", "d1#2"]
+
+
+def test_llm_extraction_falls_back_to_rules_per_chunk():
+    class FakeClient:
+        async def agenerate_batch(self, prompts, system_prompt=None):
+            return [
+                '{"entities": [{"name": "Bob", "label": "Person"}], '
+                '"relations": [{"src": "Bob", "type": "reports to", "dst": "Alice"}]}',
+                "[MOCK LLM RESPONSE]",
+            ]
+
+    first, second = asyncio.run(
+        LLMExtractor(client=FakeClient()).aextract_many(
+            ["Bob reports to Alice.", "Alice manages Project X."]
+        )
+    )
+    assert first.relations == [("Bob", "REPORTS_TO", "Alice")]
+    assert ("Alice", "MANAGES", "Project X") in second.relations
+
+
+def test_writer_flushes_by_age_and_retries_failures():
+    attempts = []
+
+    class FlakyWriter(BulkWriter):
+        async def _write(self, batch):
+            attempts.append(list(batch))
+            if len(attempts) < 3:
+                raise ConnectionError("transient")
+
+    writer = FlakyWriter(batch_size=100, flush_interval_s=0.02, backoff_s=0.001)
+
+    async def run():
+        await writer.add([1, 2, 3])
+        await asyncio.sleep(0.1)  # well under batch_size; the age limit flushes it
+        written = dict(writer.stats)
+        await writer.close()
+        return written
+
+    assert asyncio.run(run()) == {"rows": 3, "batches": 1, "retries": 2}
+    assert attempts == [[1, 2, 3]] * 3
+
+
+def _mentions(chunk, extractor=None):
+    # One relation per chunk, so graph writes can be traced back to their chunk
+    name = f"{chunk.doc_id}/{chunk.text[:8]}"
+    return Extraction(
+        entities=[(name, "Topic"), (chunk.doc_id, "Document")],
+        relations=[(name, "SEE", chunk.doc_id)],
+    )
+
+
+def test_incremental_runs_only_touch_changed_chunks(monkeypatch):
+    from qdrant_client import QdrantClient, models
+
+    monkeypatch.setattr(pipeline_module, "extract_entities", _mentions)
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        "docs", vectors_config=models.VectorParams(size=8, distance="Cosine")
+    )
+    manifest = IngestionManifest(":memory:")
+    objects = _corpus(5)
+    driver = FakeNeo4jDriver()
+
+    def run():
+        pipeline = IngestionPipeline(
+            fetcher=MockS3Fetcher(objects),
+            config=_config(),
+            qdrant_writer=QdrantBulkWriter(client, "docs", wait=True),
+            neo4j_writer=Neo4jBulkWriter(driver),
+            manifest=manifest,
+        )
+        driver.queries.clear()
+        return pipeline, pipeline.run()
+
+    _, stats = run()
+    assert any("FULLTEXT INDEX entity_names" in q for q in driver.schema)
+    assert stats["embed"].items_in == 20
+    assert client.count("docs").count == 20
+
+    # Nothing changed: no object is even fetched
+    pipeline, stats = run()
+    assert stats["fetch"].items_in == 0
+    assert pipeline.counts["skipped"] == 5
+    assert driver.queries == []
+
+    # One document loses its tail and has its first chunk edited
+    objects["raw/doc-3.txt"] = " ".join(
+        ["Revised opening line."] + _sentences(3, 12, 1)
+    )
+    pipeline, stats = run()
+    assert stats["fetch"].items_in == 1
+    assert stats["embed"].items_in == 2  # chunk 1 (sentences 5-9) is unchanged
+    assert pipeline.counts["deleted_chunks"] == 1
+    assert client.count("docs").count == 19
+
+    retracted = [
+        row["source"]
+        for query, params in driver.queries
+        if query.lstrip().startswith("UNWIND") and "DELETE r" in query
+        for row in params["rows"]
+    ]
+    assert sorted(retracted) == [
+        "raw/doc-3.txt#0",
+        "raw/doc-3.txt#2",
+        "raw/doc-3.txt#3",
+    ]
+    # Entities only the removed chunks mentioned are deleted with their edges
+    assert any(
+        "MATCH (e:Entity" in query and "DETACH DELETE e" in query
+        for query, _ in driver.queries
+    )
+    # The manifest now holds what the edited chunk wrote, for the next retraction
+    entity = manifest.chunks("raw/doc-3.txt")[0].graph_rows[0][1]
+    assert entity["key"] == "raw doc 3 txt revised"
+    assert manifest.checkpoint() is None  # completed runs leave nothing to resume
+
+    # One document is deleted from the bucket as another is added
+    del objects["raw/doc-1.txt"]
+    objects["raw/doc-0a.txt"] = " ".join(_sentences(9, 5))
+    pipeline, stats = run()
+    assert stats["fetch"].items_in == 1
+    assert pipeline.counts["deleted_objects"] == 1
+    assert pipeline.counts["deleted_chunks"] == 4
+    assert client.count("docs").count == 16
+    retracted = {
+        row["source"].split("#")[0]
+        for query, params in driver.queries
+        if query.lstrip().startswith("UNWIND") and "DELETE r" in query
+        for row in params["rows"]
+    }
+    assert retracted == {"raw/doc-1.txt"}
+    assert manifest.etag("raw/doc-1.txt") is None
+    assert list(manifest.keys("raw/")) == sorted(objects)
+
+
+def test_resume_and_since_skip_listed_objects():
+    manifest = IngestionManifest(":memory:")
+    manifest.commit([], checkpoint="raw/doc-1.txt")
+    fetcher = MockS3Fetcher(
+        _corpus(4), last_modified={"raw/doc-2.txt": 100.0, "raw/doc-3.txt": 200.0}
+    )
+    pipeline = IngestionPipeline(fetcher=fetcher, config=_config(), manifest=manifest)
+
+    stats = pipeline.run(since=150.0, resume=True)
+
+    assert pipeline.counts["listed"] == 2  # doc-0 and doc-1 were done before
+    assert stats["fetch"].items_in == 1  # doc-2 is older than --since
+    # Nothing was written anywhere, so nothing may be recorded as ingested
+    assert manifest.etag("raw/doc-3.txt") is None
+    assert manifest.checkpoint() == "raw/doc-1.txt"
+
+
+def test_checkpoint_is_the_low_water_mark_of_committed_keys():
+    tracker = CheckpointTracker()
+    for key, dispatched in [("a", True), ("b", False), ("c", True), ("d", True)]:
+        tracker.listed(key, dispatched)
+
+    tracker.committed(["c"])
+    assert tracker.low_water_mark is None  # "a" is still in flight
+    tracker.committed(["a"])
+    assert tracker.low_water_mark == "c"
+    tracker.committed(["d"])
+    assert tracker.low_water_mark == "d"
+
+
+def test_embedding_cache_is_shared_across_runs_and_processes(
+    embedding_service, tmp_path
+):
+    texts = [f"Chunk {i} of the audit." for i in range(40)]
+    first = embedding_service.embed(texts + texts[:5])  # duplicates embedded once
+    assert embedding_service.stats["misses"] == 40
+    assert (
+        embedding_service.stats["batches"] == 3
+    )  # 16, 16, and 8 padded to a power of two
+    assert np.allclose(np.linalg.norm(first, axis=1), 1.0)
+
+    # A worker process reuses the vectors the parent stored, and vice versa
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        worker_stats, worker_vectors = pool.submit(
+            _embed_in_worker, embedding_service, texts[:10] + ["New text."]
+        ).result()
+    assert worker_stats["misses"] == 1
+    assert np.allclose(worker_vectors[:10], first[:10])
+
+    # A fresh service (a later run) embeds nothing at all
+    embedder = HashingEmbedder(dim=8)
+    cache = EmbeddingCache(str(tmp_path / "embeddings"), embedder.name, embedder.dim)
+    later = EmbeddingService(embedder, cache, batch_size=16)
+    assert np.allclose(later.embed(texts + ["New text."])[:40], first[:40])
+    assert later.stats["misses"] == 0
+
+
+def _embed_in_worker(service, texts):
+    return service.stats, service.embed(texts)
+
+
+def test_query_embeddings_live_in_a_bounded_lru_cache(tmp_path):
+    embedder = HashingEmbedder(dim=8)
+    encoded = []
+    encode = embedder.encode
+    embedder.encode = lambda texts: encoded.append(len(texts)) or encode(texts)
+    root = str(tmp_path / "embeddings")
+    cache = EmbeddingCache(root, embedder.name, embedder.dim)
+    queries = EmbeddingCache(root + "/queries", embedder.name, 8, capacity=3)
+    service = EmbeddingService(embedder, cache, batch_size=16, query_cache=queries)
+
+    first = service.embed_one("Who approved the audit?", query=True)
+    assert encoded == [1]  # not padded to a full batch of 16
+    assert len(cache) == 0 and len(queries) == 1
+
+    # A later run (or another process) reuses the query's vector
+    later = EmbeddingService(embedder, cache, batch_size=16, query_cache=queries)
+    assert np.allclose(later.embed_one("Who approved the audit?", query=True), first)
+    assert later.stats["misses"] == 0
+
+    # Beyond its capacity the least recently used query is evicted
+    for i in range(3):
+        service.embed([f"Query {i}?"], query=True)
+        service.embed_one("Who approved the audit?", query=True)
+    assert len(queries) == 3
+    assert set(queries.get([content_key(embedder.name, "Query 0?")])) == set()
+    assert len(queries.get([content_key(embedder.name, "Who approved the audit?")]))
+
+
+def test_relationship_types_are_validated():
+    with pytest.raises(ValueError):
+        merge_relations_cypher("MANAGES]->() DETACH DELETE (n")
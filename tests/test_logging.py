@@ -0,0 +1,124 @@
+import json
+import logging
+import queue
+
+from src.utils import logger as logger_module
+from src.utils.logger import (
+    BoundedQueueHandler,
+    CorrelationIdFilter,
+    DebugSamplingFilter,
+    JsonFormatter,
+    _DeferredSetup,
+    _ReportingListener,
+)
+from src.utils.tracing import correlation_id
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def _logger(name, *handlers):
+    logger = logging.getLogger(name)
+    logger.handlers = list(handlers)
+    logger.filters = [CorrelationIdFilter()]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = BoundedQueueHandler(queue.Queue(maxsize=2), block_s=0)
+    logger = _logger("test.bounded", handler)
+
+    for i in range(5):
+        logger.info("request %d", i)
+    logger.error("still dropped once the grace period is over")
+
+    assert handler.queue.qsize() == 2
+    assert handler.take_dropped() == 4
+    assert handler.take_dropped() == 0
+
+
+def test_listener_formats_off_thread_with_the_callers_correlation_id():
+    sink = ListHandler()
+    sink.setFormatter(logging.Formatter("[%(correlation_id)s] %(message)s"))
+    handler = BoundedQueueHandler(queue.Queue(maxsize=100))
+    listener = _ReportingListener(handler, sink)
+    logger = _logger("test.listener", handler)
+
+    listener.start()
+    token = correlation_id.set("req-1")
+    try:
+        logger.info("plan %s for %r", "graph", "q")
+    finally:
+        correlation_id.reset(token)
+    logger.info("outside a request")
+    listener.stop()
+
+    assert sink.lines == ["[req-1] plan graph for 'q'", "[-] outside a request"]
+
+
+def test_listener_reports_dropped_records():
+    sink = ListHandler()
+    handler = BoundedQueueHandler(queue.Queue(maxsize=1), block_s=0)
+    listener = _ReportingListener(handler, sink, interval_s=0)
+    logger = _logger("test.report", handler)
+
+    logger.info("kept")
+    logger.info("dropped")
+    listener.start()
+    listener.stop()
+
+    assert sink.lines == ["kept", "Log queue full: dropped 1 records"]
+
+
+def test_json_formatter_includes_extra_fields_and_exceptions():
+    sink = ListHandler()
+    sink.setFormatter(JsonFormatter())
+    logger = _logger("test.json", sink)
+
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.error("failed %s", "x", exc_info=True, extra={"stage": "planner"})
+
+    entry = json.loads(sink.lines[0])
+    assert entry["message"] == "failed x"
+    assert entry["level"] == "ERROR"
+    assert entry["stage"] == "planner"
+    assert entry["correlation_id"] == "-"
+    assert "ValueError: boom" in entry["exc_info"]
+
+
+def test_debug_sampling_only_thins_debug_records():
+    sink = ListHandler()
+    sink.addFilter(DebugSamplingFilter(0.0))
+    logger = _logger("test.sampling", sink)
+
+    for _ in range(10):
+        logger.debug("chatty")
+    logger.info("important")
+
+    assert sink.lines == ["important"]
+
+
+def test_handlers_are_set_up_by_the_first_record(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LOG_DEBUG_FILE", "false")
+    logger = _logger("test.deferred", _DeferredSetup("test.deferred"))
+    assert not (tmp_path / "logs").exists()
+
+    logger.info("first %s", "record")
+    listener = logger.listener
+    listener.stop()
+    logger_module._configured.remove(logger)
+    logger.handlers = []
+
+    assert isinstance(listener.queue_handler, BoundedQueueHandler)
+    assert "first record" in (tmp_path / "logs" / "app.log").read_text()
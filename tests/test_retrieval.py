@@ -0,0 +1,475 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from src.agents import graph_search, vector_search
+from src.agents.fusion import fusion_node
+from src.agents.synthesizer import build_synthesis_prompt
+from src.cache.invalidation import notify_entities_changed
+from src.cache.shared import SQLiteSharedCache
+from src.ingestion.writers import Neo4jBulkWriter
+from src.retrieval.fusion import ContextFuser, rrf
+from src.retrieval.graph import TEMPLATES, GraphRetriever, lucene_escape
+from src.retrieval.subgraph import Subgraph, SubgraphCache
+from src.embeddings.embedders import HashingEmbedder
+from src.embeddings.service import EmbeddingService
+from src.retrieval.vector import (
+    VectorRetriever,
+    build_filter,
+    ensure_collection,
+    payload_indexes,
+)
+from src.utils.tracing import metrics
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def data(self):
+        return self.rows
+
+
+class FakeTx:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, params):
+        self.driver.calls.append((query, params))
+        if "key" in params:  # a subgraph load
+            return FakeResult(self.driver.subgraph)
+        return FakeResult(self.driver.rows)
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_read(self, fn):
+        return fn(FakeTx(self.driver))
+
+
+class FakeDriver:
+    def __init__(self, rows=(), reachable=True, subgraph=()):
+        self.rows = list(rows)
+        self.subgraph = list(subgraph)
+        self.reachable = reachable
+        self.calls = []
+        self.connectivity_checks = 0
+
+    def session(self, database=None):
+        return FakeSession(self)
+
+    def verify_connectivity(self):
+        self.connectivity_checks += 1
+        if not self.reachable:
+            raise ConnectionError("refused")
+
+
+def test_templates_are_index_backed_and_bounded():
+    for name, cypher in TEMPLATES.items():
+        assert "LIMIT $limit" in cypher, name
+        assert "CONTAINS" not in cypher, name
+    assert "[*1..2]" in TEMPLATES["neighborhood_2"]
+    assert "db.index.fulltext.queryNodes" in TEMPLATES["neighborhood_2"]
+
+
+def test_neighborhood_is_parameterized_and_hop_clamped():
+    driver = FakeDriver(
+        rows=[{"seed": "x", "src": "Alice", "rel": "MANAGES", "dst": "Project X"}]
+    )
+    retriever = GraphRetriever(
+        driver=driver, max_hops=2, limit=7, cache=SubgraphCache()
+    )
+
+    rows = asyncio.run(retriever.neighborhood('Who manages "Project X"?', hops=9))
+
+    ((query, params),) = driver.calls
+    assert query == TEMPLATES["neighborhood_2"]  # never more than max_hops
+    assert params["search"] == 'Who manages \\"Project X\\"\\?'
+    assert params["limit"] == 7
+    assert GraphRetriever.format(rows) == ["Alice -[MANAGES]-> Project X"]
+
+
+def test_neighborhood_many_shares_one_query_for_misses():
+    driver = FakeDriver(
+        rows=[
+            {"i": 0, "seed": "a", "src": "A", "rel": "OWNS", "dst": "B"},
+            {"i": 1, "seed": "c", "src": "C", "rel": "USES", "dst": "D"},
+            {"i": 0, "seed": "a", "src": "A", "rel": "OWNS", "dst": "B"},
+        ]
+    )
+    retriever = GraphRetriever(driver=driver, max_hops=2, cache=SubgraphCache())
+
+    rows = asyncio.run(retriever.neighborhood_many(["who owns B?", "what uses D"]))
+
+    ((query, params),) = driver.calls
+    assert query == TEMPLATES["neighborhood_batch_2"]
+    assert params["searches"] == [
+        {"i": 0, "search": "who owns B\\?"},
+        {"i": 1, "search": "what uses D"},
+    ]
+    assert [GraphRetriever.format(r) for r in rows] == [
+        ["A -[OWNS]-> B"],
+        ["C -[USES]-> D"],
+    ]
+
+
+def test_lucene_escape_neutralizes_query_syntax():
+    assert lucene_escape("a:b OR (c*)") == "a\\:b or \\(c\\*\\)"
+    # Bare operators would be a parse error in Lucene's query syntax
+    assert lucene_escape("Bob AND") == "Bob and"
+    assert lucene_escape("NOT") == "not"
+    assert lucene_escape("ANDROID NOTES") == "ANDROID NOTES"
+
+
+def test_graph_node_uses_shared_retriever_and_degrades_when_unreachable(
+    monkeypatch,
+):
+    driver = FakeDriver(rows=[{"seed": "a", "src": "A", "rel": "OWNS", "dst": "B"}])
+    retriever = GraphRetriever(driver=driver, cache=SubgraphCache(max_entries=0))
+    monkeypatch.setattr(graph_search, "graph_retriever", retriever)
+
+    for _ in range(3):
+        result = asyncio.run(graph_search.graph_search_node({"query": "who owns B"}))
+    assert result == {"graph_results": ["A -[OWNS]-> B"]}
+    assert driver.connectivity_checks == 1  # health is cached, not checked per call
+
+    down = GraphRetriever(driver=FakeDriver(reachable=False))
+    monkeypatch.setattr(graph_search, "graph_retriever", down)
+    result = asyncio.run(graph_search.graph_search_node({"query": "who owns B"}))
+    assert result == {"graph_results": [], "degraded": ["graph_search"]}
+
+
+def _edge(src, rel, dst, paths=4):
+    return {
+        "paths": paths,
+        "src_key": src,
+        "src": src.upper(),
+        "rel": rel,
+        "dst_key": dst,
+        "dst": dst.upper(),
+    }
+
+
+# a -> b -> c -> d, plus a <- e
+CHAIN = [
+    _edge("a", "R", "b"),
+    _edge("b", "R", "c"),
+    _edge("c", "R", "d"),
+    _edge("e", "S", "a"),
+]
+
+
+def test_subgraph_csr_traversal():
+    graph = Subgraph("a", 3, CHAIN, complete=True)
+
+    assert graph.rows(graph.bfs_edges(1, limit=10)) == [
+        {"src": "A", "rel": "R", "dst": "B"},
+        {"src": "E", "rel": "S", "dst": "A"},
+    ]
+    assert len(graph.bfs_edges(2, limit=10)) == 3
+    assert len(graph.bfs_edges(3, limit=2)) == 2
+    assert graph.rows(graph.shortest_path("d", 3))[-1] == {
+        "src": "C",
+        "rel": "R",
+        "dst": "D",
+    }
+    assert graph.shortest_path("d", 2) is None
+    assert graph.shortest_path("missing", 3) is None
+    assert graph.covers(3) and not Subgraph("a", 3, CHAIN, False).covers(1)
+
+
+def test_hot_neighborhoods_are_loaded_and_served_locally():
+    driver = FakeDriver(
+        rows=[{"seed": "a", "src": "A", "rel": "R", "dst": "B"}], subgraph=CHAIN
+    )
+    cache = SubgraphCache(radius=2, admit_after=2)
+    retriever = GraphRetriever(driver=driver, max_hops=2, cache=cache)
+
+    async def scenario():
+        await retriever.neighborhood("alpha")  # first miss: not yet hot
+        assert not retriever._loading
+        await retriever.neighborhood("alpha")  # second miss: load in background
+        assert retriever._loading
+        while retriever._loading:
+            await asyncio.sleep(0.01)
+        calls = len(driver.calls)
+        rows = await retriever.neighborhood("alpha")
+        assert len(driver.calls) == calls  # answered from the local index
+        return rows
+
+    rows = asyncio.run(scenario())
+    assert {"src": "B", "rel": "R", "dst": "C"} in rows
+    assert {"src": "C", "rel": "R", "dst": "D"} not in rows  # 3 hops away
+    assert TEMPLATES["subgraph_2"] in [query for query, _ in driver.calls]
+
+
+def test_truncated_neighborhoods_are_not_trusted():
+    driver = FakeDriver(subgraph=[_edge("a", "R", "b")] * 3)
+    cache = SubgraphCache(max_edges=3, admit_after=1)
+    retriever = GraphRetriever(driver=driver, cache=cache)
+
+    metrics.reset()
+    asyncio.run(retriever._load("a"))
+
+    assert not cache.get("a").covers(1)
+    # Loads stay out of the point-read histogram that sets the hedge delay
+    assert metrics.snapshot().keys() == {"neo4j_subgraph_load"}
+
+
+def test_entity_writes_invalidate_cached_neighborhoods(monkeypatch):
+    cache = SubgraphCache()
+    cache.put(Subgraph("a", 2, CHAIN, complete=True))
+    cache.put(Subgraph("x", 2, [_edge("x", "R", "y")], complete=True))
+    cache.put_seeds("alpha", ["a"])
+    monkeypatch.setattr(
+        "src.cache.invalidation._entity_hooks", [cache.invalidate_entities]
+    )
+
+    notify_entities_changed(["y"])
+    assert cache.get("x") is None and cache.get("a") is not None
+    assert cache.seeds("alpha") is None
+
+    generation = cache.generation
+    writer = Neo4jBulkWriter(driver=None)
+    writer._write_sync = lambda batch: None
+    asyncio.run(writer._write([("entity", {"key": "d", "name": "D", "label": "X"})]))
+    assert cache.get("a") is None  # "d" is in a's neighborhood
+    assert cache.generation > generation
+
+    # A load that raced the write is discarded instead of caching stale data
+    cache.put(Subgraph("a", 2, CHAIN, complete=True), generation)
+    assert cache.get("a") is None
+
+
+def test_entity_writes_in_another_process_reach_the_api_cache(tmp_path):
+    # The API worker's cache and the ingestion process's, sharing one file
+    path = str(tmp_path / "cache.sqlite3")
+    api, ingestion = (SubgraphCache(shared=SQLiteSharedCache(path)) for _ in "ab")
+    api.sync_interval_s = 0
+    asyncio.run(api.sync())
+    api.put(Subgraph("a", 2, CHAIN, complete=True))
+    api.put(Subgraph("x", 2, [_edge("x", "R", "y")], complete=True))
+    api.put_seeds("alpha", ["a"])
+    api.put_seeds("beta", [])  # no match yet: not cached
+    assert api.seeds("beta") is None
+
+    ingestion.invalidate_entities(["d"])
+    assert api.get("a") is not None  # not seen until the next sync
+    asyncio.run(api.sync())
+    # Only neighborhoods containing the written entity are dropped
+    assert api.get("a") is None and api.seeds("alpha") is None
+    assert api.get("x") is not None
+
+    # Our own invalidations are not replayed; a full one reaches everybody
+    api.put(Subgraph("a", 2, CHAIN, complete=True))
+    api.invalidate_entities(["unrelated"])
+    asyncio.run(api.sync())
+    assert api.get("a") is not None
+    ingestion.invalidate_entities(None)
+    asyncio.run(api.sync())
+    assert len(api) == 0
+
+
+def _points(n=40, dim=8):
+    from qdrant_client import models
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors, [
+        models.PointStruct(
+            id=i,
+            vector=vectors[i].tolist(),
+            payload={"doc_id": f"doc-{i % 4}", "chunk_index": i, "text": f"chunk {i}"},
+        )
+        for i in range(n)
+    ]
+
+
+def test_filters_translate_to_payload_conditions():
+    from qdrant_client import models
+
+    assert build_filter(None) is None and build_filter({}) is None
+    must = build_filter(
+        {"doc_id": "doc-1", "lang": ["en", "de"], "chunk_index": {"gte": 2}}
+    ).must
+    assert must[0].match == models.MatchValue(value="doc-1")
+    assert must[1].match == models.MatchAny(any=["en", "de"])
+    assert must[2].range == models.Range(gte=2)
+    with pytest.raises(ValueError):
+        build_filter({"chunk_index": {"between": [1, 2]}})
+    with pytest.raises(ValueError):
+        build_filter({"score": 0.5})
+
+
+def test_collection_gets_quantization_and_payload_indexes():
+    from qdrant_client import models
+
+    class RecordingClient:
+        def __init__(self):
+            self.calls = []
+
+        def collection_exists(self, name):
+            return False
+
+        def create_collection(self, **kwargs):
+            self.calls.append(("create_collection", kwargs))
+
+        def create_payload_index(self, **kwargs):
+            self.calls.append(("create_payload_index", kwargs))
+
+    client = RecordingClient()
+    asyncio.run(ensure_collection(client, "docs", 8, quantization="scalar"))
+
+    (_, created), *indexes = client.calls
+    assert created["vectors_config"].size == 8
+    assert created["quantization_config"].scalar.type == models.ScalarType.INT8
+    assert {kw["field_name"]: kw["field_schema"] for _, kw in indexes} == {
+        "doc_id": models.PayloadSchemaType.KEYWORD,
+        "chunk_index": models.PayloadSchemaType.INTEGER,
+    }
+    assert payload_indexes("lang:keyword") == {"lang": models.PayloadSchemaType.KEYWORD}
+
+
+# Local mode ignores payload indexes and search params, and says so
+@pytest.mark.filterwarnings("ignore::UserWarning")
+@pytest.mark.parametrize("quantization", ["none", "scalar", "binary"])
+def test_vector_search_filters_server_side(quantization):
+    from qdrant_client import AsyncQdrantClient
+
+    vectors, points = _points()
+
+    async def scenario():
+        client = AsyncQdrantClient(location=":memory:")
+        await ensure_collection(client, "docs", 8, quantization=quantization)
+        await ensure_collection(client, "docs", 8)  # idempotent
+        await client.upsert("docs", points=points, wait=True)
+        retriever = VectorRetriever(client, "docs", limit=5, hnsw_ef=64)
+
+        nearest = await retriever.search(vectors[6])
+        filtered = await retriever.search(
+            vectors[6], {"doc_id": "doc-1", "chunk_index": {"lt": 30}}
+        )
+        batched = await retriever.search_many(vectors[:2], {"doc_id": ["doc-0"]})
+        return nearest, filtered, batched
+
+    nearest, filtered, batched = asyncio.run(scenario())
+    assert nearest[0].id == 6
+    assert len(filtered) == 5  # not fewer: filtering happens inside the search
+    assert all(p.payload["doc_id"] == "doc-1" for p in filtered)
+    assert all(p.payload["chunk_index"] < 30 for p in filtered)
+    assert batched[0][0].id == 0
+    assert all(p.payload["doc_id"] == "doc-0" for hits in batched for p in hits)
+    assert VectorRetriever.format(nearest)[0] == "chunk 6"
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_vector_node_passes_filters_and_degrades_when_unreachable(monkeypatch):
+    from qdrant_client import AsyncQdrantClient
+
+    service = EmbeddingService(HashingEmbedder(dim=8))
+    monkeypatch.setattr("src.embeddings.service._service", service)
+    _, points = _points(dim=service.dim)
+
+    async def scenario():
+        client = AsyncQdrantClient(location=":memory:")
+        await ensure_collection(client, "docs", service.dim)
+        await client.upsert("docs", points=points, wait=True)
+        monkeypatch.setattr(
+            vector_search, "vector_retriever", VectorRetriever(client, "docs")
+        )
+        return await vector_search.vector_search_node(
+            {"query": "anything", "filters": {"doc_id": "doc-2"}}
+        )
+
+    result = asyncio.run(scenario())
+    assert len(result["vector_results"]) == 5
+    assert {int(text.split()[1]) % 4 for text in result["vector_results"]} == {2}
+
+    class Unreachable:
+        async def collection_exists(self, name):
+            raise ConnectionError("refused")
+
+    monkeypatch.setattr(
+        vector_search, "vector_retriever", VectorRetriever(Unreachable(), "docs")
+    )
+    result = asyncio.run(vector_search.vector_search_node({"query": "q"}))
+    assert result == {"vector_results": [], "degraded": ["vector_search"]}
+
+
+def test_rrf_rewards_agreement_between_branches():
+    fused = rrf({"vector": ["a", "b", "c"], "graph": ["c", "d"]}, k=60)
+
+    assert [e.text for e in fused][:2] == ["c", "a"]
+    assert fused[0].sources == ["vector", "graph"]
+    assert fused[0].score == pytest.approx(1 / 63 + 1 / 61)
+
+
+def test_fuser_drops_near_duplicates_and_packs_the_budget():
+    fuser = ContextFuser(token_budget=12, dedupe_threshold=0.9)
+    evidence = fuser.fuse(
+        "q",
+        {
+            "vector": [
+                "Alice manages Project X.",  # 5 tokens
+                "Alice  manages project X.",  # same passage, other formatting
+                "A very long passage that cannot fit into what is left of the budget",
+                "Bob owns it.",  # 4 tokens
+            ],
+            "graph": ["Alice -[MANAGES]-> Project X"],  # 9 tokens
+        },
+    )
+
+    assert [e.text for e in evidence] == ["Alice manages Project X.", "Bob owns it."]
+    assert sum(e.tokens for e in evidence) <= 12
+    assert evidence[0].render() == "[vector] Alice manages Project X."
+
+
+def test_fuser_truncates_an_oversized_best_passage():
+    evidence = ContextFuser(token_budget=3).fuse(
+        "q", {"vector": ["one two three four"]}
+    )
+
+    assert [e.text for e in evidence] == ["one two three"]
+
+
+def test_reranker_reorders_the_fused_candidates():
+    ranked = {"vector": ["The cafeteria menu for Friday", "Alice manages Project X"]}
+
+    plain = ContextFuser(reranker="none").fuse("who manages project x", ranked)
+    reranked = ContextFuser(reranker="lexical", rerank_weight=0.9).fuse(
+        "who manages project x", ranked
+    )
+
+    assert plain[0].text.startswith("The cafeteria")
+    assert reranked[0].text == "Alice manages Project X"
+    with pytest.raises(ValueError):
+        ContextFuser(reranker="cross-encoder")
+
+
+def test_fusion_node_feeds_the_synthesis_prompt():
+    update = asyncio.run(
+        fusion_node(
+            {
+                "query": "q",
+                "vector_results": ["Alice manages Project X."],
+                "graph_results": ["Alice -[MANAGES]-> Project X"],
+            }
+        )
+    )
+
+    assert update["context"] == [
+        "[vector] Alice manages Project X.",
+        "[graph] Alice -[MANAGES]-> Project X",
+    ]
+    prompt = build_synthesis_prompt({"query": "q", **update})
+    assert "Evidence (most relevant first):\n[vector] Alice" in prompt
+    assert "fusion" in update["timings"]
@@ -0,0 +1,167 @@
+import asyncio
+import time
+
+from src.llm.batching import DynamicBatcher
+from src.llm.prefix_cache import PrefixCache
+from src.utils.text import tokenize
+from src.llm.prompts import (
+    PLANNER_SYSTEM_PROMPT,
+    SYNTHESIS_SYSTEM_PROMPT,
+    planner_prompt,
+    synthesis_prompt,
+)
+from src.llm.serve import MockEngine, VLLMDeployment
+
+# The undecorated class, so the deployment can be exercised without a Ray cluster
+Deployment = VLLMDeployment.func_or_class
+
+
+def test_stream_matches_full_generation():
+    deployment = Deployment()
+
+    async def run():
+        full = await deployment.generate("Explain the Q3 audit findings")
+        tokens = [
+            t async for t in deployment.generate_stream("Explain the Q3 audit findings")
+        ]
+        return full, tokens
+
+    full, tokens = asyncio.run(run())
+    assert len(tokens) > 1
+    assert "".join(tokens) == full
+
+
+def test_concurrent_requests_are_batched():
+    engine = MockEngine(batch_overhead_s=0.01)
+    deployment = Deployment(engine=engine, max_batch_size=8, max_wait_s=0.005)
+    prompts = [f"prompt {i}" for i in range(20)]
+
+    async def run():
+        singles = await asyncio.gather(*(deployment.generate(p) for p in prompts[:10]))
+        many = await deployment.generate_many(prompts[10:])
+        return singles + many
+
+    results = asyncio.run(run())
+    assert results == [MockEngine._completion(p) for p in prompts]
+    stats = deployment.stats()["batching"]
+    assert stats["items"] == 20
+    assert stats["batches"] < 20
+    assert max(deployment.batcher.batch_sizes) <= 8
+
+
+def test_batch_failure_propagates_to_every_caller():
+    async def broken(items):
+        raise RuntimeError("engine crashed")
+
+    batcher = DynamicBatcher(broken, max_batch_size=4, max_wait_s=0.001)
+
+    async def run():
+        return await asyncio.gather(
+            *(batcher.submit(i) for i in range(3)), return_exceptions=True
+        )
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(run()))
+
+
+def test_batch_short_results_or_cancellation_never_leave_callers_hanging():
+    async def short(items):
+        return items[:-1]
+
+    started = asyncio.Event()
+
+    async def slow(items):
+        started.set()
+        await asyncio.sleep(10)
+
+    async def run():
+        batcher = DynamicBatcher(short, max_batch_size=4, max_wait_s=0.001)
+        shorted = await asyncio.wait_for(
+            asyncio.gather(
+                *(batcher.submit(i) for i in range(3)), return_exceptions=True
+            ),
+            1,
+        )
+
+        batcher = DynamicBatcher(slow, max_batch_size=4, max_wait_s=0.001)
+        callers = [asyncio.ensure_future(batcher.submit(i)) for i in range(2)]
+        await started.wait()
+        for task in asyncio.all_tasks():
+            if task.get_coro().__name__ == "_execute":
+                task.cancel()
+        cancelled = await asyncio.wait_for(
+            asyncio.gather(*callers, return_exceptions=True), 1
+        )
+        return shorted, cancelled
+
+    shorted, cancelled = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in shorted)
+    assert all(isinstance(r, asyncio.CancelledError) for r in cancelled)
+
+
+def test_prefix_cache_reuses_only_matching_leading_blocks():
+    cache = PrefixCache(block_size=4, max_blocks=100)
+    shared = "a b c d e f g h"  # two full blocks
+
+    assert cache.lookup_and_insert(shared + " i j k l") == (12, 0)
+    assert cache.lookup_and_insert(shared + " x y z w") == (12, 8)
+    # Same tokens in a block, but after a different prefix: not reusable
+    assert cache.lookup_and_insert("z " + shared) == (9, 0)
+
+    stats = cache.stats()
+    assert stats["requests"] == 3 and stats["hits"] == 1
+    assert stats["cached_tokens"] == 8 and stats["prompt_tokens"] == 33
+
+
+def test_prefix_cache_evicts_least_recently_used_blocks():
+    cache = PrefixCache(block_size=2, max_blocks=2)
+    cache.lookup_and_insert("a b c d")
+    cache.lookup_and_insert("x y")  # evicts the oldest block, ("a", "b")
+
+    assert cache.lookup_and_insert("a b c d")[1] == 0
+    assert cache.stats()["evicted_blocks"] >= 1
+
+
+def test_planner_prompts_share_a_cached_prefix():
+    engine = MockEngine(prefill_s_per_token=0.0005, prefix_cache=PrefixCache())
+    deployment = Deployment(engine=engine, prefix_caching=True)
+    queries = [f"Who manages project {i}?" for i in range(10)]
+
+    async def run():
+        for query in queries:
+            await deployment.generate(planner_prompt(query), PLANNER_SYSTEM_PROMPT)
+
+    asyncio.run(run())
+    prefill = deployment.stats()["prefill"]
+    assert prefill["prefix_cache"]["hit_rate"] == 0.9  # all but the first query
+    # Only the blocks straddling the system prompt and the query are recomputed
+    system_tokens = len(tokenize(PLANNER_SYSTEM_PROMPT))
+    assert prefill["saved_tokens"] >= 9 * (system_tokens - 16)
+
+
+def test_prefix_caching_cuts_simulated_prefill_time():
+    def run(prefix_caching):
+        deployment = Deployment(
+            engine=MockEngine(
+                prefill_s_per_token=0.0002,
+                prefix_cache=PrefixCache() if prefix_caching else None,
+            ),
+            max_batch_size=1,
+        )
+
+        async def requests():
+            start = time.perf_counter()
+            for i in range(10):
+                await deployment.generate(
+                    synthesis_prompt(f"question {i}", "Evidence: short"),
+                    SYNTHESIS_SYSTEM_PROMPT,
+                )
+            return time.perf_counter() - start
+
+        return asyncio.run(requests()), deployment.stats()["prefill"]
+
+    cold_s, cold = run(prefix_caching=False)
+    warm_s, warm = run(prefix_caching=True)
+
+    assert cold["saved_tokens"] == 0 and "prefix_cache" not in cold
+    assert warm["computed_tokens"] < cold["computed_tokens"] / 2
+    assert warm_s < cold_s